@@ -0,0 +1,38 @@
+"""
+Autenticación de los endpoints de administración y depuración
+"""
+
+import hmac
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+import config
+
+
+def is_admin_token(token):
+    """
+    Comprueba un token de administración
+    
+    Args:
+        token (str): Valor recibido en la cabecera X-Admin-Token
+        
+    Returns:
+        bool: True si coincide con ADMIN_TOKEN (siempre False si no está configurado)
+    """
+    if not config.ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode('utf-8'), config.ADMIN_TOKEN.encode('utf-8'))
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """
+    Dependencia de FastAPI para proteger endpoints de administración
+    
+    Raises:
+        HTTPException: 404 si no hay ADMIN_TOKEN configurado, 403 si el token no coincide
+    """
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Endpoints de administración deshabilitados")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
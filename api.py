@@ -3,17 +3,36 @@ API REST con FastAPI para predicción de calidad del aire
 Expone endpoints para obtener predicciones y datos meteorológicos
 """
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date
+import numpy as np
+import orjson
+import pandas as pd
 import uvicorn
 
-from weather_api import WeatherAPI
 from train_model import AirQualityModel
-from predict import AirQualityPredictor
+from predict import AirQualityPredictor, compute_air_quality_index
+from http_cache import ResponseCache, make_etag, etag_matches
+from admin import require_admin
+from profiling import ProfilingMiddleware, profile_thread, profiling_available
+from resilience import Deadline
+from model_serving import ModelWatcher
+from readiness import Readiness, start_warm_up
+from historical_store import STATS, get_store, rows_to_csv
+import backfill
 import config
+import historical_store
+import memory_debug
+import metrics
+import model_registry
+import profiling
+import scenarios
+import stations
 
 
 # Modelos Pydantic para respuestas
@@ -55,13 +74,22 @@ class AirPollution(BaseModel):
 class PredictionResult(BaseModel):
     """Modelo para resultado de predicción"""
     date: str = Field(..., description="Fecha de la predicción")
-    NO2_ugm3: float = Field(..., description="NO₂ predicho (µg/m³)")
-    CO_mgm3: float = Field(..., description="CO predicho (mg/m³)")
-    O3_ugm3: float = Field(..., description="O₃ predicho (µg/m³)")
-    SO2_ugm3: float = Field(..., description="SO₂ predicho (µg/m³)")
-    aerosol_index: float = Field(..., description="Índice de aerosoles predicho")
+    NO2_ugm3: Optional[float] = Field(None, description="NO₂ predicho (µg/m³)")
+    CO_mgm3: Optional[float] = Field(None, description="CO predicho (mg/m³)")
+    O3_ugm3: Optional[float] = Field(None, description="O₃ predicho (µg/m³)")
+    SO2_ugm3: Optional[float] = Field(None, description="SO₂ predicho (µg/m³)")
+    aerosol_index: Optional[float] = Field(None, description="Índice de aerosoles predicho")
     AQI: float = Field(..., description="Índice de Calidad del Aire")
     quality: str = Field(..., description="Clasificación de calidad del aire")
+    AQI_components: List[str] = Field(..., description="Contaminantes con los que se calculó el AQI")
+    climatology_flags: List[str] = Field(
+        default_factory=list,
+        description="Contaminantes fuera del rango histórico para ese día del año (p. ej. 'NO2:high')"
+    )
+    explanations: Optional[Dict[str, Any]] = Field(
+        None,
+        description="Con explain=true: por contaminante, valor base y contribución de cada característica"
+    )
 
 
 class HealthInfo(BaseModel):
@@ -82,6 +110,140 @@ class ApiInfo(BaseModel):
     endpoints: List[str]
 
 
+# Columnas de salida de /predict: (columna del DataFrame, campo de respuesta, factor de conversión)
+PREDICTION_OUTPUT_COLUMNS = [
+    ('NO2', 'NO2_ugm3', 1e6),            # a µg/m³
+    ('CO', 'CO_mgm3', 1e3),              # a mg/m³
+    ('O3', 'O3_ugm3', 1e6),              # a µg/m³
+    ('SO2', 'SO2_ugm3', 1e6),            # a µg/m³
+    ('aerosol_index', 'aerosol_index', 1.0),
+    ('AQI', 'AQI', 1.0),
+]
+
+
+def prediction_columns(predictions_with_aqi):
+    """
+    Convierte las predicciones en columnas listas para serializar
+    
+    Las conversiones de unidades se aplican sobre columnas completas
+    en lugar de fila por fila.
+    
+    Args:
+        predictions_with_aqi (DataFrame): Predicciones con AQI y clasificación
+        
+    Returns:
+        dict: Nombre del campo -> lista de valores
+    """
+    df = predictions_with_aqi
+    n_rows = len(df)
+    columns = {}
+    
+    if 'date' in df.columns:
+        columns['date'] = df['date'].astype(str).tolist()
+    else:
+        columns['date'] = [datetime.now().date().isoformat()] * n_rows
+    
+    for source, field, factor in PREDICTION_OUTPUT_COLUMNS:
+        if source in df.columns:
+            columns[field] = (df[source].to_numpy(dtype=float) * factor).tolist()
+        elif source == 'AQI':
+            columns[field] = [0.0] * n_rows
+        # Los contaminantes no solicitados se omiten
+    
+    if 'Calidad' in df.columns:
+        columns['quality'] = df['Calidad'].tolist()
+    else:
+        columns['quality'] = ["N/A"] * n_rows
+    
+    if 'AQI_components' in df.columns:
+        columns['AQI_components'] = df['AQI_components'].tolist()
+    else:
+        columns['AQI_components'] = [[] for _ in range(n_rows)]
+    
+    if 'climatology_flags' in df.columns:
+        columns['climatology_flags'] = df['climatology_flags'].tolist()
+    else:
+        columns['climatology_flags'] = [[] for _ in range(n_rows)]
+    
+    if 'explanations' in df.columns:
+        columns['explanations'] = df['explanations'].tolist()
+    
+    return columns
+
+
+def explanation_records(explanations):
+    """
+    Contribuciones por fila en las unidades de la respuesta
+    
+    Args:
+        explanations (dict): Salida de AirQualityModel.explain
+        
+    Returns:
+        list: Por fila, {contaminante: {'base': valor, 'contributions': {característica: valor}}}
+    """
+    factors = {source: factor for source, _, factor in PREDICTION_OUTPUT_COLUMNS}
+    n_rows = len(next(iter(explanations.values()))[1]) if explanations else 0
+    records = [{} for _ in range(n_rows)]
+    for pollutant, (bias, contributions) in explanations.items():
+        factor = factors.get(pollutant, 1.0)
+        names = list(contributions.columns)
+        for record, values in zip(records, (contributions.to_numpy() * factor).tolist()):
+            record[pollutant] = {'base': bias * factor, 'contributions': dict(zip(names, values))}
+    return records
+
+
+def parse_pollutants(value, require_model=True):
+    """
+    Valida el parámetro pollutants (lista separada por comas)
+    
+    Args:
+        value (str): Valor del parámetro, p. ej. 'NO2,O3' (sin distinguir mayúsculas)
+        require_model (bool): Exigir que cada contaminante tenga modelo cargable
+        
+    Returns:
+        list: Contaminantes en el orden de TARGET_POLLUTANTS, o None para todos
+        
+    Raises:
+        HTTPException: 400 si algún contaminante no existe o no tiene modelo
+    """
+    if not value:
+        return None
+    
+    known = {pollutant.lower(): pollutant for pollutant in config.TARGET_POLLUTANTS}
+    requested = set()
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if item.lower() not in known:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Contaminante desconocido: '{item}'. Opciones: {', '.join(config.TARGET_POLLUTANTS)}"
+            )
+        requested.add(known[item.lower()])
+    
+    available = predictor.model.available_pollutants if require_model else []
+    unavailable = sorted(requested - set(available)) if available else []
+    if unavailable:
+        raise HTTPException(status_code=400, detail=f"No hay modelo entrenado para: {', '.join(unavailable)}")
+    
+    return [pollutant for pollutant in config.TARGET_POLLUTANTS if pollutant in requested] or None
+
+
+def columns_to_records(columns):
+    """
+    Convierte el formato columnar en una lista de objetos (uno por día)
+    
+    Args:
+        columns (dict): Salida de prediction_columns
+        
+    Returns:
+        list: Lista de diccionarios con la forma de PredictionResult
+    """
+    fields = list(columns.keys())
+    return [dict(zip(fields, values)) for values in zip(*columns.values())]
+
+
 # Crear aplicación FastAPI
 app = FastAPI(
     title="API de Predicción de Calidad del Aire - Huamanga",
@@ -100,21 +262,237 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Instancias globales
-weather_api = WeatherAPI()
+# Perfilado bajo demanda (sin coste si no está habilitado)
+if profiling_available():
+    app.add_middleware(ProfilingMiddleware)
+
+# Instancias globales (la API y el predictor comparten la caché meteorológica)
 predictor = AirQualityPredictor()
+weather_api = predictor.weather_api
+response_cache = ResponseCache()
+model_watcher = ModelWatcher(predictor)
+readiness = Readiness()
 
-# Cargar modelos al inicio
+
+def require_ready():
+    """Dependencia: responde 503 mientras el worker carga y calienta los modelos"""
+    if not readiness.ready:
+        raise HTTPException(
+            status_code=503,
+            detail=f"El servicio se está iniciando ({readiness.phase}). Intenta de nuevo en unos segundos.",
+            headers={"Retry-After": "5"}
+        )
+
+
+def conditional_json_response(request, snapshot_keys, build, *etag_parts, serialize=None, client=None,
+                              snapshot=None):
+    """
+    Construye una respuesta JSON con ETag y Cache-Control
+    
+    El ETag se deriva de la instantánea meteorológica en caché y de las
+    partes indicadas (ruta, parámetros, versión del modelo). Si el cliente
+    envía un If-None-Match coincidente se responde 304 sin recalcular nada,
+    y si otro cliente ya pidió esa misma versión se reutiliza el cuerpo.
+    
+    Si OpenWeatherMap no respondió y se usan los últimos datos válidos, la
+    respuesta lleva `Warning: 110`, `X-Data-Stale: true` y `X-Data-Age`.
+    
+    Args:
+        request (Request): Petición entrante
+        snapshot_keys (tuple): Claves de caché de WeatherAPI usadas por la respuesta
+        build (callable): Función que genera el contenido cuando no hay caché
+        *etag_parts: Partes adicionales que identifican el contenido
+        serialize (callable): Conversión opcional del resultado de build a JSON
+        client (WeatherAPI): Cliente de la estación (default: weather_api)
+        snapshot (str): Identificador leído con WeatherAPI.snapshot junto con
+            los datos que usa `build` (default: el actual de la caché)
+        
+    Returns:
+        Response: Respuesta 200 con el cuerpo o 304 Not Modified
+    """
+    client = client or weather_api
+    
+    def render(headers=None):
+        content = build()
+        with metrics.stage_timer('serialization'):
+            if serialize is not None:
+                content = serialize(content)
+            return ORJSONResponse(content, headers=headers)
+    
+    if snapshot is None:
+        snapshot = client.snapshot_id(*snapshot_keys)
+    if snapshot is None:
+        return render()
+    
+    etag = make_etag(snapshot, *etag_parts)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={client.cache_max_age(*snapshot_keys)}"
+    }
+    
+    stale_age = client.stale_age(*snapshot_keys)
+    if stale_age is not None:
+        headers["Warning"] = '110 - "Response is Stale"'
+        headers["X-Data-Stale"] = "true"
+        headers["X-Data-Age"] = str(stale_age)
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        metrics.inc('response_cache_requests_total', result='not_modified')
+        return Response(status_code=304, headers=headers)
+    
+    body = response_cache.get(etag)
+    if body is not None:
+        metrics.inc('response_cache_requests_total', result='hit')
+        return Response(content=body, media_type="application/json", headers=headers)
+    
+    metrics.inc('response_cache_requests_total', result='miss')
+    response = render(headers)
+    response_cache.put(etag, response.body)
+    return response
+
+
+def climatology_response(days, response_format="records", single=False, pollutants=None, model=None):
+    """
+    Predicción de respaldo a partir de la climatología diaria
+    
+    Se usa cuando no hay datos meteorológicos (ni actuales ni de respaldo):
+    devuelve la media histórica suavizada de cada contaminante para el día
+    del año, marcada con `X-Prediction-Source: climatology`.
+    
+    Args:
+        days (int): Número de días (incluyendo hoy)
+        response_format (str): 'records' o 'columnar'
+        single (bool): Devolver solo el primer registro (/predict/today)
+        pollutants (list): Contaminantes solicitados (default: todos)
+        model (AirQualityModel): Modelos de la estación (default: predictor.model)
+        
+    Returns:
+        Response: Respuesta JSON o None si no hay climatología cargada
+    """
+    model = model or predictor.model
+    climatology = model.climatology
+    if climatology is None:
+        return None
+    
+    metrics.inc('prediction_fallbacks_total', source='climatology')
+    headers = {
+        "X-Prediction-Source": "climatology",
+        "Cache-Control": "no-cache",
+    }
+    
+    # El contenido solo cambia con la fecha: se reutiliza el cuerpo serializado
+    key = make_etag(
+        "climatology", date.today(), days, response_format, single, pollutants, model.model_version, model.station
+    )
+    body = response_cache.get(key)
+    if body is not None:
+        return Response(content=body, media_type="application/json", headers=headers)
+    
+    forecast = climatology.forecast(days)
+    if pollutants:
+        forecast = forecast[['date'] + [p for p in pollutants if p in forecast.columns]]
+    columns = prediction_columns(predictor.get_air_quality_index(forecast))
+    if single:
+        content = columns_to_records(columns)[0]
+    elif response_format == "columnar":
+        content = columns
+    else:
+        content = columns_to_records(columns)
+    
+    response = ORJSONResponse(content, headers=headers)
+    response_cache.put(key, response.body)
+    return response
+
+
+def route_station(station=None, lat=None, lon=None):
+    """
+    Modelos y cliente meteorológico de la estación de una petición
+    
+    Sin parámetros se usa la estación principal. `lat`/`lon` se enrutan a
+    la estación más cercana (a no más de STATION_MAX_DISTANCE_KM). La
+    versión de los modelos queda fijada para toda la petición.
+    
+    Args:
+        station (str): Identificador de estación ('-13.1631_-74.2236')
+        lat (float): Latitud
+        lon (float): Longitud
+    
+    Returns:
+        tuple: (modelos, cliente WeatherAPI, cabeceras X-Station*)
+    
+    Raises:
+        HTTPException: 400 si falta lat o lon o la estación no existe, 404
+            si la estación más cercana está demasiado lejos
+    """
+    model = predictor.model
+    if station is None and lat is None and lon is None:
+        return model, weather_api, {}
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=400, detail="'lat' y 'lon' se indican juntos")
+    
+    index = model.station_index
+    headers = {}
+    if station is None:
+        if index is None:
+            station = stations.station_id(config.LATITUDE, config.LONGITUDE)
+            distance = float(stations.distance_km(lat, lon, [config.LATITUDE], [config.LONGITUDE])[0])
+        else:
+            station, distance = index.nearest(lat, lon)
+        if config.STATION_MAX_DISTANCE_KM and distance > config.STATION_MAX_DISTANCE_KM:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No hay estaciones a menos de {config.STATION_MAX_DISTANCE_KM:g} km "
+                       f"(la más cercana, {station}, está a {distance:.1f} km)"
+            )
+        headers["X-Station-Distance-Km"] = f"{distance:.3f}"
+    headers["X-Station"] = station
+    
+    if index is None:
+        # Versión de una sola estación: la de las coordenadas de config
+        if station != stations.station_id(config.LATITUDE, config.LONGITUDE):
+            raise HTTPException(status_code=400, detail=f"Estación desconocida: {station}")
+        return model, weather_api, headers
+    
+    try:
+        station_model = model.for_station(station)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return station_model, weather_api.at(*station_model.station_coordinates), headers
+
+
+def with_headers(response, headers):
+    """Agrega cabeceras (X-Station*) a una respuesta ya construida"""
+    if response is not None:
+        response.headers.update(headers)
+    return response
+
+
+def on_models_ready():
+    """
+    Tras el primer intento de calentamiento: modo sombra y cambios de versión
+    
+    El vigilante arranca aunque el calentamiento haya fallado: así un
+    `promote` de una versión válida recupera el worker en el siguiente reintento.
+    """
+    if config.LAZY_MODEL_LOADING and readiness.ready:
+        print(f"✅ Modelos disponibles (carga bajo demanda): {', '.join(predictor.model.available_pollutants)}")
+    try:
+        model_watcher.check()
+    except Exception as e:
+        print(f"⚠️ Advertencia: no se pudo comprobar el registro de modelos: {e}")
+    model_watcher.start()
+
+
+# Cargar modelos al inicio (en segundo plano: el puerto queda disponible de inmediato)
 @app.on_event("startup")
 async def startup_event():
-    """Cargar modelos al iniciar la API"""
+    """Iniciar la carga y el calentamiento de los modelos"""
     print("🚀 Iniciando API de Calidad del Aire...")
-    print("📦 Cargando modelos de Machine Learning...")
-    success = predictor.model.load_models()
-    if success:
-        print("✅ Modelos cargados exitosamente")
-    else:
-        print("⚠️ Advertencia: No se pudieron cargar todos los modelos")
+    if config.TRACEMALLOC_AT_STARTUP:
+        memory_debug.start_tracing()
+        print("🧠 tracemalloc activo")
+    print("📦 Cargando modelos de Machine Learning en segundo plano (ver /readyz)...")
+    start_warm_up(predictor, readiness, after_first_attempt=on_models_ready)
     print("🌐 API lista en http://localhost:8000")
     print("📚 Documentación en http://localhost:8000/docs")
 
@@ -140,11 +518,17 @@ async def root():
         "endpoints": [
             "/",
             "/health",
+            "/livez",
+            "/readyz",
+            "/metrics",
             "/weather/current",
             "/weather/forecast",
             "/weather/pollution",
             "/predict",
             "/predict/today",
+            "/stations",
+            "/predictions/history",
+            "/history",
             "/aqi/info"
         ]
     }
@@ -154,50 +538,424 @@ async def root():
 async def health_check():
     """
     Health check - Verificar estado de la API
+    
+    - **starting**: el worker aún carga o calienta los modelos
+    - **healthy**: modelos listos y OpenWeatherMap respondiendo
+    - **degraded**: faltan modelos, el arranque falló o algún circuito de
+      OpenWeatherMap no está cerrado (se sirven datos de respaldo)
     """
-    models_loaded = len(predictor.model.models) > 0
+    model = predictor.model
+    upstream = {name: breaker.snapshot() for name, breaker in weather_api.breakers.items()}
+    api_connected = all(state['state'] == 'closed' for state in upstream.values())
+    models_available = len(model.available_pollutants) > 0
+    
+    if readiness.phase not in (Readiness.READY, Readiness.FAILED):
+        status = "starting"
+    elif readiness.ready and models_available and api_connected:
+        status = "healthy"
+    else:
+        status = "degraded"
+    
     return {
-        "status": "healthy" if models_loaded else "degraded",
+        "status": status,
         "timestamp": datetime.now().isoformat(),
-        "models_loaded": len(predictor.model.models),
-        "api_connected": True
+        "startup": readiness.snapshot(),
+        "model_version": model.model_version,
+        "models_loaded": len(model.models),
+        "models_available": len(model.available_pollutants),
+        "api_connected": api_connected,
+        "upstream": upstream,
+        "weather_data_age_seconds": weather_api.stale_age('current', 'forecast', 'pollution'),
+        "archive_writer": predictor.archive_writer.stats() if config.ARCHIVE_API_PREDICTIONS else None,
     }
 
 
+@app.get("/livez", tags=["General"])
+async def liveness():
+    """
+    Liveness probe - el proceso responde
+    
+    No depende de los modelos ni de OpenWeatherMap: solo un fallo aquí
+    justifica reiniciar el worker.
+    """
+    return {"status": "alive"}
+
+
+@app.get("/readyz", tags=["General"])
+async def readiness_probe():
+    """
+    Readiness probe - el worker puede recibir tráfico
+    
+    Responde 503 hasta que los modelos están cargados, el estado histórico
+    calculado y la predicción de prueba ejecutada. Si el arranque falla se
+    reintenta en segundo plano (`attempts`, `error`).
+    """
+    state = readiness.snapshot()
+    return ORJSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Monitoreo"])
+async def get_metrics():
+    """
+    Métricas en formato Prometheus
+    
+    Incluye histogramas de latencia por etapa (descarga de OpenWeatherMap,
+    carga de modelos, construcción de características, escalado, predicción,
+    AQI y serialización), proporciones de aciertos de caché, errores de
+    OpenWeatherMap y la versión de los modelos de cada worker.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/profiles", tags=["Administración"], dependencies=[Depends(require_admin)])
+async def get_profiles(
+    limit: int = Query(default=20, ge=1, le=200, description="Número máximo de perfiles")
+):
+    """
+    Listar los perfiles de peticiones más recientes
+    
+    Una petición se perfila si `PROFILE_SAMPLE_RATE` > 0 o si envía
+    `X-Profile: 1` junto con `X-Admin-Token`. Requiere `X-Admin-Token`.
+    """
+    return {"profiles": profiling.list_profiles(limit)}
+
+
+@app.get("/debug/profiles/{name}", tags=["Administración"], dependencies=[Depends(require_admin)])
+async def get_profile(
+    name: str,
+    kind: str = Query(default="txt", pattern="^(txt|prof)$", description="'txt' (informe) o 'prof' (pstats)")
+):
+    """
+    Descargar un perfil: informe de texto o archivo pstats (para snakeviz)
+    """
+    path = profiling.profile_path(name, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    
+    if kind == "txt":
+        return FileResponse(path, media_type="text/plain; charset=utf-8")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{name}.prof")
+
+
+def resident_objects():
+    """
+    Objetos que permanecen en memoria en cada worker
+    
+    El histórico solo se mide si ya está cargado (el informe no lo carga).
+    
+    Returns:
+        tuple: (objetos medidos en conjunto, grupos medidos por elemento)
+    """
+    model = predictor.model
+    objects = {
+        "weather_cache": weather_api._cache,
+        "response_cache": response_cache._entries,
+        "historical_store": historical_store._stores,
+        "climatology": model.climatology,
+        "attributions": model._attributions,
+    }
+    groups = {
+        "models": model.models,
+        "scalers": model.scalers,
+        # LRU de modelos de otras estaciones (STATION_MODEL_CACHE)
+        "station_models": model._station_models,
+    }
+    return objects, groups
+
+
+@app.get("/debug/memory", tags=["Administración"], dependencies=[Depends(require_admin)])
+async def get_memory(
+    top: int = Query(default=20, ge=1, le=200, description="Número de puntos de asignación a listar"),
+    diff: bool = Query(default=False, description="Comparar con la instantánea de la llamada anterior"),
+    tracing: Optional[str] = Query(default=None, pattern="^(start|stop)$", description="Iniciar o detener tracemalloc")
+):
+    """
+    Informe de memoria del worker que atiende la petición
+    
+    Retorna RSS y pico de RSS, los principales puntos de asignación de
+    tracemalloc y el tamaño de los objetos residentes (modelos, escaladores,
+    cachés). Con `diff=true` compara con la instantánea de la llamada
+    anterior para localizar fugas. tracemalloc se activa con `TRACEMALLOC=1`
+    o con `tracing=start`.
+    """
+    if tracing == "start":
+        memory_debug.start_tracing()
+    elif tracing == "stop":
+        memory_debug.stop_tracing()
+    
+    objects, groups = resident_objects()
+    return memory_debug.memory_report(objects, groups, top=top, diff=diff)
+
+
+@app.get("/debug/models", tags=["Administración"], dependencies=[Depends(require_admin)])
+async def get_model_versions():
+    """
+    Versiones de modelos registradas y comparación en sombra
+    
+    Retorna las versiones del registro (marcando la de producción y la
+    candidata), la versión cargada en el worker que atiende la petición y,
+    si hay una candidata en sombra, el resumen de sus diferencias con
+    producción (media y máximo del error absoluto y relativo por
+    contaminante, y tiempo medio de predicción de cada versión).
+    """
+    shadow = predictor.shadow
+    return {
+        "loaded": predictor.model.model_version,
+        "current": model_registry.current_version(),
+        "shadow": model_registry.shadow_version(),
+        "versions": model_registry.list_versions(),
+        "shadow_comparison": shadow.summary() if shadow else None,
+    }
+
+
+@app.get("/stations", tags=["Modelos"], dependencies=[Depends(require_ready)])
+async def get_stations(
+    lat: Optional[float] = Query(default=None, ge=-90, le=90, description="Latitud para buscar la estación más cercana"),
+    lon: Optional[float] = Query(default=None, ge=-180, le=180, description="Longitud para buscar la estación más cercana")
+):
+    """
+    Estaciones con modelos en la versión en producción
+    
+    Retorna cada estación (coordenadas, filas del histórico, contaminantes
+    y si sus modelos ya están en memoria en este worker) y la principal.
+    Con `lat`/`lon` agrega la más cercana y su distancia, que es la que
+    usan /predict, /predict/today y /predict/scenarios.
+    """
+    if (lat is None) != (lon is None):
+        raise HTTPException(status_code=400, detail="'lat' y 'lon' se indican juntos")
+    
+    model = predictor.model
+    index = model.station_index
+    if index is None:
+        primary = stations.station_id(config.LATITUDE, config.LONGITUDE)
+        rows = [{
+            "station": primary, "lat": config.LATITUDE, "lon": config.LONGITUDE,
+            "rows": None, "pollutants": model.available_pollutants, "loaded": True,
+        }]
+    else:
+        primary = index.primary
+        loaded = model.loaded_stations()
+        rows = [
+            {
+                "station": station,
+                "lat": info['lat'],
+                "lon": info['lon'],
+                "rows": info['rows'],
+                "pollutants": info['pollutants'],
+                "loaded": station in loaded,
+            }
+            for station, info in index.stations.items()
+        ]
+    
+    content = {"model_version": model.model_version, "primary": primary, "stations": rows}
+    if lat is not None:
+        if index is None:
+            nearest = primary
+            distance = float(stations.distance_km(lat, lon, [config.LATITUDE], [config.LONGITUDE])[0])
+        else:
+            nearest, distance = index.nearest(lat, lon)
+        content["nearest"] = {
+            "station": nearest,
+            "distance_km": round(distance, 3),
+            "within_limit": not config.STATION_MAX_DISTANCE_KM or distance <= config.STATION_MAX_DISTANCE_KM,
+        }
+    return ORJSONResponse(content)
+
+
+@app.get("/models/skill", tags=["Modelos"], dependencies=[Depends(require_ready)])
+async def get_model_skill(
+    group: Optional[str] = Query(
+        default=None, pattern="^(overall|month|season)$",
+        description="Solo una agrupación: 'overall', 'month' o 'season' (DEF, MAM, JJA, SON)"
+    ),
+    subset: str = Query(
+        default="all", pattern="^(all|out_of_sample)$",
+        description="'all' o 'out_of_sample' (filas que el modelo no vio al entrenar)"
+    ),
+    pollutants: Optional[str] = Query(
+        default=None,
+        description="Contaminantes separados por comas (p. ej. 'NO2,O3'); por defecto todos"
+    )
+):
+    """
+    Desempeño de los modelos en producción sobre todo el histórico
+    
+    Compara las predicciones de cada día del CSV histórico con lo
+    observado (MAE, RMSE, sesgo, R² y skill frente a la climatología) por
+    mes y por estación. El reporte se calcula una vez por versión de
+    modelos y datos (`python backfill.py` lo genera de antemano) y se
+    sirve desde caché.
+    
+    Si el CSV cambió desde el último reporte (ingest.py) se responde con
+    ese reporte y `stale: true` mientras se recalcula en segundo plano.
+    Solo la primera consulta de una versión sin reporte espera al
+    cálculo, fuera del event loop.
+    """
+    selected = parse_pollutants(pollutants)
+    model = predictor.model
+    report, stale = backfill.latest_report(model)
+    if report is None:
+        report = await run_in_threadpool(profile_thread(backfill.get_report), model)
+    rows = [
+        row for row in report['report'][subset]
+        if (group is None or row['group'] == group) and (selected is None or row['pollutant'] in selected)
+    ]
+    return ORJSONResponse({
+        "model_version": model.model_version,
+        "generated_at": report['generated_at'],
+        "stale": stale,
+        "subset": subset,
+        "splits": report['splits'],
+        "rows": rows,
+    })
+
+
+# Sin async: FastAPI lo ejecuta en el pool de hilos (OpenWeatherMap y malla del modelo)
+@app.get("/models/{pollutant}/sensitivity", tags=["Modelos"], dependencies=[Depends(require_ready)])
+@profile_thread
+def get_model_sensitivity(
+    request: Request,
+    pollutant: str,
+    features: str = Query(..., description="Una o dos variables meteorológicas separadas por comas (p. ej. 'wind_u,temperature')"),
+    points: int = Query(default=25, ge=2, le=100, description="Puntos de la malla por variable"),
+    ranges: Optional[str] = Query(
+        default=None,
+        description="Rango por variable 'min:max' separados por comas (default: percentiles 1-99 del histórico)"
+    ),
+    day: int = Query(default=0, ge=0, le=6, description="Día del pronóstico que se mantiene fijo (0 = condiciones actuales)")
+):
+    """
+    Curva o superficie de respuesta de un modelo (dependencia parcial)
+    
+    Recorre una o dos variables meteorológicas en una malla mientras las
+    demás se mantienen en los valores del pronóstico del día indicado, y
+    evalúa la malla completa en una sola llamada al modelo. Con una
+    variable `values` es una lista; con dos, una matriz (filas = primera
+    variable, columnas = segunda). Las unidades de entrada son las del
+    dataset y las de salida las de /predict.
+    
+    La respuesta se guarda por versión de modelos, instantánea
+    meteorológica y parámetros, y soporta `If-None-Match`.
+    """
+    selected = parse_pollutants(pollutant)
+    if not selected or len(selected) != 1:
+        raise HTTPException(status_code=400, detail="Indica un único contaminante")
+    target = selected[0]
+    
+    names = [name.strip() for name in features.split(',') if name.strip()]
+    unknown = [name for name in names if name not in config.WEATHER_FEATURES]
+    if unknown or not 1 <= len(names) <= 2 or len(set(names)) != len(names):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Indica una o dos variables distintas entre: {', '.join(config.WEATHER_FEATURES)}"
+        )
+    
+    store = get_store()
+    limits = [store.value_range(name) for name in names]
+    if ranges:
+        try:
+            limits = [tuple(float(v) for v in item.split(':')) for item in ranges.split(',')]
+        except ValueError:
+            limits = []
+        if len(limits) != len(names) or any(len(item) != 2 or not item[0] < item[1] for item in limits):
+            raise HTTPException(status_code=400, detail="'ranges' debe tener un 'min:max' (min < max) por variable")
+    axes = {name: np.linspace(low, high, points) for name, (low, high) in zip(names, limits)}
+    
+    deadline = Deadline()
+    current = weather_api.get_current_weather(deadline)
+    forecast = weather_api.get_forecast(7, deadline) if day > 0 else []
+    if not current or day > len(forecast or []):
+        raise HTTPException(status_code=503, detail="No hay datos meteorológicos para ese día")
+    # La malla parte de la misma instantánea de la que sale el ETag
+    snapshot_keys = ('current',) if day == 0 else ('current', 'forecast')
+    snapshot, cached = weather_api.snapshot(*snapshot_keys)
+    base_row = cached[0] if day == 0 else cached[1][day - 1]
+    model = predictor.model
+    
+    def build():
+        pollutants = model.ensure_loaded([target])
+        weather = scenarios.grid_inputs(base_row, axes)
+        n = len(weather[names[0]])
+        base_date = base_row.get('date', base_row.get('timestamp'))
+        dates = np.full(n + 1, np.datetime64(base_date, 'D'))
+        # La fila base va al final de la misma matriz (una sola llamada al modelo)
+        for name in config.WEATHER_FEATURES:
+            weather[name] = np.append(weather[name], base_row[name])
+        X = model.prepare_feature_matrix(weather, dates)
+        predicted = model.predict_matrix(X, pollutants)[target]
+        return base_date, predicted
+    
+    def serialize(result):
+        base_date, predicted = result
+        field, factor = next((f, factor) for source, f, factor in PREDICTION_OUTPUT_COLUMNS if source == target)
+        values = predicted[:-1] * factor
+        return {
+            "pollutant": target,
+            "field": field,
+            "model_version": model.model_version,
+            "date": str(np.datetime64(base_date, 'D')),
+            "features": names,
+            "grid": {name: values_axis.tolist() for name, values_axis in axes.items()},
+            "base": {name: float(base_row[name]) for name in config.WEATHER_FEATURES},
+            "base_prediction": float(predicted[-1] * factor),
+            "values": values.reshape([points] * len(names)).tolist(),
+        }
+    
+    return conditional_json_response(
+        request, snapshot_keys, build,
+        "sensitivity", target, names, points, limits, day, model.model_version, store.generation,
+        serialize=serialize, snapshot=snapshot
+    )
+
+
+# Los handlers que llaman a OpenWeatherMap son síncronos: el reintento con
+# espera (time.sleep) de WeatherAPI corre en el pool de hilos de FastAPI
+# (profile_thread los perfila en ese hilo)
 @app.get("/weather/current", response_model=WeatherData, tags=["OpenWeatherMap"])
-async def get_current_weather():
+@profile_thread
+def get_current_weather(request: Request):
     """
     Obtener datos meteorológicos actuales de OpenWeatherMap
     
     Retorna temperatura, presión, viento, precipitación, etc.
+    Soporta peticiones condicionales con `If-None-Match`.
     """
     try:
-        data = weather_api.get_current_weather()
+        data = weather_api.get_current_weather(Deadline())
         if not data:
             raise HTTPException(status_code=503, detail="No se pudieron obtener datos meteorológicos")
+        # El ETag y el cuerpo salen de la misma instantánea
+        snapshot, (data,) = weather_api.snapshot('current')
         
-        import math
-        wind_speed = math.sqrt(data['wind_u']**2 + data['wind_v']**2)
+        def build():
+            import math
+            wind_speed = math.sqrt(data['wind_u']**2 + data['wind_v']**2)
+            
+            return {
+                "temperature_celsius": data['temperature'] - 273.15,
+                "temperature_kelvin": data['temperature'],
+                "dewpoint_celsius": data['dewpoint'] - 273.15,
+                "dewpoint_kelvin": data['dewpoint'],
+                "pressure_hpa": data['pressure'] / 100,
+                "pressure_pa": data['pressure'],
+                "wind_u": data['wind_u'],
+                "wind_v": data['wind_v'],
+                "wind_speed": wind_speed,
+                "precipitation_mm": data['precipitation'] * 1000,
+                "timestamp": data['timestamp'].isoformat()
+            }
         
-        return {
-            "temperature_celsius": data['temperature'] - 273.15,
-            "temperature_kelvin": data['temperature'],
-            "dewpoint_celsius": data['dewpoint'] - 273.15,
-            "dewpoint_kelvin": data['dewpoint'],
-            "pressure_hpa": data['pressure'] / 100,
-            "pressure_pa": data['pressure'],
-            "wind_u": data['wind_u'],
-            "wind_v": data['wind_v'],
-            "wind_speed": wind_speed,
-            "precipitation_mm": data['precipitation'] * 1000,
-            "timestamp": data['timestamp'].isoformat()
-        }
+        return conditional_json_response(request, ('current',), build, "weather/current", snapshot=snapshot)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos meteorológicos: {str(e)}")
 
 
 @app.get("/weather/forecast", response_model=List[ForecastDay], tags=["OpenWeatherMap"])
-async def get_weather_forecast(
+@profile_thread
+def get_weather_forecast(
+    request: Request,
     days: int = Query(default=7, ge=1, le=7, description="Número de días de pronóstico (1-7)")
 ):
     """
@@ -206,55 +964,87 @@ async def get_weather_forecast(
     - **days**: Número de días de pronóstico (1-7)
     """
     try:
-        forecast = weather_api.get_forecast(days)
+        forecast = weather_api.get_forecast(days, Deadline())
         if not forecast:
             raise HTTPException(status_code=503, detail="No se pudo obtener el pronóstico")
+        # El ETag y el cuerpo salen de la misma instantánea
+        snapshot, (forecast,) = weather_api.snapshot('forecast')
         
-        import math
-        result = []
-        for day in forecast:
-            wind_speed = math.sqrt(day['wind_u']**2 + day['wind_v']**2)
-            result.append({
-                "date": str(day['date']),
-                "temperature_celsius": day['temperature'] - 273.15,
-                "dewpoint_celsius": day['dewpoint'] - 273.15,
-                "pressure_hpa": day['pressure'] / 100,
-                "wind_speed": wind_speed,
-                "precipitation_mm": day['precipitation'] * 1000
-            })
+        def build():
+            import math
+            result = []
+            for day in forecast[:days]:
+                wind_speed = math.sqrt(day['wind_u']**2 + day['wind_v']**2)
+                result.append({
+                    "date": str(day['date']),
+                    "temperature_celsius": day['temperature'] - 273.15,
+                    "dewpoint_celsius": day['dewpoint'] - 273.15,
+                    "pressure_hpa": day['pressure'] / 100,
+                    "wind_speed": wind_speed,
+                    "precipitation_mm": day['precipitation'] * 1000
+                })
+            return result
         
-        return result
+        return conditional_json_response(
+            request, ('forecast',), build, "weather/forecast", days, snapshot=snapshot
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener pronóstico: {str(e)}")
 
 
 @app.get("/weather/pollution", response_model=AirPollution, tags=["OpenWeatherMap"])
-async def get_air_pollution():
+@profile_thread
+def get_air_pollution(request: Request):
     """
     Obtener datos actuales de contaminación del aire de OpenWeatherMap
     
     Retorna niveles de NO₂, CO, O₃, SO₂, PM2.5 y PM10
     """
     try:
-        pollution = weather_api.get_air_pollution()
+        pollution = weather_api.get_air_pollution(Deadline())
         if not pollution:
             raise HTTPException(status_code=503, detail="No se pudieron obtener datos de contaminación")
+        # El ETag y el cuerpo salen de la misma instantánea
+        snapshot, (pollution,) = weather_api.snapshot('pollution')
         
-        return {
-            "NO2": pollution['NO2'] * 1e6,  # Convertir a µg/m³
-            "CO": pollution['CO'] * 1e3,     # Convertir a mg/m³
-            "O3": pollution['O3'] * 1e6,     # Convertir a µg/m³
-            "SO2": pollution['SO2'] * 1e6,   # Convertir a µg/m³
-            "pm2_5": pollution['pm2_5'],
-            "pm10": pollution['pm10']
-        }
+        def build():
+            return {
+                "NO2": pollution['NO2'] * 1e6,  # Convertir a µg/m³
+                "CO": pollution['CO'] * 1e3,     # Convertir a mg/m³
+                "O3": pollution['O3'] * 1e6,     # Convertir a µg/m³
+                "SO2": pollution['SO2'] * 1e6,   # Convertir a µg/m³
+                "pm2_5": pollution['pm2_5'],
+                "pm10": pollution['pm10']
+            }
+        
+        return conditional_json_response(request, ('pollution',), build, "weather/pollution", snapshot=snapshot)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al obtener datos de contaminación: {str(e)}")
 
 
-@app.get("/predict", response_model=List[PredictionResult], tags=["Predicción"])
-async def predict_air_quality(
-    days: int = Query(default=7, ge=1, le=7, description="Número de días a predecir (1-7)")
+@app.get("/predict", response_model=List[PredictionResult], tags=["Predicción"], dependencies=[Depends(require_ready)])
+@profile_thread
+def predict_air_quality(
+    request: Request,
+    days: int = Query(default=7, ge=1, le=7, description="Número de días a predecir (1-7)"),
+    response_format: str = Query(
+        default="records",
+        alias="format",
+        pattern="^(records|columnar)$",
+        description="Formato de respuesta: 'records' (lista de objetos) o 'columnar' (un arreglo por campo)"
+    ),
+    pollutants: Optional[str] = Query(
+        default=None,
+        description="Contaminantes separados por comas (p. ej. 'NO2,O3'); por defecto todos"
+    ),
+    explain: bool = Query(default=False, description="Incluir la contribución de cada característica"),
+    station: Optional[str] = Query(default=None, description="Estación (ver /stations); por defecto la principal"),
+    lat: Optional[float] = Query(default=None, ge=-90, le=90, description="Latitud: se usa la estación más cercana"),
+    lon: Optional[float] = Query(default=None, ge=-180, le=180, description="Longitud: se usa la estación más cercana")
 ):
     """
     Predecir la calidad del aire para los próximos días
@@ -263,37 +1053,85 @@ async def predict_air_quality(
     y pronósticos meteorológicos de OpenWeatherMap.
     
     - **days**: Número de días a predecir incluyendo hoy (1-7)
+    - **format**: `records` (por defecto) o `columnar` para clientes por lotes
+    - **pollutants**: Subconjunto de contaminantes a predecir (solo se cargan
+      y evalúan esos modelos; el AQI se calcula con ellos y lo indica en `AQI_components`)
+    - **explain**: Agrega `explanations` a cada día: por contaminante, el
+      valor base y la contribución de cada característica (atribución por
+      caminos en los árboles; base + contribuciones = predicción antes de
+      recortar en 0), en las mismas unidades que la predicción
+    - **station** o **lat**/**lon**: estación a predecir (ver /stations);
+      con coordenadas se usa la más cercana (`X-Station`, `X-Station-Distance-Km`)
     
     Retorna predicciones de contaminantes y AQI para cada día.
+    Soporta peticiones condicionales con `If-None-Match`. Sin datos
+    meteorológicos responde con la climatología diaria
+    (`X-Prediction-Source: climatology`).
     """
     try:
-        # Hacer predicción
-        predictions = predictor.predict_current_and_forecast(days)
+        selected = parse_pollutants(pollutants)
+        
+        # Fijar la versión de los modelos (y la estación) durante toda la petición
+        model, client, station_headers = route_station(station, lat, lon)
         
-        if predictions is None:
+        # Un único plazo para todas las llamadas a OpenWeatherMap de la petición
+        deadline = Deadline()
+        
+        # Asegurar que la instantánea meteorológica esté en caché
+        current = client.get_current_weather(deadline)
+        forecast = client.get_forecast(days, deadline) if current else None
+        if not current or not forecast:
+            fallback = climatology_response(days, response_format, pollutants=selected, model=model)
+            if fallback is not None:
+                return with_headers(fallback, station_headers)
             raise HTTPException(
                 status_code=503,
-                detail="No se pudieron generar predicciones. Verifica que los modelos estén entrenados."
+                detail="No se pudieron generar predicciones. No hay datos meteorológicos disponibles."
             )
+        # El ETag y la predicción salen de la misma instantánea
+        snapshot, (current, forecast) = client.snapshot('current', 'forecast')
+        weather_rows = [current] + forecast[:days]
         
-        # Agregar AQI
-        predictions_with_aqi = predictor.get_air_quality_index(predictions)
+        def build():
+            # Hacer predicción
+            predictions = predictor.predict_current_and_forecast(
+                days, deadline, selected, model, client, weather_rows=weather_rows
+            )
+            
+            if predictions is None:
+                raise HTTPException(
+                    status_code=503,
+                    detail="No se pudieron generar predicciones. Verifica que los modelos estén entrenados."
+                )
+            
+            # Agregar AQI
+            predictions_with_aqi = predictor.get_air_quality_index(predictions)
+            if config.ARCHIVE_API_PREDICTIONS:
+                # Solo se archivan las predicciones calculadas (no las servidas desde caché)
+                predictor.save_predictions(predictions_with_aqi, source='api', model=model)
+            if explain:
+                # Las mismas filas de la instantánea (sin volver a consultar la caché,
+                # que podría haber expirado y quedarse sin datos)
+                predictions_with_aqi = predictions_with_aqi.copy()
+                predictions_with_aqi['explanations'] = explanation_records(
+                    model.explain(weather_rows[:len(predictions_with_aqi)], selected)
+                )
+            return predictions_with_aqi
         
-        # Formatear respuesta
-        result = []
-        for _, row in predictions_with_aqi.iterrows():
-            result.append({
-                "date": str(row['date']) if 'date' in row else datetime.now().date().isoformat(),
-                "NO2_ugm3": row['NO2'] * 1e6 if 'NO2' in row else 0,
-                "CO_mgm3": row['CO'] * 1e3 if 'CO' in row else 0,
-                "O3_ugm3": row['O3'] * 1e6 if 'O3' in row else 0,
-                "SO2_ugm3": row['SO2'] * 1e6 if 'SO2' in row else 0,
-                "aerosol_index": row['aerosol_index'] if 'aerosol_index' in row else 0,
-                "AQI": row['AQI'] if 'AQI' in row else 0,
-                "quality": row['Calidad'] if 'Calidad' in row else "N/A"
-            })
+        def serialize(predictions_with_aqi):
+            # Formatear respuesta (columnas completas, sin revalidar con Pydantic)
+            columns = prediction_columns(predictions_with_aqi)
+            if response_format == "columnar":
+                return columns
+            
+            return columns_to_records(columns)
         
-        return result
+        return with_headers(conditional_json_response(
+            request, ('current', 'forecast'), build,
+            "predict", days, response_format, selected, explain, model.model_version, model.station,
+            get_store().generation,
+            serialize=serialize, client=client, snapshot=snapshot
+        ), station_headers)
         
     except HTTPException:
         raise
@@ -301,35 +1139,64 @@ async def predict_air_quality(
         raise HTTPException(status_code=500, detail=f"Error al generar predicciones: {str(e)}")
 
 
-@app.get("/predict/today", response_model=PredictionResult, tags=["Predicción"])
-async def predict_today():
+@app.get("/predict/today", response_model=PredictionResult, tags=["Predicción"], dependencies=[Depends(require_ready)])
+@profile_thread
+def predict_today(
+    request: Request,
+    pollutants: Optional[str] = Query(
+        default=None,
+        description="Contaminantes separados por comas (p. ej. 'NO2,O3'); por defecto todos"
+    ),
+    station: Optional[str] = Query(default=None, description="Estación (ver /stations); por defecto la principal"),
+    lat: Optional[float] = Query(default=None, ge=-90, le=90, description="Latitud: se usa la estación más cercana"),
+    lon: Optional[float] = Query(default=None, ge=-180, le=180, description="Longitud: se usa la estación más cercana")
+):
     """
     Predecir la calidad del aire solo para el día de hoy
     
-    Retorna predicción de contaminantes y AQI para hoy.
+    Retorna predicción de contaminantes y AQI para hoy, para la estación
+    principal o la indicada con `station` o `lat`/`lon` (como /predict).
+    Soporta peticiones condicionales con `If-None-Match`.
     """
     try:
-        predictions = predictor.predict_current_and_forecast(1)
-        
-        if predictions is None or predictions.empty:
+        selected = parse_pollutants(pollutants)
+        model, client, station_headers = route_station(station, lat, lon)
+        deadline = Deadline()
+        if not client.get_current_weather(deadline) or not client.get_forecast(1, deadline):
+            fallback = climatology_response(1, single=True, pollutants=selected, model=model)
+            if fallback is not None:
+                return with_headers(fallback, station_headers)
             raise HTTPException(
                 status_code=503,
                 detail="No se pudo generar predicción para hoy"
             )
+        snapshot, (current, forecast) = client.snapshot('current', 'forecast')
+        weather_rows = [current] + forecast[:1]
         
-        predictions_with_aqi = predictor.get_air_quality_index(predictions)
-        row = predictions_with_aqi.iloc[0]
+        def build():
+            predictions = predictor.predict_current_and_forecast(
+                1, deadline, selected, model, client, weather_rows=weather_rows
+            )
+            
+            if predictions is None or predictions.empty:
+                raise HTTPException(
+                    status_code=503,
+                    detail="No se pudo generar predicción para hoy"
+                )
+            
+            predictions_with_aqi = predictor.get_air_quality_index(predictions.iloc[:1])
+            if config.ARCHIVE_API_PREDICTIONS:
+                predictor.save_predictions(predictions_with_aqi, source='api', model=model)
+            return predictions_with_aqi
         
-        return {
-            "date": str(row['date']) if 'date' in row else datetime.now().date().isoformat(),
-            "NO2_ugm3": row['NO2'] * 1e6 if 'NO2' in row else 0,
-            "CO_mgm3": row['CO'] * 1e3 if 'CO' in row else 0,
-            "O3_ugm3": row['O3'] * 1e6 if 'O3' in row else 0,
-            "SO2_ugm3": row['SO2'] * 1e6 if 'SO2' in row else 0,
-            "aerosol_index": row['aerosol_index'] if 'aerosol_index' in row else 0,
-            "AQI": row['AQI'] if 'AQI' in row else 0,
-            "quality": row['Calidad'] if 'Calidad' in row else "N/A"
-        }
+        def serialize(predictions_with_aqi):
+            return columns_to_records(prediction_columns(predictions_with_aqi))[0]
+        
+        return with_headers(conditional_json_response(
+            request, ('current', 'forecast'), build,
+            "predict/today", selected, model.model_version, model.station, get_store().generation,
+            serialize=serialize, client=client, snapshot=snapshot
+        ), station_headers)
         
     except HTTPException:
         raise
@@ -337,6 +1204,232 @@ async def predict_today():
         raise HTTPException(status_code=500, detail=f"Error al generar predicción: {str(e)}")
 
 
+@app.post("/predict/scenarios", tags=["Predicción"], dependencies=[Depends(require_ready)])
+async def predict_scenarios(request: Request):
+    """
+    Predecir escenarios hipotéticos ("¿qué pasa si...?")
+    
+    El cuerpo JSON trae las variables meteorológicas como arreglos (una
+    posición por escenario, unidades del dataset: K, Pa, m/s, m); un número
+    se aplica a todos los escenarios.
+    
+    - **inputs**: valores absolutos de las seis variables, con `date` o
+      `dates` (default: hoy)
+    - **deltas** / **overrides**: sumas o valores fijos sobre el pronóstico
+      actual; cada escenario cubre los `days` días desde hoy (default: 7)
+    - **pollutants**: subconjunto de contaminantes (lista o 'NO2,O3')
+    - **station** o **lat**/**lon**: estación (como en /predict)
+    
+    Todas las filas se evalúan en una sola llamada por modelo. Retorna
+    un arreglo por campo (`scenario`, `day`, `date`, contaminantes, `AQI`,
+    `quality`), con los contaminantes en las mismas unidades que /predict.
+    """
+    try:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="El cuerpo debe ser JSON")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="El cuerpo debe ser un objeto JSON")
+    
+    # Hasta SCENARIO_MAX_ROWS filas: se evalúan fuera del bucle de eventos
+    return await run_in_threadpool(scenario_response, body)
+
+
+@profile_thread
+def scenario_response(body):
+    """
+    Evalúa el cuerpo ya decodificado de /predict/scenarios
+    
+    Es bloqueante (pronóstico de OpenWeatherMap y modelos sobre todas las
+    filas), por eso el handler lo ejecuta en el pool de hilos.
+    
+    Args:
+        body (dict): Cuerpo JSON de la petición
+        
+    Returns:
+        ORJSONResponse: Arreglos por campo de todos los escenarios
+    """
+    requested = body.get('pollutants')
+    if requested is not None and not isinstance(requested, (str, list)):
+        raise HTTPException(status_code=400, detail="'pollutants' debe ser una lista o un texto 'NO2,O3'")
+    selected = parse_pollutants(','.join(map(str, requested)) if isinstance(requested, list) else requested)
+    coordinates = [body.get(name) for name in ('lat', 'lon')]
+    if any(value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))) for value in coordinates):
+        raise HTTPException(status_code=400, detail="'lat' y 'lon' deben ser números")
+    station = body.get('station')
+    if station is not None and not isinstance(station, str):
+        raise HTTPException(status_code=400, detail="'station' debe ser un texto")
+    model, client, station_headers = route_station(station, *coordinates)
+    
+    try:
+        if 'inputs' in body:
+            weather, dates, scenario, day = scenarios.from_inputs(body)
+        else:
+            days = body.get('days', 7)
+            if isinstance(days, bool) or not isinstance(days, int) or not 1 <= days <= 7:
+                raise scenarios.ScenarioError("'days' debe ser un entero entre 1 y 7")
+            deadline = Deadline()
+            current = client.get_current_weather(deadline)
+            forecast = client.get_forecast(days, deadline)
+            if not current or not forecast:
+                raise HTTPException(status_code=503, detail="No hay pronóstico disponible para aplicar los cambios")
+            weather, dates, scenario, day = scenarios.from_forecast(body, ([current] + forecast)[:days])
+    except scenarios.ScenarioTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except scenarios.ScenarioError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    pollutants = model.ensure_loaded(selected)
+    X = model.prepare_feature_matrix(weather, dates)
+    predictions = pd.DataFrame(model.predict_matrix(X, pollutants))
+    predictions_with_aqi = compute_air_quality_index(predictions)
+    metrics.inc('scenario_rows_total', len(X))
+    
+    columns = {
+        "scenario": scenario.tolist(),
+        "day": day.tolist(),
+        "date": np.datetime_as_string(dates, unit='D').tolist(),
+    }
+    for source, field, factor in PREDICTION_OUTPUT_COLUMNS:
+        if source in predictions_with_aqi.columns:
+            columns[field] = (predictions_with_aqi[source].to_numpy(dtype=float) * factor).tolist()
+    columns["quality"] = predictions_with_aqi['Calidad'].tolist()
+    
+    return ORJSONResponse({
+        "model_version": model.model_version,
+        "scenarios": int(scenario.max()) + 1,
+        "rows": len(X),
+        "AQI_components": pollutants,
+        "columns": columns,
+    }, headers=station_headers)
+
+
+@app.get("/predictions/history", tags=["Predicción"])
+async def predictions_history(
+    issued_from: Optional[date] = Query(default=None, description="Fecha de emisión inicial (YYYY-MM-DD)"),
+    issued_to: Optional[date] = Query(default=None, description="Fecha de emisión final (inclusive)"),
+    target_from: Optional[date] = Query(default=None, description="Fecha objetivo inicial (YYYY-MM-DD)"),
+    target_to: Optional[date] = Query(default=None, description="Fecha objetivo final (inclusive)"),
+    pollutants: Optional[str] = Query(
+        default=None,
+        description="Contaminantes separados por comas (p. ej. 'NO2,O3'); por defecto todos"
+    ),
+    limit: int = Query(default=1000, ge=1, le=100000, description="Número máximo de filas"),
+    station: Optional[str] = Query(default=None, description="Solo las predicciones de esa estación (ver /stations)")
+):
+    """
+    Consultar predicciones archivadas
+    
+    Devuelve una fila por ejecución y fecha objetivo (`issued_at`,
+    `target_date`, `lead_days`, versión y estación de los modelos,
+    contaminantes, AQI)
+    en formato JSON por línea (`application/x-ndjson`). La respuesta se
+    genera a medida que se leen los row groups seleccionados por el índice,
+    sin cargar el archivo completo.
+    """
+    selected = parse_pollutants(pollutants, require_model=False)
+    rows = predictor.archive.query(issued_from, issued_to, target_from, target_to, selected, limit, station)
+    
+    def stream():
+        for row in rows:
+            yield orjson.dumps(row) + b"\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+# Síncrono: la carga o recarga del histórico y la agregación corren en el
+# pool de hilos, no en el bucle de eventos (los iteradores de streaming
+# también los recorre Starlette en el pool)
+@app.get("/history", tags=["Datos históricos"])
+@profile_thread
+def get_history(
+    start: Optional[date] = Query(default=None, description="Fecha inicial (YYYY-MM-DD, inclusive)"),
+    end: Optional[date] = Query(default=None, description="Fecha final (YYYY-MM-DD, inclusive)"),
+    columns: Optional[str] = Query(
+        default=None,
+        description="Columnas separadas por comas (p. ej. 'NO2,temperature'); por defecto todas"
+    ),
+    aggregate: Optional[str] = Query(
+        default=None, pattern="^(week|month)$", description="Agregar por 'week' (semana desde el lunes) o 'month'"
+    ),
+    stats: str = Query(default="mean,min,max", description="Estadísticos de la agregación: mean, min, max"),
+    response_format: str = Query(
+        default="json", alias="format", pattern="^(json|csv|ndjson)$",
+        description="'json' (paginado), 'csv' o 'ndjson' (en streaming)"
+    ),
+    offset: int = Query(default=0, ge=0, description="Filas a omitir"),
+    limit: Optional[int] = Query(
+        default=None, ge=1, le=100000,
+        description="Máximo de filas (json: 1000 por defecto; csv/ndjson: todas)"
+    )
+):
+    """
+    Observaciones históricas 2020-2025 usadas para entrenar los modelos
+    
+    Los datos se mantienen en memoria en arreglos por columna ordenados
+    por fecha; el rango se localiza por búsqueda binaria y las filas se
+    generan por bloques, sin construir la tabla completa por petición.
+    
+    - **format=json**: una página (`offset`/`limit`) con `next_offset`
+    - **format=csv|ndjson**: respuesta en streaming
+    - **aggregate**: estadísticos semanales o mensuales (ignorando vacíos)
+    """
+    store = get_store()
+    try:
+        selected = store.resolve_columns([c.strip() for c in columns.split(',') if c.strip()] if columns else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    requested_stats = tuple(s.strip() for s in stats.split(',') if s.strip())
+    if aggregate and (not requested_stats or any(s not in STATS for s in requested_stats)):
+        raise HTTPException(status_code=400, detail=f"Estadísticos válidos: {', '.join(STATS)}")
+    
+    lo, hi = store.range_indices(start, end)
+    
+    if aggregate:
+        rows = store.aggregate(lo, hi, selected, aggregate, requested_stats)
+        fieldnames = list(rows[0]) if rows else ['period_start']
+        total = len(rows)
+        page_size = limit or (1000 if response_format == "json" else total)
+        page = rows[offset:offset + page_size]
+        chunks = [page] if page else []
+    else:
+        fieldnames = ['date'] + selected
+        total = hi - lo
+        page_size = limit or (1000 if response_format == "json" else total)
+        first = min(hi, lo + offset)
+        chunks = store.iter_rows(first, min(hi, first + page_size), selected)
+    
+    if response_format == "json":
+        rows = [row for chunk in chunks for row in chunk]
+        next_offset = offset + len(rows)
+        return ORJSONResponse({
+            "start": store.dates[lo].astype(date).isoformat() if hi > lo else None,
+            "end": store.dates[hi - 1].astype(date).isoformat() if hi > lo else None,
+            "aggregate": aggregate,
+            "columns": fieldnames,
+            "total": total,
+            "offset": offset,
+            "next_offset": next_offset if next_offset < total else None,
+            "rows": rows,
+        })
+    
+    if response_format == "csv":
+        def stream():
+            yield rows_to_csv([], fieldnames, header=True)
+            for chunk in chunks:
+                yield rows_to_csv(chunk, fieldnames)
+        return StreamingResponse(stream(), media_type="text/csv; charset=utf-8", headers={
+            "Content-Disposition": 'attachment; filename="huamanga_history.csv"'
+        })
+    
+    def stream_ndjson():
+        for chunk in chunks:
+            yield b"".join(orjson.dumps(row) + b"\n" for row in chunk)
+    
+    return StreamingResponse(stream_ndjson(), media_type="application/x-ndjson")
+
+
 @app.get("/aqi/info", response_model=Dict[str, Any], tags=["Información"])
 async def get_aqi_info(
     aqi: float = Query(..., ge=0, le=500, description="Valor del AQI (0-500)")
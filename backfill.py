@@ -0,0 +1,391 @@
+"""
+Reproceso del histórico completo y reporte de desempeño de los modelos
+
+Calcula las características de todos los días del CSV histórico en una
+sola pasada vectorizada (add_time_features), predice con los cinco
+modelos en bloque (una llamada por modelo) y compara con los valores
+observados. El reporte resume el desempeño por mes y por estación, para
+todas las filas y solo para las que el modelo no vio al entrenar.
+
+El resultado se guarda en BACKFILL_PATH por versión de modelos
+(backfill_<versión>.parquet con las filas diarias y skill_<versión>.json
+con el reporte) y se reutiliza mientras no cambien ni los modelos ni el
+CSV, de modo que /models/skill responde sin recalcular.
+
+Uso:
+    python backfill.py                  # calcula (o reutiliza) y muestra el resumen
+    python backfill.py --refresh        # recalcula aunque exista el reporte
+    python backfill.py --version <versión>
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+import config
+import model_registry
+from stations import assign_stations
+from train_model import AirQualityModel, add_time_features
+
+
+# Estaciones del hemisferio sur por mes (DEF coincide con la temporada de lluvias)
+SEASONS = {
+    12: 'DEF', 1: 'DEF', 2: 'DEF',
+    3: 'MAM', 4: 'MAM', 5: 'MAM',
+    6: 'JJA', 7: 'JJA', 8: 'JJA',
+    9: 'SON', 10: 'SON', 11: 'SON',
+}
+
+# Agrupaciones y subconjuntos del reporte
+GROUPS = ('overall', 'month', 'season')
+SUBSETS = ('all', 'out_of_sample')
+
+
+def training_split(model_version, pollutant, n_rows, station=None):
+    """
+    Reproduce qué filas usó el entrenamiento como prueba
+    
+    train_models divide las filas válidas de cada contaminante con
+    train_test_split (RANDOM_STATE); la permutación solo depende del número
+    de filas, que se toma del manifest de la versión. Las filas agregadas
+    al CSV después de entrenar se marcan como 'new'.
+    
+    Args:
+        model_version (str): Versión del registro (None = modelos planos)
+        pollutant (str): Contaminante
+        n_rows (int): Filas válidas actuales del contaminante
+        station (str): Estación que no es la principal (sus resultados
+            están en station_results del manifest)
+    
+    Returns:
+        ndarray: 'train', 'test' o 'new' por fila
+    """
+    manifest = model_registry.read_manifest(model_version) if model_version else None
+    results = (manifest or {}).get('results', {})
+    if station is not None and station != (manifest or {}).get('primary_station'):
+        results = manifest.get('station_results', {}).get(station, {})
+    result = results.get(pollutant)
+    n_trained = result['n_train'] + result['n_test'] if result else n_rows
+    n_trained = min(n_trained, n_rows)
+    
+    split = np.full(n_rows, 'new', dtype=object)
+    if n_trained > 1:
+        _, test = train_test_split(
+            np.arange(n_trained),
+            test_size=config.TEST_SIZE,
+            random_state=config.RANDOM_STATE,
+            shuffle=True
+        )
+        split[:n_trained] = 'train'
+        split[test] = 'test'
+    return split
+
+
+def backfill(model, path=None):
+    """
+    Predice todos los días del histórico y los une con lo observado
+    
+    Args:
+        model (AirQualityModel): Modelos cargados
+        path (str): CSV histórico (default: config.DATA_PATH)
+    
+    Returns:
+        DataFrame: Una fila por día y contaminante con observed, predicted,
+            climatology (media del día del año) y split
+    """
+    df = pd.read_csv(path or config.DATA_PATH)
+    df['date'] = pd.to_datetime(df['date'])
+    if model.station_index is not None:
+        # Versión con varias estaciones: solo las filas de la estación de los modelos
+        df = assign_stations(df)
+        df = df[df['station'] == model.station]
+    df = add_time_features(df.sort_values('date', kind='stable').reset_index(drop=True))
+    
+    X = df.reindex(columns=model.feature_columns)
+    valid = X.notna().all(axis=1).to_numpy()
+    pollutants = model.ensure_loaded()
+    predicted = model.predict_matrix(X[valid], pollutants)
+    
+    frames = []
+    for pollutant in pollutants:
+        observed = df.loc[valid, pollutant].to_numpy(dtype=float)
+        rows = ~np.isnan(observed)
+        frame = pd.DataFrame({
+            'date': df.loc[valid, 'date'].to_numpy()[rows],
+            'pollutant': pollutant,
+            'observed': observed[rows],
+            'predicted': predicted[pollutant][rows],
+        })
+        if model.climatology is not None and pollutant in model.climatology.table:
+            frame['climatology'] = model.climatology.stat(pollutant, 'mean', frame['date'].dt.dayofyear.to_numpy())
+        else:
+            frame['climatology'] = np.nan
+        frame['split'] = training_split(model.registry_version, pollutant, len(frame), model.station)
+        frames.append(frame)
+    
+    result = pd.concat(frames, ignore_index=True)
+    result['month'] = result['date'].dt.month
+    result['season'] = result['month'].map(SEASONS)
+    return result
+
+
+def skill_rows(frame, group):
+    """
+    Métricas de desempeño por contaminante y grupo
+    
+    Args:
+        frame (DataFrame): Filas de backfill()
+        group (str): 'overall', 'month' o 'season'
+    
+    Returns:
+        list: Filas con n, mae, rmse, bias, r2 y skill (1 - MSE del modelo /
+            MSE de la climatología; > 0 significa mejor que la climatología)
+    """
+    keys = ['pollutant'] if group == 'overall' else ['pollutant', group]
+    error = frame['predicted'] - frame['observed']
+    work = pd.DataFrame({
+        **{key: frame[key] for key in keys},
+        'abs_error': error.abs(),
+        'sq_error': error ** 2,
+        'error': error,
+        'clim_sq_error': (frame['climatology'] - frame['observed']) ** 2,
+        'sq_dev': (frame['observed'] - frame.groupby(keys)['observed'].transform('mean')) ** 2,
+    })
+    sums = work.groupby(keys).agg(
+        n=('error', 'size'),
+        mae=('abs_error', 'mean'),
+        mse=('sq_error', 'mean'),
+        bias=('error', 'mean'),
+        sse=('sq_error', 'sum'),
+        sst=('sq_dev', 'sum'),
+        clim_sse=('clim_sq_error', 'sum'),
+    ).reset_index()
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = 1 - sums['sse'] / sums['sst']
+        skill = 1 - sums['sse'] / sums['clim_sse']
+    
+    rows = []
+    for i, row in sums.iterrows():
+        rows.append({
+            'pollutant': row['pollutant'],
+            'group': group,
+            'key': None if group == 'overall' else (int(row[group]) if group == 'month' else row[group]),
+            'n': int(row['n']),
+            'mae': float(row['mae']),
+            'rmse': float(np.sqrt(row['mse'])),
+            'bias': float(row['bias']),
+            'r2': float(r2[i]) if np.isfinite(r2[i]) else None,
+            'skill': float(skill[i]) if np.isfinite(skill[i]) else None,
+        })
+    return rows
+
+
+def skill_report(frame):
+    """
+    Reporte completo (todas las agrupaciones y subconjuntos)
+    
+    Args:
+        frame (DataFrame): Filas de backfill()
+    
+    Returns:
+        dict: {'all': [...], 'out_of_sample': [...]} con las filas de skill_rows
+    """
+    subsets = {
+        'all': frame,
+        'out_of_sample': frame[frame['split'] != 'train'],
+    }
+    return {
+        name: [row for group in GROUPS for row in skill_rows(subset, group)]
+        for name, subset in subsets.items()
+    }
+
+
+def _cache_key(model, path):
+    stat = os.stat(path)
+    return {
+        'model_version': model.model_version,
+        'data_path': path,
+        'data_size': stat.st_size,
+        'data_mtime_ns': stat.st_mtime_ns,
+    }
+
+
+def _report_path(model_version, kind):
+    extension = 'parquet' if kind == 'backfill' else 'json'
+    return os.path.join(config.BACKFILL_PATH, f'{kind}_{model_version}.{extension}')
+
+
+# Último reporte por versión de modelos (para la API)
+_reports = {}
+_reports_lock = threading.Lock()
+# Un cálculo a la vez por versión (fuera de _reports_lock, que solo protege
+# la caché) y versiones que se están recalculando en segundo plano
+_compute_locks = {}
+_refreshing = set()
+
+
+def _cached_report(model_version, key, report_path, accept_stale=False):
+    """
+    Reporte en memoria o en disco (llamar con _reports_lock)
+    
+    Args:
+        accept_stale (bool): Devolver el último aunque el CSV haya cambiado
+    
+    Returns:
+        dict: Reporte o None
+    """
+    cached = _reports.get(model_version)
+    if (cached is None or cached['key'] != key) and os.path.exists(report_path):
+        with open(report_path, encoding='utf-8') as f:
+            on_disk = json.load(f)
+        if cached is None or on_disk.get('key') == key:
+            cached = _reports[model_version] = on_disk
+    if cached is not None and (accept_stale or cached.get('key') == key):
+        return cached
+    return None
+
+
+def _compute_report(model, path, key, report_path):
+    """Ejecuta el backfill y guarda las filas y el reporte en disco"""
+    started = time.perf_counter()
+    frame = backfill(model, path)
+    report = {
+        'key': key,
+        'generated_at': datetime.now().isoformat(),
+        'rows': len(frame),
+        'splits': frame['split'].value_counts().to_dict(),
+        'report': skill_report(frame),
+    }
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    
+    os.makedirs(config.BACKFILL_PATH, exist_ok=True)
+    frame.to_parquet(_report_path(model.model_version, 'backfill'), index=False)
+    tmp_path = f'{report_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, report_path)
+    return report
+
+
+def get_report(model, path=None, refresh=False):
+    """
+    Reporte de desempeño de una versión de modelos
+    
+    Se reutiliza el de memoria o el de disco mientras coincidan la versión
+    y el CSV (tamaño y fecha de modificación); si no, se recalcula y se
+    guarda. El cálculo no bloquea las consultas de otras versiones ni
+    latest_report.
+    
+    Args:
+        model (AirQualityModel): Modelos cargados
+        path (str): CSV histórico (default: config.DATA_PATH)
+        refresh (bool): Recalcular aunque haya un reporte vigente
+    
+    Returns:
+        dict: key, generated_at, seconds, rows, splits y report
+    """
+    path = path or config.DATA_PATH
+    key = _cache_key(model, path)
+    report_path = _report_path(model.model_version, 'skill')
+    
+    with _reports_lock:
+        if not refresh:
+            cached = _cached_report(model.model_version, key, report_path)
+            if cached is not None:
+                return cached
+        compute_lock = _compute_locks.setdefault(model.model_version, threading.Lock())
+    
+    with compute_lock:
+        if not refresh:
+            # Otro hilo pudo terminarlo mientras se esperaba
+            with _reports_lock:
+                cached = _cached_report(model.model_version, key, report_path)
+            if cached is not None:
+                return cached
+        
+        report = _compute_report(model, path, key, report_path)
+        with _reports_lock:
+            _reports[model.model_version] = report
+        return report
+
+
+def _refresh_in_background(model, path):
+    try:
+        get_report(model, path)
+    except Exception as e:
+        print(f"Advertencia: no se pudo recalcular el reporte de desempeño: {e}")
+    finally:
+        with _reports_lock:
+            _refreshing.discard(model.model_version)
+
+
+def latest_report(model, path=None):
+    """
+    Último reporte de una versión sin esperar a recalcularlo
+    
+    Si el CSV cambió desde el último reporte (p. ej. tras ingest.py) se
+    devuelve ese reporte marcado como desactualizado y se recalcula en un
+    hilo de fondo; las consultas siguientes reciben el nuevo en cuanto
+    termina.
+    
+    Args:
+        model (AirQualityModel): Modelos cargados
+        path (str): CSV histórico (default: config.DATA_PATH)
+    
+    Returns:
+        tuple: (reporte o None si la versión aún no tiene ninguno, stale)
+    """
+    path = path or config.DATA_PATH
+    key = _cache_key(model, path)
+    report_path = _report_path(model.model_version, 'skill')
+    
+    with _reports_lock:
+        cached = _cached_report(model.model_version, key, report_path, accept_stale=True)
+        if cached is not None and cached['key'] == key:
+            return cached, False
+        start = cached is not None and model.model_version not in _refreshing
+        if start:
+            _refreshing.add(model.model_version)
+    
+    if start:
+        threading.Thread(target=_refresh_in_background, args=(model, path), daemon=True).start()
+    return cached, cached is not None
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Reproceso del histórico y reporte de desempeño")
+    parser.add_argument('--version', default=None, help="Versión del registro de modelos (default: la de producción)")
+    parser.add_argument('--refresh', action='store_true', help="Recalcular aunque exista el reporte")
+    args = parser.parse_args()
+    
+    model = AirQualityModel()
+    if not model.load_models(version=args.version, lazy=False):
+        print("❌ No hay modelos entrenados (python train_model.py)")
+        return 1
+    
+    report = get_report(model, refresh=args.refresh)
+    print(f"\n=== DESEMPEÑO {model.model_version} ({report['rows']} filas, {report['seconds']} s) ===")
+    print(f"Filas por partición: {report['splits']}")
+    for subset in SUBSETS:
+        print(f"\n{subset}:")
+        for row in report['report'][subset]:
+            if row['group'] == 'overall':
+                r2 = f"{row['r2']:.3f}" if row['r2'] is not None else '-'
+                skill = f"{row['skill']:.3f}" if row['skill'] is not None else '-'
+                print(f"  {row['pollutant']:<14} n={row['n']:<5} MAE={row['mae']:.6g}  RMSE={row['rmse']:.6g}  R²={r2}  skill={skill}")
+    print(f"\nReporte: {_report_path(model.model_version, 'skill')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+Predicción por lotes sin conexión (reprocesos y escenarios)
+
+Lee filas meteorológicas de un CSV o Parquet por bloques, construye las
+características igual que el entrenamiento (add_time_features) y las
+evalúa en un pool de procesos. Los resultados (contaminantes, AQI y
+marcas climatológicas) se escriben en orden a medida que terminan, con
+un número acotado de bloques en memoria, de modo que se pueden procesar
+archivos de millones de filas.
+
+El archivo de entrada debe tener la columna 'date' y las variables de
+WEATHER_FEATURES, en unidades del dataset y ordenado por fecha. Los
+promedios móviles de 7 y 30 días se calculan sobre las filas del propio
+archivo (--rows-per-day 24 para datos horarios); cada bloque recibe las
+últimas filas del anterior para que los bordes no cambien el resultado.
+
+Uso:
+    python batch_predict.py clima_2020_2025.csv predicciones.parquet
+    python batch_predict.py escenario.parquet salida.csv --rows-per-day 24 --workers 4
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import config
+from predict import compute_air_quality_index
+from train_model import AirQualityModel, add_time_features
+
+
+# Modelo cargado en cada proceso del pool
+_model = None
+
+
+def _init_worker(version, pollutants):
+    """Carga los modelos una vez por proceso"""
+    global _model
+    _model = AirQualityModel()
+    if not _model.load_models(pollutants, lazy=False, version=version):
+        raise RuntimeError("No hay modelos entrenados (python train_model.py)")
+
+
+def score_chunk(frame, context_rows, pollutants, rows_per_day, keep_columns):
+    """
+    Predice un bloque de filas
+    
+    Args:
+        frame (DataFrame): Filas del bloque precedidas por context_rows
+            filas del bloque anterior (solo para los promedios móviles)
+        context_rows (int): Filas de contexto al inicio de frame
+        pollutants (list): Contaminantes (default: todos los disponibles)
+        rows_per_day (int): Filas por día
+        keep_columns (list): Columnas de entrada a copiar en la salida
+    
+    Returns:
+        DataFrame: date, columnas conservadas, contaminantes, AQI, Calidad
+            y climatology_flags. Las filas con variables faltantes quedan
+            sin predicción.
+    """
+    pollutants = _model.ensure_loaded(pollutants)
+    frame = add_time_features(frame, rows_per_day=rows_per_day).iloc[context_rows:]
+    
+    X = frame.reindex(columns=_model.feature_columns)
+    valid = X.notna().all(axis=1).to_numpy()
+    
+    result = frame[['date'] + keep_columns].reset_index(drop=True)
+    for pollutant in pollutants:
+        result[pollutant] = np.nan
+    if valid.any():
+        for pollutant, values in _model.predict_matrix(X[valid], pollutants).items():
+            result.loc[valid, pollutant] = values
+    
+    result = compute_air_quality_index(result)
+    result['AQI_components'] = ','.join(pollutants)
+    result.loc[~valid, 'Calidad'] = None
+    
+    if _model.climatology is not None:
+        flags = _model.climatology.sanity_flags(result)
+        result['climatology_flags'] = [
+            ','.join(f"{pollutant}:{direction}" for pollutant, direction in row_flags) for row_flags in flags
+        ]
+    return result
+
+
+def read_chunks(path, columns, chunk_size):
+    """
+    Bloques del archivo de entrada
+    
+    Args:
+        path (str): CSV o Parquet
+        columns (list): Columnas a leer
+        chunk_size (int): Filas por bloque
+    
+    Yields:
+        DataFrame: Bloque con 'date' como datetime
+    """
+    if path.endswith('.parquet'):
+        parquet = pq.ParquetFile(path)
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+            chunk = batch.to_pandas()
+            chunk['date'] = pd.to_datetime(chunk['date'])
+            yield chunk
+    else:
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+            chunk['date'] = pd.to_datetime(chunk['date'])
+            yield chunk
+
+
+def input_columns(path):
+    """Nombres de las columnas del archivo de entrada"""
+    if path.endswith('.parquet'):
+        return pq.read_schema(path).names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+class OutputWriter:
+    """Escribe los bloques en CSV o Parquet (archivo temporal + rename al cerrar)"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f'{path}.tmp'
+        self.parquet = path.endswith('.parquet')
+        self.rows = 0
+        self._writer = None
+        self._file = None
+    
+    def write(self, df):
+        if self.parquet:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(
+                    self.tmp_path, table.schema, compression=config.PREDICTIONS_ARCHIVE_COMPRESSION
+                )
+            self._writer.write_table(table.cast(self._writer.schema))
+        else:
+            if self._file is None:
+                self._file = open(self.tmp_path, 'w', newline='')
+            df.to_csv(self._file, header=self.rows == 0, index=False)
+        self.rows += len(df)
+    
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.path)
+    
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def run_batch(input_path, output_path, chunk_size=100_000, workers=None, pollutants=None,
+              rows_per_day=1, version=None, keep_columns=None):
+    """
+    Predice todas las filas del archivo de entrada
+    
+    Args:
+        input_path (str): CSV o Parquet con 'date' y WEATHER_FEATURES
+        output_path (str): Salida (.parquet o CSV)
+        chunk_size (int): Filas por bloque
+        workers (int): Procesos (default: CPUs disponibles; 1 = sin pool)
+        pollutants (list): Contaminantes (default: todos los disponibles)
+        rows_per_day (int): Filas por día (escala las ventanas de 7 y 30 días)
+        version (str): Versión del registro de modelos (default: la de producción)
+        keep_columns (list): Columnas de entrada a copiar en la salida
+    
+    Returns:
+        int: Filas escritas
+    
+    Raises:
+        ValueError: Si faltan columnas en el archivo de entrada o una
+            columna conservada coincide con una de la salida
+    """
+    workers = workers or os.cpu_count() or 1
+    keep_columns = keep_columns or []
+    available = input_columns(input_path)
+    missing = [name for name in ['date'] + config.WEATHER_FEATURES + keep_columns if name not in available]
+    if missing:
+        raise ValueError(f"Faltan columnas en {input_path}: {', '.join(missing)}")
+    reserved = [name for name in keep_columns if name in config.TARGET_POLLUTANTS + ['date', 'AQI', 'AQI_components', 'Calidad', 'climatology_flags']]
+    if reserved:
+        raise ValueError(f"Columnas reservadas para la salida: {', '.join(reserved)}")
+    columns = list(dict.fromkeys(['date'] + config.WEATHER_FEATURES + keep_columns))
+    
+    # Filas del bloque anterior que necesita el promedio de 30 días
+    context_size = 30 * rows_per_day - 1
+    # Bloques en vuelo: acota la memoria aunque la escritura sea más lenta que el cálculo
+    max_pending = 2 * workers
+    
+    output = OutputWriter(output_path)
+    started = time.perf_counter()
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(version, pollutants))
+    else:
+        _init_worker(version, pollutants)
+    
+    def write(result):
+        output.write(result)
+        elapsed = time.perf_counter() - started
+        print(f"   {output.rows:,} filas ({output.rows / elapsed:,.0f} filas/s)")
+    
+    try:
+        pending = deque()
+        context = None
+        for chunk in read_chunks(input_path, columns, chunk_size):
+            frame = chunk if context is None else pd.concat([context, chunk], ignore_index=True)
+            context_rows = 0 if context is None else len(context)
+            context = frame.iloc[-context_size:] if context_size else frame.iloc[0:0]
+            args = (frame, context_rows, pollutants, rows_per_day, keep_columns)
+            
+            if pool is None:
+                write(score_chunk(*args))
+                continue
+            pending.append(pool.submit(score_chunk, *args))
+            while len(pending) >= max_pending:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+    except BaseException:
+        output.abort()
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    
+    output.close()
+    return output.rows
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Predicción por lotes desde un archivo de datos meteorológicos")
+    parser.add_argument('input', help="CSV o Parquet con 'date' y las variables meteorológicas")
+    parser.add_argument('output', help="Archivo de salida (.parquet o .csv)")
+    parser.add_argument('--chunk-size', type=int, default=100_000, help="Filas por bloque")
+    parser.add_argument('--workers', type=int, default=None, help="Procesos (default: CPUs disponibles)")
+    parser.add_argument('--pollutants', default=None, help="Contaminantes separados por comas")
+    parser.add_argument('--rows-per-day', type=int, default=1, help="Filas por día (24 para datos horarios)")
+    parser.add_argument('--version', default=None, help="Versión del registro de modelos")
+    parser.add_argument('--keep-columns', default=None, help="Columnas de entrada a copiar en la salida")
+    args = parser.parse_args()
+    
+    pollutants = args.pollutants.split(',') if args.pollutants else None
+    keep_columns = args.keep_columns.split(',') if args.keep_columns else None
+    
+    print(f"📦 Predicción por lotes: {args.input} -> {args.output}")
+    try:
+        rows = run_batch(args.input, args.output, args.chunk_size, args.workers, pollutants,
+                         args.rows_per_day, args.version, keep_columns)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ {rows:,} filas escritas en {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,381 @@
+"""
+Benchmarks reproducibles del pipeline de predicción
+
+Se ejecutan sin red: las respuestas de OpenWeatherMap se leen de
+benchmarks/fixtures/openweathermap/. Los resultados se guardan en JSON y
+se comparan con benchmarks/baseline.json; si algún caso es más lento que
+la línea base más allá de la tolerancia, el script termina con código 1.
+
+Para tolerar el ruido de la máquina, los casos se miden en varias rondas
+intercaladas (--rounds) y cada caso guarda la mediana de las medianas y
+el mejor tiempo; un caso solo es regresión si ambos superan la tolerancia.
+
+Uso:
+    python benchmarks/bench_pipeline.py                  # ejecutar y comparar
+    python benchmarks/bench_pipeline.py --quick          # sin 10k filas ni entrenamiento
+    python benchmarks/bench_pipeline.py --save-baseline  # actualizar la línea base
+    python benchmarks/bench_pipeline.py --rounds 5       # más rondas en máquinas ruidosas
+    python benchmarks/bench_pipeline.py --only predict   # filtrar casos por nombre
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+import config
+from weather_api import WeatherAPI
+from train_model import AirQualityModel
+from predict import AirQualityPredictor
+
+
+FIXTURES_PATH = os.path.join(ROOT, 'benchmarks', 'fixtures', 'openweathermap')
+BASELINE_PATH = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+RESULTS_PATH = os.path.join(ROOT, 'benchmarks', 'results', 'latest.json')
+
+
+def load_fixture(name):
+    """
+    Carga una respuesta grabada de OpenWeatherMap
+    
+    Args:
+        name (str): 'weather', 'forecast' o 'air_pollution'
+    
+    Returns:
+        dict: Respuesta JSON
+    """
+    with open(os.path.join(FIXTURES_PATH, f'{name}.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def measure(func, repeat=5, number=1, warmup=1):
+    """
+    Mide el tiempo por llamada de una función
+    
+    Args:
+        func (callable): Función sin argumentos
+        repeat (int): Número de mediciones
+        number (int): Llamadas por medición
+        warmup (int): Llamadas previas descartadas
+    
+    Returns:
+        dict: Estadísticas en segundos por llamada
+    """
+    for _ in range(warmup):
+        func()
+    
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    
+    return {
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'mean_s': statistics.fmean(timings),
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+def weather_rows(api, n_rows):
+    """
+    Genera n filas meteorológicas a partir de las respuestas grabadas
+    
+    Args:
+        api (WeatherAPI): Instancia usada para convertir las respuestas
+        n_rows (int): Número de filas
+    
+    Returns:
+        list: Diccionarios en el formato de WeatherAPI
+    """
+    current = api.parse_current_weather(load_fixture('weather'))
+    forecast = api.parse_forecast(load_fixture('forecast'))
+    template = [current] + forecast
+    start = forecast[0]['date']
+    
+    rows = []
+    for i in range(n_rows):
+        row = {key: value for key, value in template[i % len(template)].items() if key != 'timestamp'}
+        row['date'] = start + timedelta(days=i)
+        rows.append(row)
+    return rows
+
+
+def build_cases(quick=False):
+    """
+    Define los casos del benchmark
+    
+    Args:
+        quick (bool): Omitir los casos más costosos
+    
+    Returns:
+        list: Tuplas (nombre, función de preparación) donde la preparación
+            devuelve (función a medir, repeat, number)
+    """
+    api = WeatherAPI()
+    weather_fixture = load_fixture('weather')
+    forecast_fixture = load_fixture('forecast')
+    pollution_fixture = load_fixture('air_pollution')
+    
+    def parse_current():
+        return lambda: api.parse_current_weather(weather_fixture), 5, 2000
+    
+    def parse_forecast():
+        return lambda: api.parse_forecast(forecast_fixture), 5, 200
+    
+    def parse_air_pollution():
+        return lambda: api.parse_air_pollution(pollution_fixture), 5, 5000
+    
+    def prepare_features():
+        model = AirQualityModel()
+        historical = pd.read_csv(config.DATA_PATH)
+        historical['date'] = pd.to_datetime(historical['date'])
+        row = weather_rows(api, 1)[0]
+        return lambda: model.prepare_weather_features(row, historical), 5, 50
+    
+    def load_models():
+        return lambda: AirQualityModel().load_models(), 5, 1
+    
+    def predict(n_rows, repeat):
+        def setup():
+            model = AirQualityModel()
+            model.load_models()
+            rows = weather_rows(api, n_rows)
+            return lambda: model.predict(rows), repeat, 1
+        return setup
+    
+    def aqi(n_rows):
+        def setup():
+            predictor = AirQualityPredictor()
+            predictor.model.load_models()
+            predictions = predictor.model.predict(weather_rows(api, 40))
+            tiled = pd.concat([predictions] * (n_rows // len(predictions) + 1), ignore_index=True)
+            tiled = tiled.iloc[:n_rows]
+            return lambda: predictor.get_air_quality_index(tiled), 5, 1 if n_rows > 100 else 20
+        return setup
+    
+    def climatology_forecast():
+        model = AirQualityModel()
+        model.load_models()
+        return lambda: model.climatology.forecast(7), 5, 200
+    
+    def train():
+        original_path = config.MODEL_PATH
+        
+        def run():
+            # Los modelos entrenados se escriben en un directorio temporal
+            config.MODEL_PATH = tempfile.mkdtemp(prefix='bench_models_')
+            try:
+                AirQualityModel().train_models()
+            finally:
+                shutil.rmtree(config.MODEL_PATH, ignore_errors=True)
+                config.MODEL_PATH = original_path
+        
+        return run, 1, 1
+    
+    cases = [
+        ('weather_parse_current', parse_current),
+        ('weather_parse_forecast', parse_forecast),
+        ('weather_parse_air_pollution', parse_air_pollution),
+        ('prepare_weather_features', prepare_features),
+        ('load_models', load_models),
+        ('model_predict_1', predict(1, 5)),
+        ('model_predict_7', predict(7, 5)),
+        ('model_predict_40', predict(40, 3)),
+        ('air_quality_index_7', aqi(7)),
+        ('air_quality_index_10000', aqi(10000)),
+        ('climatology_forecast_7', climatology_forecast),
+    ]
+    if not quick:
+        cases.extend([
+            ('model_predict_10000', predict(10000, 1)),
+            ('train_models', train),
+        ])
+    return cases
+
+
+def environment_info():
+    """Información del entorno para interpretar los resultados"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'scikit-learn': sklearn.__version__,
+    }
+
+
+# Casos costosos: una sola ronda, sin calentamiento
+SINGLE_ROUND_CASES = ('train_models', 'model_predict_10000')
+
+
+def combine_rounds(rounds):
+    """
+    Combina las mediciones de varias rondas de un caso
+    
+    Returns:
+        dict: Mediana de las medianas, mejor tiempo y media de las rondas
+    """
+    return {
+        'median_s': statistics.median(r['median_s'] for r in rounds),
+        'min_s': min(r['min_s'] for r in rounds),
+        'mean_s': statistics.fmean(r['mean_s'] for r in rounds),
+        'repeat': rounds[0]['repeat'],
+        'number': rounds[0]['number'],
+        'rounds': len(rounds),
+    }
+
+
+def run_benchmarks(quick=False, only=None, rounds=3):
+    """
+    Ejecuta los casos seleccionados
+    
+    Las rondas se intercalan (todos los casos, luego otra vez todos) para
+    que un periodo de carga de la máquina no afecte solo a un caso.
+    
+    Args:
+        quick (bool): Omitir los casos más costosos
+        only (str): Subcadena para filtrar casos por nombre
+        rounds (int): Rondas de medición por caso
+    
+    Returns:
+        dict: Resultados con metadatos del entorno
+    """
+    prepared = []
+    # Las funciones del proyecto imprimen su progreso: se descarta
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, setup in build_cases(quick):
+            if not only or only in name:
+                prepared.append((name, setup()))
+    
+    measurements = {name: [] for name, _ in prepared}
+    for round_number in range(rounds):
+        for name, (func, repeat, number) in prepared:
+            if name in SINGLE_ROUND_CASES and round_number > 0:
+                continue
+            warmup = 0 if name in SINGLE_ROUND_CASES else 1
+            with contextlib.redirect_stdout(io.StringIO()):
+                measurements[name].append(measure(func, repeat=repeat, number=number, warmup=warmup))
+    
+    results = {}
+    for name, _ in prepared:
+        results[name] = combine_rounds(measurements[name])
+        print(f"  {name:<32}{results[name]['median_s'] * 1000:12.3f} ms")
+    
+    return {'environment': environment_info(), 'results': results}
+
+
+def compare_with_baseline(current, baseline, tolerance):
+    """
+    Compara los resultados con la línea base
+    
+    Un caso es regresión solo si la mediana y el mejor tiempo superan la
+    tolerancia (un pico de carga de la máquina sube la mediana, no el mejor).
+    
+    Args:
+        current (dict): Resultados actuales
+        baseline (dict): Resultados de la línea base
+        tolerance (float): Aumento relativo permitido (0.25 = 25 %)
+    
+    Returns:
+        list: Nombres de los casos con regresión
+    """
+    regressions = []
+    print(f"\n{'caso':<32}{'base (ms)':>12}{'actual (ms)':>14}{'ratio':>9}")
+    print('-' * 67)
+    for name, result in current['results'].items():
+        reference = baseline['results'].get(name)
+        if reference is None:
+            print(f"{name:<32}{'-':>12}{result['median_s'] * 1000:14.3f}{'nuevo':>9}")
+            continue
+        
+        ratio = result['median_s'] / reference['median_s'] if reference['median_s'] else float('inf')
+        best_ratio = result['min_s'] / reference['min_s'] if reference['min_s'] else float('inf')
+        flag = ''
+        if min(ratio, best_ratio) > 1 + tolerance:
+            regressions.append(name)
+            flag = '  ❌ REGRESIÓN'
+        elif ratio < 1 - tolerance:
+            flag = '  ✅ mejora'
+        print(f"{name:<32}{reference['median_s'] * 1000:12.3f}{result['median_s'] * 1000:14.3f}{ratio:9.2f}{flag}")
+    
+    return regressions
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline de predicción")
+    parser.add_argument('--quick', action='store_true', help="Omitir 10k filas y entrenamiento")
+    parser.add_argument('--only', help="Ejecutar solo los casos que contengan este texto")
+    parser.add_argument('--rounds', type=int, default=3, help="Rondas de medición por caso (default: 3)")
+    parser.add_argument('--output', default=RESULTS_PATH, help="Archivo JSON de resultados")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Archivo JSON de la línea base")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Aumento relativo permitido antes de fallar (default: 0.25)")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="Guardar los resultados como nueva línea base")
+    args = parser.parse_args()
+    
+    print("=== BENCHMARKS DEL PIPELINE DE PREDICCIÓN ===\n")
+    current = run_benchmarks(quick=args.quick, only=args.only, rounds=args.rounds)
+    
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(current, f, indent=2)
+    print(f"\n📁 Resultados guardados en: {args.output}")
+    
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"📁 Línea base actualizada: {args.baseline}")
+        return 0
+    
+    if not os.path.exists(args.baseline):
+        print("⚠️ No hay línea base; ejecuta con --save-baseline para crearla")
+        return 0
+    
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    
+    regressions = compare_with_baseline(current, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ Regresiones de rendimiento (> {args.tolerance:.0%}): {', '.join(regressions)}")
+        return 1
+    
+    print("\n✅ Sin regresiones respecto a la línea base")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+Validación de FLOAT32_SERVING: deriva de las predicciones y ganancias
+
+Carga la misma versión de modelos dos veces, en float64 y en float32, y
+compara:
+
+- deriva por contaminante sobre el histórico completo (máxima diferencia
+  absoluta y relativa al MAE del modelo, filas con algún cambio) y en las
+  contribuciones de explain=true
+- memoria máxima (tracemalloc) y filas/s de la predicción por lotes
+  (matriz del histórico repetida, como batch_predict) y de una malla de
+  dos variables (prepare_feature_matrix, como /predict/scenarios y
+  /models/{pollutant}/sensitivity)
+
+Los árboles de sklearn comparan siempre en float32; la diferencia entre
+ambos modos está en las características, el escalado y las tablas de
+atribución.
+
+Uso:
+    python benchmarks/float32_report.py
+    python benchmarks/float32_report.py --batch-rows 500000 --grid-points 300
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+import numpy as np
+import pandas as pd
+
+import config
+import scenarios
+from attribution import PathAttribution
+from train_model import AirQualityModel, add_time_features
+
+
+RESULTS_PATH = os.path.join(ROOT, 'benchmarks', 'results', 'float32.json')
+
+# Variables de la malla (las de mayor y menor escala del dataset)
+GRID_FEATURES = ('pressure', 'precipitation')
+
+# Filas del histórico usadas para comparar las contribuciones
+EXPLAIN_ROWS = 1000
+
+
+def load_pair(version=None):
+    """Los mismos modelos en float64 y en float32"""
+    models = []
+    for float32 in (False, True):
+        model = AirQualityModel(float32=float32)
+        if not model.load_models(lazy=False, version=version):
+            raise SystemExit("❌ No hay modelos entrenados (python train_model.py)")
+        models.append(model)
+    return models
+
+
+def history_matrix(model):
+    """Características y valores observados de todas las filas válidas del histórico"""
+    df = pd.read_csv(config.DATA_PATH)
+    df['date'] = pd.to_datetime(df['date'])
+    df = add_time_features(df.sort_values('date', kind='stable').reset_index(drop=True))
+    X = df.reindex(columns=model.feature_columns)
+    valid = X.notna().all(axis=1)
+    return X[valid].reset_index(drop=True), df.loc[valid].reset_index(drop=True)
+
+
+def grid_weather(history, n_points):
+    """Malla n_points × n_points de GRID_FEATURES sobre la última fila del histórico"""
+    base_row = history.iloc[-1]
+    axes = {
+        name: np.linspace(*np.percentile(history[name], [1, 99]), n_points)
+        for name in GRID_FEATURES
+    }
+    return scenarios.grid_inputs(base_row, axes)
+
+
+def best_time(function, repeat):
+    """Mejor tiempo de varias ejecuciones (s)"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def peak_memory(function):
+    """Memoria máxima asignada durante la llamada (bytes, tracemalloc)"""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def compare_modes(models, name, run, n_rows, repeat):
+    """
+    Tiempo y memoria de un caso en ambos modos
+    
+    Args:
+        models (tuple): (modelo float64, modelo float32)
+        name (str): Caso
+        run (callable): run(model) ejecuta el caso completo
+        n_rows (int): Filas por ejecución
+        repeat (int): Repeticiones del cronometraje
+    
+    Returns:
+        dict: rows, rows_per_s y peak_bytes por modo, y las razones float32/float64
+    """
+    result = {'case': name, 'rows': n_rows}
+    for label, model in zip(('float64', 'float32'), models):
+        run(model)  # calentamiento
+        seconds = best_time(lambda: run(model), repeat)
+        result[label] = {
+            'rows_per_s': round(n_rows / seconds),
+            'peak_bytes': peak_memory(lambda: run(model)),
+        }
+    result['speedup'] = round(result['float32']['rows_per_s'] / result['float64']['rows_per_s'], 3)
+    result['memory_ratio'] = round(result['float32']['peak_bytes'] / result['float64']['peak_bytes'], 3)
+    return result
+
+
+def prediction_drift(models, X, observed):
+    """
+    Deriva de las predicciones float32 frente a float64 por contaminante
+    
+    Returns:
+        list: Filas con max_abs, max_rel_mae (máxima diferencia / MAE del
+            modelo en float64), rows_changed y MAE en ambos modos
+    """
+    model64, model32 = models
+    pollutants = model64.ensure_loaded()
+    model32.ensure_loaded(pollutants)
+    predicted64 = model64.predict_matrix(X, pollutants)
+    predicted32 = model32.predict_matrix(X, pollutants)
+    
+    rows = []
+    for pollutant in pollutants:
+        diff = np.abs(predicted32[pollutant] - predicted64[pollutant])
+        truth = observed[pollutant].to_numpy(dtype=float)
+        known = ~np.isnan(truth)
+        mae64 = float(np.mean(np.abs(predicted64[pollutant][known] - truth[known])))
+        mae32 = float(np.mean(np.abs(predicted32[pollutant][known] - truth[known])))
+        rows.append({
+            'pollutant': pollutant,
+            'max_abs': float(diff.max()),
+            'max_rel_mae': float(diff.max() / mae64) if mae64 else None,
+            'rows_changed': int((diff > 0).sum()),
+            'mae_float64': mae64,
+            'mae_float32': mae32,
+        })
+    return rows
+
+
+def explain_drift(models, X):
+    """Deriva de las contribuciones y memoria de las tablas de atribución"""
+    model64, model32 = models
+    rows = []
+    for pollutant in model64.ensure_loaded():
+        tables = []
+        for model in models:
+            attribution = PathAttribution(model.models[pollutant], len(model.feature_columns), model.feature_dtype)
+            X_scaled = model.scalers[pollutant].transform(X.astype(model.feature_dtype))
+            tables.append((attribution, attribution.explain(model.models[pollutant], X_scaled)))
+        (table64, contributions64), (table32, contributions32) = tables
+        rows.append({
+            'pollutant': pollutant,
+            'max_abs': float(np.abs(contributions32 - contributions64).max()),
+            'table_bytes_float64': table64.table.nbytes,
+            'table_bytes_float32': table32.table.nbytes,
+        })
+    return rows
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Deriva y rendimiento de FLOAT32_SERVING")
+    parser.add_argument('--version', default=None, help="Versión del registro de modelos")
+    parser.add_argument('--batch-rows', type=int, default=200_000, help="Filas del caso por lotes")
+    parser.add_argument('--grid-points', type=int, default=400, help="Puntos por eje de la malla")
+    parser.add_argument('--repeat', type=int, default=3, help="Repeticiones del cronometraje")
+    parser.add_argument('--output', default=RESULTS_PATH, help="Archivo JSON de resultados")
+    args = parser.parse_args()
+    
+    models = load_pair(args.version)
+    pollutants = models[0].ensure_loaded()
+    X, history = history_matrix(models[0])
+    
+    print(f"\n=== FLOAT32_SERVING ({models[0].model_version}) ===")
+    drift = prediction_drift(models, X, history)
+    print(f"\nDeriva de las predicciones ({len(X)} filas del histórico):")
+    print(f"  {'contaminante':<14} {'máx. abs':>11} {'máx./MAE':>10} {'filas':>7} {'MAE f64':>11} {'MAE f32':>11}")
+    for row in drift:
+        print(f"  {row['pollutant']:<14} {row['max_abs']:>11.3g} {row['max_rel_mae'] or 0:>10.2e} "
+              f"{row['rows_changed']:>7} {row['mae_float64']:>11.6g} {row['mae_float32']:>11.6g}")
+    
+    explain = explain_drift(models, X.iloc[-EXPLAIN_ROWS:])
+    print(f"\nContribuciones (explain=true, {min(EXPLAIN_ROWS, len(X))} filas):")
+    for row in explain:
+        print(f"  {row['pollutant']:<14} máx. abs={row['max_abs']:.3g}  tabla "
+              f"{row['table_bytes_float64'] / 1024:.0f} KB -> {row['table_bytes_float32'] / 1024:.0f} KB")
+    
+    batch = pd.concat([X] * (args.batch_rows // len(X) + 1), ignore_index=True).iloc[:args.batch_rows]
+    weather = grid_weather(history, args.grid_points)
+    dates = np.full(len(weather['pressure']), np.datetime64(date.today(), 'D'))
+    moving_averages = models[0].feature_frame([history.iloc[-1].to_dict()]).iloc[0].filter(like='_ma').to_dict()
+    
+    cases = [
+        compare_modes(models, 'batch', lambda model: model.predict_matrix(batch, pollutants),
+                      len(batch), args.repeat),
+        compare_modes(models, 'grid', lambda model: model.predict_matrix(
+            model.prepare_feature_matrix(weather, dates, moving_averages), pollutants
+        ), len(dates), args.repeat),
+    ]
+    print("\nRendimiento (todos los contaminantes):")
+    print(f"  {'caso':<7} {'filas':>9} {'filas/s f64':>12} {'filas/s f32':>12} {'×':>6} {'MB f64':>8} {'MB f32':>8} {'×':>6}")
+    for case in cases:
+        print(f"  {case['case']:<7} {case['rows']:>9,} {case['float64']['rows_per_s']:>12,} "
+              f"{case['float32']['rows_per_s']:>12,} {case['speedup']:>6.2f} "
+              f"{case['float64']['peak_bytes'] / 2**20:>8.1f} {case['float32']['peak_bytes'] / 2**20:>8.1f} "
+              f"{case['memory_ratio']:>6.2f}")
+    
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'model_version': models[0].model_version,
+            'drift': drift,
+            'explain': explain,
+            'performance': cases,
+        }, f, indent=2)
+    print(f"\n📁 Resultados guardados en: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,525 @@
+"""
+Pruebas de carga HTTP de la API con percentiles de latencia
+
+Lanza el servidor local de OpenWeatherMap (benchmarks/owm_server.py) y la
+API con gunicorn (o uvicorn) apuntando a él, genera tráfico contra
+/predict, /predict/today, /weather/* y /aqi/info y reporta, por endpoint,
+el throughput, la latencia p50/p95/p99 y la tasa de errores.
+
+Con varios valores de --workers, --concurrency o --pool-sizes se ejecuta
+un barrido de todas las combinaciones y se indica el punto de saturación:
+la primera configuración a partir de la cual más concurrencia ya no
+aumenta el throughput.
+
+Modos de carga:
+- Lazo cerrado (por defecto): N clientes envían peticiones sin pausa
+- Lazo abierto (--rate): llegadas a tasa fija; la latencia se mide desde
+  el instante programado, por lo que incluye la espera en cola
+
+Uso:
+    python benchmarks/load_test.py --workers 4 --concurrency 16 --duration 30
+    python benchmarks/load_test.py --workers 1,2,4 --concurrency 4,16,64
+    python benchmarks/load_test.py --workers 4 --pool-sizes 1,4,10 --cache-ttl 0
+    python benchmarks/load_test.py --rate 50 --concurrency 64
+    python benchmarks/load_test.py --url http://localhost:8000 --concurrency 8
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import requests
+
+from owm_server import StandInOptions, start_server
+
+
+RESULTS_PATH = os.path.join(ROOT, 'benchmarks', 'results', 'load_test.json')
+
+# Mezcla de tráfico por defecto: ruta -> peso relativo
+DEFAULT_MIX = {
+    '/predict?days=5': 4,
+    '/predict/today': 3,
+    '/weather/current': 2,
+    '/weather/forecast?days=5': 1,
+    '/weather/pollution': 1,
+    '/aqi/info?aqi=75': 1,
+}
+
+# Un throughput que crece menos que esto se considera estancado
+SATURATION_GAIN = 0.05
+
+
+def parse_list(value, cast=int):
+    """Convierte '1,2,4' en [1, 2, 4]"""
+    return [cast(item) for item in str(value).split(',') if item.strip()]
+
+
+def parse_mix(value):
+    """
+    Convierte '/predict:4,/weather/current:1' en un diccionario de pesos
+    
+    Args:
+        value (str): Rutas separadas por comas con peso opcional (':peso')
+    
+    Returns:
+        dict: Ruta -> peso
+    """
+    mix = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        path, _, weight = item.rpartition(':')
+        if not path or not weight.replace('.', '', 1).isdigit():
+            path, weight = item, '1'
+        mix[path] = float(weight)
+    return mix
+
+
+def free_port():
+    """Reserva un puerto TCP libre en localhost"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def worker_is_ready(metrics_file):
+    """Indica si el archivo de métricas de un worker tiene worker_ready = 1"""
+    try:
+        with open(metrics_file, 'r', encoding='utf-8') as f:
+            gauges = json.load(f)['gauges']
+    except (OSError, ValueError, KeyError):
+        return False
+    return any(name == 'worker_ready' and value == 1 for name, _, value in gauges)
+
+
+class ApiProcess:
+    """API lanzada en un subproceso contra el servidor local de OpenWeatherMap"""
+    
+    def __init__(self, upstream_url, workers=1, pool_size=None, cache_ttl=None,
+                 server='gunicorn', log_path=None):
+        self.upstream_url = upstream_url
+        self.workers = workers
+        self.pool_size = pool_size
+        self.cache_ttl = cache_ttl
+        self.server = server
+        self.log_path = log_path
+        self.port = free_port()
+        self.process = None
+        self._log = None
+        self._metrics_dir = None
+    
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}'
+    
+    def command(self):
+        """Línea de comandos del servidor (la misma que startup.txt)"""
+        if self.server == 'uvicorn':
+            return [sys.executable, '-m', 'uvicorn', 'api:app',
+                    '--host', '127.0.0.1', '--port', str(self.port),
+                    '--workers', str(self.workers), '--log-level', 'warning']
+        return [sys.executable, '-m', 'gunicorn', 'api:app',
+                '-w', str(self.workers), '-k', 'uvicorn.workers.UvicornWorker',
+                '--bind', f'127.0.0.1:{self.port}', '--timeout', '120',
+                '--log-level', 'warning']
+    
+    def start(self, timeout=120):
+        """
+        Inicia el servidor y espera a que todos los workers respondan
+        
+        Args:
+            timeout (float): Segundos máximos de espera
+        """
+        # Directorio de métricas propio para no mezclar con otros procesos
+        self._metrics_dir = tempfile.mkdtemp(prefix='loadtest_metrics_')
+        env = dict(os.environ, OPENWEATHER_BASE_URL=self.upstream_url, METRICS_DIR=self._metrics_dir)
+        if self.pool_size is not None:
+            env['UPSTREAM_POOL_SIZE'] = str(self.pool_size)
+        if self.cache_ttl is not None:
+            env['WEATHER_CACHE_TTL'] = str(self.cache_ttl)
+        
+        self._log = open(self.log_path, 'a', encoding='utf-8') if self.log_path else subprocess.DEVNULL
+        self.process = subprocess.Popen(
+            self.command(), cwd=ROOT, env=env, stdout=self._log, stderr=subprocess.STDOUT
+        )
+        
+        deadline = time.time() + timeout
+        ready_pids = set()
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'El servidor terminó con código {self.process.returncode}')
+            try:
+                requests.get(f'{self.url}/livez', timeout=2)
+                # Los workers se cuentan por su archivo de métricas (uno por pid) con worker_ready = 1
+                ready_pids = {
+                    name for name in os.listdir(self._metrics_dir)
+                    if name.endswith('.json') and worker_is_ready(os.path.join(self._metrics_dir, name))
+                }
+                if len(ready_pids) >= self.workers:
+                    return
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.5)
+        
+        if ready_pids:
+            print(f"  ⚠️ Solo {len(ready_pids)} de {self.workers} workers listos; se continúa")
+            return
+        self.stop()
+        raise RuntimeError('El servidor no respondió a tiempo')
+    
+    def stop(self):
+        """Detiene el servidor y limpia los archivos temporales"""
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._log not in (None, subprocess.DEVNULL):
+            self._log.close()
+        if self._metrics_dir:
+            shutil.rmtree(self._metrics_dir, ignore_errors=True)
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def run_load(base_url, mix, concurrency, duration, rate=None, warmup=2.0, timeout=30.0, seed=None):
+    """
+    Genera carga contra la API y recoge la latencia de cada petición
+    
+    Args:
+        base_url (str): URL de la API
+        mix (dict): Ruta -> peso relativo
+        concurrency (int): Clientes simultáneos (o máximo de peticiones en vuelo con rate)
+        duration (float): Segundos de medición
+        rate (float): Peticiones por segundo (lazo abierto); None = lazo cerrado
+        warmup (float): Segundos iniciales cuyas peticiones se descartan
+        timeout (float): Timeout por petición
+        seed (int): Semilla para la elección de rutas
+    
+    Returns:
+        list: Tuplas (ruta, latencia en segundos, código HTTP o None, ok,
+            segundos desde el inicio de la medición hasta la respuesta)
+    """
+    paths = list(mix)
+    weights = [mix[path] for path in paths]
+    samples = []
+    samples_lock = threading.Lock()
+    
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+    
+    def send(session, path, scheduled):
+        try:
+            response = session.get(base_url + path, timeout=timeout)
+            status = response.status_code
+            ok = status < 400
+        except requests.exceptions.RequestException:
+            status, ok = None, False
+        finished = time.perf_counter()
+        if scheduled >= measure_from:
+            with samples_lock:
+                samples.append((path, finished - scheduled, status, ok, finished - measure_from))
+    
+    if rate is None:
+        def client(index):
+            rng = random.Random(None if seed is None else seed + index)
+            session = requests.Session()
+            while True:
+                scheduled = time.perf_counter()
+                if scheduled >= stop_at:
+                    break
+                send(session, rng.choices(paths, weights)[0], scheduled)
+    else:
+        # Lazo abierto: el planificador reparte llegadas programadas entre los clientes
+        pending = []
+        pending_ready = threading.Condition()
+        finished = {'done': False}
+        
+        def scheduler():
+            rng = random.Random(seed)
+            interval = 1.0 / rate
+            next_at = start
+            while next_at < stop_at:
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                with pending_ready:
+                    pending.append((rng.choices(paths, weights)[0], next_at))
+                    pending_ready.notify()
+                next_at += interval
+            with pending_ready:
+                finished['done'] = True
+                pending_ready.notify_all()
+        
+        def client(index):
+            session = requests.Session()
+            while True:
+                with pending_ready:
+                    while not pending and not finished['done']:
+                        pending_ready.wait()
+                    if not pending:
+                        break
+                    path, scheduled = pending.pop(0)
+                send(session, path, scheduled)
+        
+        threading.Thread(target=scheduler, daemon=True).start()
+    
+    threads = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    return samples
+
+
+def summarize(samples, duration):
+    """
+    Calcula throughput, percentiles y errores por endpoint
+    
+    El throughput se calcula sobre el tiempo hasta la última respuesta: en
+    lazo abierto, si la API no da abasto, la cola se sigue vaciando después
+    de la ventana de medición.
+    
+    Args:
+        samples (list): Resultado de run_load
+        duration (float): Segundos de medición
+    
+    Returns:
+        dict: Ruta -> estadísticas, con una entrada 'total'
+    """
+    elapsed = max(duration, max(sample[4] for sample in samples))
+    by_path = {}
+    for path, latency, status, ok, _ in samples:
+        by_path.setdefault(path, []).append((latency, status, ok))
+    by_path['total'] = [(latency, status, ok) for _, latency, status, ok, _ in samples]
+    
+    summary = {}
+    for path, rows in by_path.items():
+        if not rows:
+            continue
+        latencies = np.array([row[0] for row in rows]) * 1000
+        errors = sum(1 for row in rows if not row[2])
+        statuses = {}
+        for _, status, _ in rows:
+            key = str(status) if status is not None else 'connection_error'
+            statuses[key] = statuses.get(key, 0) + 1
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary[path] = {
+            'requests': len(rows),
+            'throughput_rps': len(rows) / elapsed,
+            'error_rate': errors / len(rows),
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'max_ms': float(latencies.max()),
+            'status_codes': statuses,
+        }
+    return summary
+
+
+def print_summary(summary):
+    """Imprime la tabla de resultados de una ejecución"""
+    print(f"    {'endpoint':<28}{'req':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errores':>9}")
+    for path in sorted(summary, key=lambda p: (p == 'total', p)):
+        stats = summary[path]
+        print(f"    {path:<28}{stats['requests']:>7}{stats['throughput_rps']:>9.1f}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+              f"{stats['error_rate']:>9.1%}")
+
+
+def find_saturation(runs):
+    """
+    Localiza el punto de saturación de cada combinación workers/pool
+    
+    Dentro de cada grupo (workers, pool) se recorre la concurrencia en
+    orden creciente; la saturación es el primer nivel a partir del cual
+    el throughput total crece menos de SATURATION_GAIN.
+    
+    Args:
+        runs (list): Ejecuciones con 'config' y 'summary'
+    
+    Returns:
+        list: Por grupo, la concurrencia de saturación y su throughput/p99
+    """
+    groups = {}
+    for run in runs:
+        config_key = (run['config']['workers'], run['config']['pool_size'])
+        groups.setdefault(config_key, []).append(run)
+    
+    points = []
+    for (workers, pool_size), group in groups.items():
+        group.sort(key=lambda run: run['config']['concurrency'])
+        saturated = group[-1]
+        for previous, current in zip(group, group[1:]):
+            previous_rps = previous['summary']['total']['throughput_rps']
+            current_rps = current['summary']['total']['throughput_rps']
+            if current_rps < previous_rps * (1 + SATURATION_GAIN):
+                saturated = previous
+                break
+        total = saturated['summary']['total']
+        points.append({
+            'workers': workers,
+            'pool_size': pool_size,
+            'concurrency': saturated['config']['concurrency'],
+            'throughput_rps': total['throughput_rps'],
+            'p99_ms': total['p99_ms'],
+            'reached': saturated is not group[-1],
+        })
+    return points
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Pruebas de carga HTTP de la API")
+    parser.add_argument('--url', help="Usar una API ya en ejecución (sin lanzar servidores)")
+    parser.add_argument('--server', choices=['gunicorn', 'uvicorn'], default='gunicorn',
+                        help="Servidor con el que lanzar la API (default: gunicorn)")
+    parser.add_argument('--workers', default='1', help="Workers de la API; lista para barrer (1,2,4)")
+    parser.add_argument('--concurrency', default='8', help="Clientes simultáneos; lista para barrer")
+    parser.add_argument('--pool-sizes', default=None,
+                        help="UPSTREAM_POOL_SIZE de la API; lista para barrer (default: config)")
+    parser.add_argument('--rate', type=float, default=None,
+                        help="Peticiones por segundo (lazo abierto); sin él, lazo cerrado")
+    parser.add_argument('--duration', type=float, default=20.0, help="Segundos de medición por ejecución")
+    parser.add_argument('--warmup', type=float, default=3.0, help="Segundos iniciales descartados")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Timeout por petición")
+    parser.add_argument('--endpoints', default=None,
+                        help="Mezcla de rutas con peso, p. ej. '/predict?days=7:3,/weather/current:1'")
+    parser.add_argument('--cache-ttl', type=int, default=None,
+                        help="WEATHER_CACHE_TTL de la API (0 = consultar siempre al servidor local)")
+    parser.add_argument('--upstream-latency-ms', type=float, default=50.0,
+                        help="Latencia simulada de OpenWeatherMap")
+    parser.add_argument('--upstream-jitter-ms', type=float, default=20.0)
+    parser.add_argument('--upstream-error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--log', default=None, help="Archivo donde guardar el log de la API")
+    parser.add_argument('--output', default=RESULTS_PATH, help="Archivo JSON de resultados")
+    args = parser.parse_args()
+    
+    mix = parse_mix(args.endpoints) if args.endpoints else DEFAULT_MIX
+    workers_list = parse_list(args.workers)
+    concurrency_list = parse_list(args.concurrency)
+    pool_list = parse_list(args.pool_sizes) if args.pool_sizes else [None]
+    
+    print("=== PRUEBA DE CARGA DE LA API ===\n")
+    
+    upstream = None
+    if not args.url:
+        upstream = start_server(options=StandInOptions(
+            latency_ms=args.upstream_latency_ms,
+            jitter_ms=args.upstream_jitter_ms,
+            error_rate=args.upstream_error_rate,
+            seed=args.seed,
+        ))
+        print(f"🌐 Servidor local de OpenWeatherMap en {upstream.base_url}")
+    else:
+        workers_list, pool_list = [None], [None]
+    
+    mode = f"lazo abierto a {args.rate:g} req/s" if args.rate else "lazo cerrado"
+    print(f"⚙️  Modo: {mode}; {args.duration:g} s por ejecución (+{args.warmup:g} s de calentamiento)\n")
+    
+    runs = []
+    try:
+        for workers, pool_size in itertools.product(workers_list, pool_list):
+            label = f"workers={workers or '-'} pool={pool_size or 'config'}"
+            api = None
+            if not args.url:
+                print(f"🚀 Iniciando API ({args.server}, {label})...")
+                api = ApiProcess(upstream.base_url, workers=workers, pool_size=pool_size,
+                                 cache_ttl=args.cache_ttl, server=args.server, log_path=args.log)
+                try:
+                    api.start()
+                except RuntimeError as e:
+                    print(f"  ❌ {e}")
+                    continue
+            base_url = args.url.rstrip('/') if args.url else api.url
+            
+            try:
+                for concurrency in concurrency_list:
+                    print(f"  ▶ concurrencia={concurrency}")
+                    samples = run_load(base_url, mix, concurrency, args.duration, rate=args.rate,
+                                       warmup=args.warmup, timeout=args.timeout, seed=args.seed)
+                    if not samples:
+                        print("    Sin peticiones completadas")
+                        continue
+                    summary = summarize(samples, args.duration)
+                    print_summary(summary)
+                    print()
+                    runs.append({
+                        'config': {
+                            'workers': workers,
+                            'pool_size': pool_size,
+                            'concurrency': concurrency,
+                            'rate': args.rate,
+                            'duration_s': args.duration,
+                        },
+                        'summary': summary,
+                    })
+            finally:
+                if api:
+                    api.stop()
+    finally:
+        if upstream:
+            upstream.shutdown()
+            upstream.server_close()
+    
+    if not runs:
+        print("❌ No se completó ninguna ejecución")
+        return 1
+    
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'server': None if args.url else args.server,
+        'mix': mix,
+        'upstream': None if args.url else {
+            'latency_ms': args.upstream_latency_ms,
+            'jitter_ms': args.upstream_jitter_ms,
+            'error_rate': args.upstream_error_rate,
+        },
+        'runs': runs,
+    }
+    
+    if len(concurrency_list) > 1 and not args.rate:
+        report['saturation'] = find_saturation(runs)
+        print("=== PUNTO DE SATURACIÓN ===")
+        print(f"  {'workers':>8}{'pool':>8}{'concurrencia':>14}{'rps':>9}{'p99 ms':>10}")
+        for point in report['saturation']:
+            note = '' if point['reached'] else '  (no alcanzado: probar más concurrencia)'
+            print(f"  {str(point['workers'] or '-'):>8}{str(point['pool_size'] or 'config'):>8}"
+                  f"{point['concurrency']:>14}{point['throughput_rps']:>9.1f}{point['p99_ms']:>10.1f}{note}")
+        print()
+    
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"📁 Resultados guardados en: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
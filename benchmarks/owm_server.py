@@ -0,0 +1,331 @@
+"""
+Servidor local que imita a OpenWeatherMap para pruebas de carga y benchmarks
+
+Sirve las respuestas grabadas de benchmarks/fixtures/openweathermap/ en
+/data/2.5/weather, /data/2.5/forecast y /data/2.5/air_pollution, con
+latencia, tasa de errores y tamaño de respuesta configurables. El modo
+record descarga respuestas reales de OpenWeatherMap y las guarda como
+fixtures.
+
+Uso:
+    python benchmarks/owm_server.py serve --port 8099 --latency-ms 80 --error-rate 0.05
+    OPENWEATHER_BASE_URL=http://127.0.0.1:8099/data/2.5 python api.py
+    
+    python benchmarks/owm_server.py record        # requiere red y API key
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+
+
+FIXTURES_PATH = os.path.join(ROOT, 'benchmarks', 'fixtures', 'openweathermap')
+
+# Endpoints servidos: ruta -> nombre del fixture
+ENDPOINTS = {
+    'weather': 'weather',
+    'forecast': 'forecast',
+    'air_pollution': 'air_pollution',
+}
+
+# Intervalo entre puntos del pronóstico (3 horas)
+FORECAST_STEP = 3 * 3600
+
+
+class StandInOptions:
+    """Parámetros de comportamiento del servidor"""
+    
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=503,
+                 hang_rate=0.0, hang_seconds=30.0, forecast_items=None, pad_bytes=0,
+                 rebase_time=True, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.forecast_items = forecast_items
+        self.pad_bytes = pad_bytes
+        self.rebase_time = rebase_time
+        self.random = random.Random(seed)
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Servidor HTTP con fixtures, opciones y contadores compartidos"""
+    
+    daemon_threads = True
+    
+    def __init__(self, address, options, fixtures_path=FIXTURES_PATH):
+        super().__init__(address, StandInHandler)
+        self.options = options
+        self.fixtures = load_fixtures(fixtures_path)
+        self.stats = {'requests': {}, 'errors': {}, 'hangs': {}}
+        self.stats_lock = threading.Lock()
+    
+    def count(self, kind, endpoint):
+        """Incrementa un contador de peticiones"""
+        with self.stats_lock:
+            self.stats[kind][endpoint] = self.stats[kind].get(endpoint, 0) + 1
+    
+    @property
+    def base_url(self):
+        """URL base para configurar OPENWEATHER_BASE_URL"""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/data/2.5'
+
+
+def load_fixtures(path):
+    """
+    Carga las respuestas grabadas
+    
+    Args:
+        path (str): Directorio con weather.json, forecast.json y air_pollution.json
+    
+    Returns:
+        dict: Nombre -> respuesta JSON
+    """
+    fixtures = {}
+    for name in ENDPOINTS.values():
+        with open(os.path.join(path, f'{name}.json'), 'r', encoding='utf-8') as f:
+            fixtures[name] = json.load(f)
+    return fixtures
+
+
+def build_payload(name, fixture, options, query):
+    """
+    Prepara la respuesta de un endpoint a partir del fixture
+    
+    Args:
+        name (str): Nombre del endpoint
+        fixture (dict): Respuesta grabada
+        options (StandInOptions): Opciones del servidor
+        query (dict): Parámetros de la consulta
+    
+    Returns:
+        dict: Respuesta a enviar
+    """
+    payload = copy.deepcopy(fixture)
+    now = int(time.time())
+    
+    if name == 'forecast':
+        items = payload['list']
+        if options.forecast_items and options.forecast_items != len(items):
+            # Repetir los puntos grabados para simular respuestas más grandes
+            extended = []
+            for i in range(options.forecast_items):
+                item = copy.deepcopy(items[i % len(items)])
+                item['dt'] = items[0]['dt'] + i * FORECAST_STEP
+                extended.append(item)
+            items = extended
+        
+        if 'cnt' in query:
+            items = items[:int(query['cnt'][0])]
+        
+        if options.rebase_time and items:
+            # Desplazar el pronóstico para que empiece en la próxima franja de 3 horas
+            offset = (now // FORECAST_STEP + 1) * FORECAST_STEP - items[0]['dt']
+            for item in items:
+                item['dt'] += offset
+                item['dt_txt'] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(item['dt']))
+        
+        payload['list'] = items
+        payload['cnt'] = len(items)
+    elif options.rebase_time:
+        if name == 'weather':
+            payload['dt'] = now
+        else:
+            for item in payload.get('list', []):
+                item['dt'] = now
+    
+    if options.pad_bytes:
+        payload['_padding'] = 'x' * options.pad_bytes
+    
+    return payload
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Manejador de peticiones del servidor local"""
+    
+    server_version = 'OWMStandIn/1.0'
+    
+    def log_message(self, format, *args):
+        # Silenciar el log por petición (afecta a las mediciones)
+        pass
+    
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        server = self.server
+        options = server.options
+        
+        if parsed.path == '/__stats':
+            with server.stats_lock:
+                self._send_json(200, server.stats)
+            return
+        
+        endpoint = parsed.path.rstrip('/').rsplit('/', 1)[-1]
+        if endpoint not in ENDPOINTS:
+            self._send_json(404, {'cod': 404, 'message': 'Endpoint no soportado por el servidor local'})
+            return
+        
+        server.count('requests', endpoint)
+        
+        delay = options.latency_ms + options.random.uniform(-options.jitter_ms, options.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        
+        if options.hang_rate and options.random.random() < options.hang_rate:
+            server.count('hangs', endpoint)
+            time.sleep(options.hang_seconds)
+        
+        if options.error_rate and options.random.random() < options.error_rate:
+            server.count('errors', endpoint)
+            self._send_json(options.error_status, {'cod': options.error_status, 'message': 'Error simulado'})
+            return
+        
+        query = parse_qs(parsed.query)
+        name = ENDPOINTS[endpoint]
+        self._send_json(200, build_payload(name, server.fixtures[name], options, query))
+
+
+def start_server(port=0, host='127.0.0.1', options=None, fixtures_path=FIXTURES_PATH):
+    """
+    Inicia el servidor en un hilo en segundo plano
+    
+    Args:
+        port (int): Puerto (0 = puerto libre aleatorio)
+        host (str): Dirección de escucha
+        options (StandInOptions): Opciones de comportamiento
+        fixtures_path (str): Directorio de fixtures
+    
+    Returns:
+        StandInServer: Servidor en ejecución (usar .base_url y .shutdown())
+    """
+    server = StandInServer((host, port), options or StandInOptions(), fixtures_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def record_fixtures(fixtures_path=FIXTURES_PATH, upstream=None):
+    """
+    Descarga respuestas reales de OpenWeatherMap y las guarda como fixtures
+    
+    Args:
+        fixtures_path (str): Directorio de destino
+        upstream (str): URL base real de OpenWeatherMap
+    
+    Returns:
+        bool: True si se grabaron todos los endpoints
+    """
+    import requests
+    
+    upstream = (upstream or 'https://api.openweathermap.org/data/2.5').rstrip('/')
+    params = {'lat': config.LATITUDE, 'lon': config.LONGITUDE, 'appid': config.OPENWEATHER_API_KEY}
+    extra = {
+        'weather': {'units': 'metric'},
+        'forecast': {'units': 'metric', 'cnt': 40},
+        'air_pollution': {},
+    }
+    
+    os.makedirs(fixtures_path, exist_ok=True)
+    ok = True
+    for endpoint, name in ENDPOINTS.items():
+        try:
+            response = requests.get(f'{upstream}/{endpoint}', params={**params, **extra[endpoint]}, timeout=10)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            print(f"  ❌ {endpoint}: {e}")
+            ok = False
+            continue
+        
+        path = os.path.join(fixtures_path, f'{name}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(response.json(), f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"  ✅ {endpoint} -> {path} ({len(response.content)} bytes)")
+    
+    return ok
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Servidor local que imita a OpenWeatherMap")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    serve = subparsers.add_parser('serve', help="Servir respuestas grabadas")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8099)
+    serve.add_argument('--fixtures', default=FIXTURES_PATH, help="Directorio de fixtures")
+    serve.add_argument('--latency-ms', type=float, default=0.0, help="Latencia añadida por petición")
+    serve.add_argument('--jitter-ms', type=float, default=0.0, help="Variación aleatoria de la latencia (±)")
+    serve.add_argument('--error-rate', type=float, default=0.0, help="Fracción de peticiones que fallan")
+    serve.add_argument('--error-status', type=int, default=503, help="Código HTTP de los errores simulados")
+    serve.add_argument('--hang-rate', type=float, default=0.0, help="Fracción de peticiones que se cuelgan")
+    serve.add_argument('--hang-seconds', type=float, default=30.0, help="Duración de un cuelgue")
+    serve.add_argument('--forecast-items', type=int, default=None,
+                       help="Número de puntos del pronóstico (repite los grabados)")
+    serve.add_argument('--pad-bytes', type=int, default=0, help="Relleno añadido a cada respuesta")
+    serve.add_argument('--no-rebase-time', action='store_true',
+                       help="Mantener las marcas de tiempo grabadas")
+    serve.add_argument('--seed', type=int, default=None, help="Semilla para latencia y errores")
+    
+    record = subparsers.add_parser('record', help="Grabar respuestas reales como fixtures")
+    record.add_argument('--fixtures', default=FIXTURES_PATH, help="Directorio de destino")
+    record.add_argument('--upstream', default='https://api.openweathermap.org/data/2.5')
+    
+    args = parser.parse_args()
+    
+    if args.command == 'record':
+        print("=== GRABANDO RESPUESTAS DE OPENWEATHERMAP ===\n")
+        return 0 if record_fixtures(args.fixtures, args.upstream) else 1
+    
+    if args.command is None:
+        args = parser.parse_args(['serve'])
+    
+    options = StandInOptions(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        hang_rate=args.hang_rate,
+        hang_seconds=args.hang_seconds,
+        forecast_items=args.forecast_items,
+        pad_bytes=args.pad_bytes,
+        rebase_time=not args.no_rebase_time,
+        seed=args.seed,
+    )
+    server = StandInServer((args.host, args.port), options, args.fixtures)
+    print(f"🌐 Servidor local de OpenWeatherMap en {server.base_url}")
+    print(f"   export OPENWEATHER_BASE_URL={server.base_url}")
+    print(f"   Estadísticas en http://{args.host}:{args.port}/__stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️  Servidor detenido")
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
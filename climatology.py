@@ -0,0 +1,219 @@
+"""
+Climatología diaria de contaminantes
+
+Tabla día del año × contaminante con la media suavizada, la desviación
+estándar y percentiles de las observaciones históricas. Se construye al
+entrenar, se guarda junto a los modelos (climatology.joblib) y sirve para:
+- Responder /predict sin datos meteorológicos (modo degradado)
+- Marcar predicciones fuera del rango histórico para ese día del año
+
+Uso (regenerar solo la climatología, sin reentrenar):
+    python climatology.py
+"""
+
+import os
+from datetime import date, timedelta
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import config
+
+
+CLIMATOLOGY_FILENAME = 'climatology.joblib'
+
+# Percentiles guardados por día del año
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+# Semiancho (días) de la ventana circular usada para suavizar
+SMOOTHING_WINDOW = 15
+
+# Banda fuera de la cual una predicción se marca como atípica
+SANITY_BAND = ('p01', 'p99')
+
+
+def _doy_distance(a, b):
+    """Distancia circular entre días del año (el 31/12 está junto al 1/1)"""
+    diff = np.abs(a - b)
+    return np.minimum(diff, 366 - diff)
+
+
+def build_climatology(df, pollutants=None, window=SMOOTHING_WINDOW):
+    """
+    Calcula la climatología a partir de las observaciones diarias
+    
+    Para cada día del año se usan las observaciones de todos los años que
+    caen a menos de `window` días (ventana circular), lo que suaviza la
+    serie y da suficientes muestras para los percentiles.
+    
+    Args:
+        df (DataFrame): Datos históricos con columna 'date' y contaminantes
+        pollutants (list): Contaminantes a incluir (default: TARGET_POLLUTANTS)
+        window (int): Semiancho de la ventana en días
+    
+    Returns:
+        Climatology: Tabla lista para consultar
+    """
+    pollutants = pollutants or config.TARGET_POLLUTANTS
+    doy = pd.to_datetime(df['date']).dt.dayofyear.to_numpy()
+    days = np.arange(1, 367)
+    
+    # Matriz (366 días del año × observaciones) de pertenencia a la ventana
+    in_window = _doy_distance(days[:, None], doy[None, :]) <= window
+    
+    table = {}
+    for pollutant in pollutants:
+        if pollutant not in df.columns:
+            continue
+        values = df[pollutant].to_numpy(dtype=float)
+        windowed = np.where(in_window, values[None, :], np.nan)
+        
+        stats = {
+            'mean': np.nanmean(windowed, axis=1),
+            'std': np.nanstd(windowed, axis=1),
+            'count': np.sum(in_window & ~np.isnan(values)[None, :], axis=1),
+        }
+        for q, row in zip(PERCENTILES, np.nanpercentile(windowed, PERCENTILES, axis=1)):
+            stats[f'p{q:02d}'] = row
+        
+        # Índice = día del año (la posición 0 no se usa)
+        table[pollutant] = {name: np.concatenate([[np.nan], column]) for name, column in stats.items()}
+    
+    return Climatology(table, window=window, n_observations=len(df))
+
+
+class Climatology:
+    """Tabla de climatología indexada por día del año"""
+    
+    def __init__(self, table, window=SMOOTHING_WINDOW, n_observations=0):
+        self.table = table
+        self.window = window
+        self.n_observations = n_observations
+    
+    @property
+    def pollutants(self):
+        return list(self.table)
+    
+    def stat(self, pollutant, name, day_of_year):
+        """
+        Valor de un estadístico para uno o varios días del año
+        
+        Args:
+            pollutant (str): Contaminante
+            name (str): 'mean', 'std', 'count' o percentil ('p05', 'p50'...)
+            day_of_year (int o array): Día(s) del año (1-366)
+        
+        Returns:
+            float o ndarray: Valor(es) del estadístico
+        """
+        return self.table[pollutant][name][day_of_year]
+    
+    def predict(self, dates):
+        """
+        Predicción climatológica (media suavizada) para varias fechas
+        
+        Args:
+            dates (list): Fechas (date o datetime)
+        
+        Returns:
+            DataFrame: Columnas 'date' y una por contaminante, con el mismo
+                formato que AirQualityModel.predict
+        """
+        doy = np.array([d.timetuple().tm_yday for d in dates])
+        result = pd.DataFrame({'date': list(dates)})
+        for pollutant in self.table:
+            result[pollutant] = np.maximum(0, self.stat(pollutant, 'mean', doy))
+        return result
+    
+    def forecast(self, days, start=None):
+        """
+        Predicción climatológica para hoy y los días siguientes
+        
+        Args:
+            days (int): Número de días (incluyendo hoy)
+            start (date): Primer día (default: hoy)
+        
+        Returns:
+            DataFrame: Igual que predict()
+        """
+        start = start or date.today()
+        return self.predict([start + timedelta(days=i) for i in range(days)])
+    
+    def sanity_flags(self, predictions):
+        """
+        Contaminantes fuera de la banda histórica para cada fila
+        
+        Args:
+            predictions (DataFrame): Predicciones con columna 'date'
+        
+        Returns:
+            list: Por fila, lista de (contaminante, 'low' | 'high')
+        """
+        flags = [[] for _ in range(len(predictions))]
+        if 'date' not in predictions.columns or predictions.empty:
+            return flags
+        
+        doy = pd.to_datetime(predictions['date']).dt.dayofyear.to_numpy()
+        low_name, high_name = SANITY_BAND
+        for pollutant in self.table:
+            if pollutant not in predictions.columns:
+                continue
+            values = predictions[pollutant].to_numpy(dtype=float)
+            low = values < self.stat(pollutant, low_name, doy)
+            high = values > self.stat(pollutant, high_name, doy)
+            for i in np.flatnonzero(low | high):
+                flags[i].append((pollutant, 'low' if low[i] else 'high'))
+        return flags
+    
+    def to_frame(self):
+        """
+        Tabla completa en formato largo (una fila por día y contaminante)
+        
+        Returns:
+            DataFrame: day_of_year, pollutant y una columna por estadístico
+        """
+        frames = []
+        for pollutant, stats in self.table.items():
+            frame = pd.DataFrame({name: column[1:] for name, column in stats.items()})
+            frame.insert(0, 'pollutant', pollutant)
+            frame.insert(0, 'day_of_year', np.arange(1, 367))
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True)
+    
+    def save(self, path=None):
+        """Guarda la climatología junto a los modelos"""
+        path = path or os.path.join(config.MODEL_PATH, CLIMATOLOGY_FILENAME)
+        joblib.dump({
+            'table': self.table,
+            'window': self.window,
+            'n_observations': self.n_observations,
+        }, path)
+        return path
+    
+    @classmethod
+    def load(cls, path=None):
+        """
+        Carga la climatología guardada
+        
+        Returns:
+            Climatology: Tabla o None si el archivo no existe
+        """
+        path = path or os.path.join(config.MODEL_PATH, CLIMATOLOGY_FILENAME)
+        if not os.path.exists(path):
+            return None
+        data = joblib.load(path)
+        return cls(data['table'], window=data['window'], n_observations=data['n_observations'])
+
+
+if __name__ == "__main__":
+    historical = pd.read_csv(config.DATA_PATH)
+    climatology = build_climatology(historical)
+    path = climatology.save()
+    print(f"Climatología de {len(climatology.pollutants)} contaminantes "
+          f"({climatology.n_observations} observaciones) guardada en: {path}")
+    
+    today = climatology.forecast(1).iloc[0]
+    print(f"\nValores climatológicos para hoy ({today['date']}):")
+    for pollutant in climatology.pollutants:
+        print(f"  {pollutant}: {today[pollutant]:.6g}")
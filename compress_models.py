@@ -0,0 +1,409 @@
+"""
+Compresión de modelos: menos etapas de boosting con la misma precisión
+
+Los modelos se entrenan con 100 etapas, pero varios contaminantes llegan
+al mismo error con muchas menos. Para cada contaminante se evalúan sobre
+las filas que el modelo no vio al entrenar (partición de prueba más los
+días agregados después, ver backfill.training_split):
+
+- prefijos del ensamble: las primeras n etapas del modelo actual; un solo
+  staged_predict da el MAE de todos los tamaños
+- modelos reentrenados más pequeños (COMPRESSION_REFIT_STAGES etapas, con
+  la tasa de aprendizaje escalada para llegar al mismo punto)
+
+Se elige el candidato con menos etapas (al menos COMPRESSION_MIN_STAGES)
+cuyo MAE no supera el del modelo completo en más de la tolerancia
+(relativa, COMPRESSION_TOLERANCE o --tolerance por contaminante). El reporte incluye MAE, latencia de una
+petición (7 filas), filas/s en bloque y tamaño serializado de cada
+candidato. Los modelos elegidos se escriben como una versión nueva del
+registro (con el reporte en el manifest); se pone en producción solo con
+--promote, o se compara antes en modo sombra.
+
+Uso:
+    python compress_models.py                            # versión en producción
+    python compress_models.py --tolerance 0.02,aerosol_index=0.005
+    python compress_models.py --version <versión> --refit-stages 20,40 --promote
+    python compress_models.py --dry-run --report compresion.json
+"""
+
+import argparse
+import copy
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+
+import joblib
+import numpy as np
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+import config
+import model_registry
+from backfill import training_split
+from train_model import AirQualityModel
+
+
+# Filas de una petición a /predict (hoy + 6 días) para medir la latencia
+REQUEST_ROWS = 7
+LATENCY_REPEATS = 200
+THROUGHPUT_ROWS = 10_000
+
+# Separación de los tamaños de prefijo que se reportan además del elegido
+PREFIX_STEP = 10
+
+
+def parse_tolerances(text):
+    """
+    Tolerancias por contaminante
+    
+    Args:
+        text (str): '0.02' (todos) o '0.02,aerosol_index=0.005' (general y
+            excepciones); None = COMPRESSION_TOLERANCE
+    
+    Returns:
+        dict: {contaminante: tolerancia} con la general en la clave None
+    
+    Raises:
+        ValueError: Si el texto no tiene el formato esperado
+    """
+    tolerances = {None: config.COMPRESSION_TOLERANCE}
+    for part in (text or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, value = part.rpartition('=')
+        if name and name not in config.TARGET_POLLUTANTS:
+            raise ValueError(f"Contaminante desconocido en la tolerancia: {name}")
+        try:
+            tolerance = float(value)
+        except ValueError:
+            raise ValueError(f"Tolerancia inválida: '{part}'")
+        if tolerance < 0:
+            raise ValueError(f"La tolerancia no puede ser negativa: '{part}'")
+        tolerances[name or None] = tolerance
+    return tolerances
+
+
+def truncate(model, n_stages):
+    """
+    Copia de un GradientBoostingRegressor con solo sus primeras n etapas
+    
+    Las predicciones son idénticas a las de staged_predict en la etapa n.
+    """
+    compact = copy.copy(model)
+    compact.estimators_ = model.estimators_[:n_stages].copy()
+    compact.train_score_ = model.train_score_[:n_stages].copy()
+    if getattr(model, 'oob_improvement_', None) is not None:
+        compact.oob_improvement_ = model.oob_improvement_[:n_stages].copy()
+    compact.n_estimators = n_stages
+    compact.n_estimators_ = n_stages
+    return compact
+
+
+def refit(model, X_train, y_train, n_stages):
+    """
+    Reentrena con menos etapas y la tasa de aprendizaje escalada
+    
+    Mismos hiperparámetros que el modelo original salvo n_estimators y
+    learning_rate (learning_rate × etapas originales / n, máximo 1).
+    """
+    params = model.get_params()
+    params.update(
+        n_estimators=n_stages,
+        learning_rate=min(1.0, model.learning_rate * model.n_estimators_ / n_stages),
+        verbose=0,
+    )
+    compact = type(model)(**params)
+    compact.fit(X_train, y_train)
+    return compact
+
+
+def serialized_size(model):
+    """Bytes del modelo serializado (aproxima el archivo .joblib y la memoria)"""
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _elapsed(function, *args):
+    started = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started
+
+
+def measure(model, X_eval, y_eval, X_request):
+    """
+    Precisión, latencia y tamaño de un candidato
+    
+    Args:
+        model (GradientBoostingRegressor): Candidato
+        X_eval (ndarray): Filas de evaluación ya escaladas
+        y_eval (ndarray): Valores observados
+        X_request (ndarray): Filas de una petición típica
+    
+    Returns:
+        dict: stages, mae, latency_ms (mediana por petición), rows_per_s,
+            size_bytes y nodes
+    """
+    predicted = np.maximum(0, model.predict(X_eval))
+    
+    # Rendimiento en bloque: mejor de varias pasadas sobre THROUGHPUT_ROWS filas
+    X_batch = np.resize(X_eval, (THROUGHPUT_ROWS, X_eval.shape[1]))
+    batch_seconds = min(_elapsed(model.predict, X_batch) for _ in range(3))
+    
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        timings.append(_elapsed(model.predict, X_request))
+    
+    return {
+        'stages': int(model.n_estimators_),
+        'mae': float(mean_absolute_error(y_eval, predicted)),
+        'latency_ms': round(float(np.median(timings)) * 1000, 4),
+        'rows_per_s': round(THROUGHPUT_ROWS / batch_seconds) if batch_seconds > 0 else None,
+        'size_bytes': serialized_size(model),
+        'nodes': int(sum(estimator.tree_.node_count for estimator in model.estimators_[:, 0])),
+    }
+
+
+def evaluation_data(model):
+    """
+    Filas de entrenamiento y de evaluación de cada contaminante
+    
+    Se preparan igual que en train_models (mismas filas válidas y mismo
+    orden) y se dividen con backfill.training_split según el manifest de
+    la versión cargada.
+    
+    Args:
+        model (AirQualityModel): Modelos cargados
+    
+    Returns:
+        dict: {contaminante: dict con X_train, y_train, X_eval, y_eval
+            (escaladas con el escalador del modelo) y n_train, n_test}
+    """
+    _, y_dict = AirQualityModel().load_and_prepare_data()
+    data = {}
+    for pollutant in model.ensure_loaded():
+        if pollutant not in y_dict:
+            print(f"Advertencia: no hay datos de {pollutant}; se conserva el modelo")
+            continue
+        X = y_dict[pollutant]['X'][model.feature_columns]
+        y = y_dict[pollutant]['y'].to_numpy(dtype=float)
+        split = training_split(model.registry_version, pollutant, len(y))
+        train, evaluate = split == 'train', split != 'train'
+        if not evaluate.any():
+            print(f"Advertencia: no hay filas de evaluación para {pollutant}; se conserva el modelo")
+            continue
+        
+        X_scaled = model.scalers[pollutant].transform(X)
+        data[pollutant] = {
+            'X_train': X_scaled[train],
+            'y_train': y[train],
+            'X_eval': X_scaled[evaluate],
+            'y_eval': y[evaluate],
+            'n_train': int(train.sum()),
+            'n_test': int((split == 'test').sum()),
+        }
+    return data
+
+
+def compress_pollutant(model, data, tolerance, refit_stages):
+    """
+    Candidatos de un contaminante y el elegido
+    
+    Args:
+        model (GradientBoostingRegressor): Modelo completo
+        data (dict): Entrada de evaluation_data
+        tolerance (float): Aumento relativo de MAE aceptado
+        refit_stages (list): Etapas de los modelos reentrenados
+    
+    Returns:
+        tuple: (modelo elegido, reporte con baseline, limit, candidates y chosen)
+    """
+    X_eval, y_eval = data['X_eval'], data['y_eval']
+    X_request = X_eval[:REQUEST_ROWS]
+    n_full = int(model.n_estimators_)
+    
+    # MAE de cada prefijo en una sola pasada por el ensamble
+    staged_mae = np.array([
+        mean_absolute_error(y_eval, np.maximum(0, predicted)) for predicted in model.staged_predict(X_eval)
+    ])
+    baseline = float(staged_mae[-1])
+    limit = baseline * (1 + tolerance)
+    min_stages = min(config.COMPRESSION_MIN_STAGES, n_full)
+    smallest = int(np.argmax(staged_mae[min_stages - 1:] <= limit)) + min_stages
+    
+    candidates = []
+    models = {}
+    prefix_sizes = sorted(set(range(min_stages, n_full, PREFIX_STEP)) | {smallest, n_full})
+    for n_stages in prefix_sizes:
+        compact = model if n_stages == n_full else truncate(model, n_stages)
+        kind = 'full' if n_stages == n_full else 'prefix'
+        models[(kind, n_stages)] = compact
+        candidates.append({'kind': kind, **measure(compact, X_eval, y_eval, X_request)})
+    
+    for n_stages in sorted(set(refit_stages)):
+        if min_stages <= n_stages < n_full:
+            compact = refit(model, data['X_train'], data['y_train'], n_stages)
+            models[('refit', n_stages)] = compact
+            candidates.append({'kind': 'refit', **measure(compact, X_eval, y_eval, X_request)})
+    
+    # Menos etapas dentro de la tolerancia; a igualdad, menor MAE (el prefijo no cambia el modelo)
+    accepted = [c for c in candidates if c['mae'] <= limit or c['kind'] == 'full']
+    chosen = min(accepted, key=lambda c: (c['stages'], c['mae'], c['kind'] != 'prefix'))
+    for candidate in candidates:
+        candidate['mae_change'] = round(candidate['mae'] / baseline - 1, 6) if baseline else 0.0
+        candidate['accepted'] = candidate in accepted
+    
+    report = {
+        'tolerance': tolerance,
+        'baseline_mae': baseline,
+        'mae_limit': limit,
+        'n_eval': len(y_eval),
+        'staged_mae': [round(float(mae), 8) for mae in staged_mae],
+        'candidates': candidates,
+        'chosen': {'kind': chosen['kind'], 'stages': chosen['stages']},
+    }
+    return models[(chosen['kind'], chosen['stages'])], report
+
+
+def compress(model, tolerances=None, refit_stages=None):
+    """
+    Elige el modelo compacto de cada contaminante
+    
+    Args:
+        model (AirQualityModel): Modelos cargados (lazy=False)
+        tolerances (dict): De parse_tolerances (default: COMPRESSION_TOLERANCE)
+        refit_stages (list): Etapas a reentrenar (default: COMPRESSION_REFIT_STAGES)
+    
+    Returns:
+        tuple: (modelos elegidos, reporte por contaminante, results para el manifest)
+    """
+    tolerances = tolerances or {None: config.COMPRESSION_TOLERANCE}
+    refit_stages = config.COMPRESSION_REFIT_STAGES if refit_stages is None else refit_stages
+    
+    compact_models, report, results = {}, {}, {}
+    for pollutant, data in evaluation_data(model).items():
+        print(f"\nComprimiendo {pollutant}...")
+        tolerance = tolerances.get(pollutant, tolerances[None])
+        compact, report[pollutant] = compress_pollutant(model.models[pollutant], data, tolerance, refit_stages)
+        compact_models[pollutant] = compact
+        
+        predicted = np.maximum(0, compact.predict(data['X_eval']))
+        results[pollutant] = {
+            'mae': float(mean_absolute_error(data['y_eval'], predicted)),
+            'rmse': float(np.sqrt(mean_squared_error(data['y_eval'], predicted))),
+            'r2': float(r2_score(data['y_eval'], predicted)),
+            'n_train': data['n_train'],
+            'n_test': data['n_test'],
+        }
+    return compact_models, report, results
+
+
+def write_version(model, compact_models, report, results):
+    """
+    Publica los modelos elegidos como versión nueva del registro
+    
+    Los escaladores, las columnas y la climatología se copian de la
+    versión de origen; los contaminantes sin evaluar conservan su modelo.
+    Solo se comprimen los modelos de la estación principal: los de las
+    demás estaciones (stations/) se copian sin cambios.
+    
+    Returns:
+        str: Nombre de la versión
+    """
+    staging = model_registry.staging_dir()
+    try:
+        model_registry.copy_model_files(model.base_dir, staging)
+        for pollutant, compact in compact_models.items():
+            joblib.dump(compact, os.path.join(staging, f'model_{pollutant}.joblib'))
+        
+        base_manifest = model_registry.read_manifest(model.registry_version) if model.registry_version else None
+        stations = {
+            key: base_manifest[key]
+            for key in ('primary_station', 'station_results')
+            if base_manifest and key in base_manifest
+        }
+        return model_registry.publish(staging, {
+            **stations,
+            'source': 'compress_models',
+            'base_version': model.model_version,
+            'data_path': config.DATA_PATH,
+            'feature_columns': list(model.feature_columns),
+            'results': results,
+            'compression': {
+                pollutant: {key: value for key, value in entry.items() if key != 'staged_mae'}
+                for pollutant, entry in report.items()
+            },
+        })
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def print_report(report):
+    """Tabla de candidatos por contaminante"""
+    for pollutant, entry in report.items():
+        print(f"\n{pollutant}: MAE completo={entry['baseline_mae']:.6g}  "
+              f"límite={entry['mae_limit']:.6g} (+{entry['tolerance']:.1%})  filas={entry['n_eval']}")
+        print(f"  {'tipo':<7} {'etapas':>6} {'MAE':>11} {'ΔMAE':>8} {'ms/pet.':>8} {'filas/s':>10} {'KB':>8}")
+        for c in entry['candidates']:
+            mark = '←' if (c['kind'], c['stages']) == (entry['chosen']['kind'], entry['chosen']['stages']) else (' ' if c['accepted'] else '✗')
+            rows_per_s = f"{c['rows_per_s']:,}" if c['rows_per_s'] else '-'
+            print(f"  {c['kind']:<7} {c['stages']:>6} {c['mae']:>11.6g} {c['mae_change']:>+8.2%} "
+                  f"{c['latency_ms']:>8.3f} {rows_per_s:>10} {c['size_bytes'] / 1024:>8.1f} {mark}")
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Compresión de modelos por número de etapas")
+    parser.add_argument('--version', default=None, help="Versión de origen (default: la de producción)")
+    parser.add_argument('--tolerance', default=None,
+                        help="Aumento relativo de MAE aceptado: '0.02' o '0.02,aerosol_index=0.005'")
+    parser.add_argument('--refit-stages', default=None,
+                        help="Etapas de los modelos reentrenados ('' = solo prefijos; default: COMPRESSION_REFIT_STAGES)")
+    parser.add_argument('--dry-run', action='store_true', help="Solo reportar, sin escribir una versión")
+    parser.add_argument('--promote', action='store_true', help="Poner la versión nueva en producción")
+    parser.add_argument('--report', default=None, help="Guardar el reporte completo en JSON")
+    args = parser.parse_args()
+    
+    try:
+        tolerances = parse_tolerances(args.tolerance)
+        refit_stages = None if args.refit_stages is None else [int(n) for n in args.refit_stages.split(',') if n]
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    
+    model = AirQualityModel()
+    if not model.load_models(version=args.version, lazy=False):
+        print("❌ No hay modelos entrenados (python train_model.py)")
+        return 1
+    
+    compact_models, report, results = compress(model, tolerances, refit_stages)
+    print(f"\n=== COMPRESIÓN DE {model.model_version} ===")
+    print_report(report)
+    
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'base_version': model.model_version, 'report': report}, f, indent=2, ensure_ascii=False)
+        print(f"\nReporte: {args.report}")
+    
+    changed = [p for p, compact in compact_models.items() if compact is not model.models[p]]
+    if not changed:
+        print("\nℹ️  Ningún modelo se puede reducir dentro de la tolerancia; no se crea una versión")
+        return 0
+    if args.dry_run:
+        return 0
+    
+    version = write_version(model, compact_models, report, results)
+    print(f"\n✅ Versión comprimida: {version} ({', '.join(changed)})")
+    if args.promote:
+        exported = model_registry.promote(version)
+        print(f"Versión en producción: {version}")
+        print(f"Archivos planos actualizados ({len(exported)}) en {config.MODEL_PATH}: commitearlos para desplegar")
+    else:
+        print(f"Para compararla con el tráfico real: python model_registry.py shadow {version}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,10 +2,17 @@
 Configuración del proyecto
 """
 import os
+import tempfile
 
 # API Key de OpenWeatherMap (usa variable de entorno en Azure)
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY", "7e2e121dba238439a5276c8b5c956fb6")
 
+# URL base de OpenWeatherMap (se puede apuntar al servidor local de benchmarks/owm_server.py)
+OPENWEATHER_BASE_URL = os.getenv('OPENWEATHER_BASE_URL', 'https://api.openweathermap.org/data/2.5')
+
+# Conexiones HTTP reutilizables hacia OpenWeatherMap por worker
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 10))
+
 # Coordenadas de Huamanga, Ayacucho, Perú
 LATITUDE = -13.1631
 LONGITUDE = -74.2236
@@ -21,6 +28,95 @@ DATA_PATH = "data/huamanga_air_quality_2020_2025.csv"
 MODEL_PATH = "models/"
 PREDICTIONS_PATH = "predictions/"
 
+# Archivo de predicciones (Parquet particionado por fecha de emisión)
+PREDICTIONS_ARCHIVE_PATH = os.getenv('PREDICTIONS_ARCHIVE_PATH', os.path.join(PREDICTIONS_PATH, 'archive'))
+PREDICTIONS_ARCHIVE_COMPRESSION = os.getenv('PREDICTIONS_ARCHIVE_COMPRESSION', 'zstd')
+PREDICTIONS_RETENTION_DAYS = int(os.getenv('PREDICTIONS_RETENTION_DAYS', 365))
+
+# Reproceso del histórico y reporte de desempeño por versión de modelos (backfill.py)
+BACKFILL_PATH = os.getenv('BACKFILL_PATH', os.path.join(PREDICTIONS_PATH, 'backfill'))
+
+# Compresión de modelos (compress_models.py): aumento relativo de MAE aceptado, etapas
+# mínimas (evita ensambles degenerados) y tamaños de los modelos reentrenados a probar
+COMPRESSION_TOLERANCE = float(os.getenv('COMPRESSION_TOLERANCE', 0.01))
+COMPRESSION_MIN_STAGES = int(os.getenv('COMPRESSION_MIN_STAGES', 10))
+COMPRESSION_REFIT_STAGES = [int(n) for n in os.getenv('COMPRESSION_REFIT_STAGES', '10,25,50').split(',') if n]
+
+# Escritura del archivo en segundo plano: lote máximo, espera para agrupar (s) y cola
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 32))
+ARCHIVE_FLUSH_INTERVAL = float(os.getenv('ARCHIVE_FLUSH_INTERVAL', 2.0))
+ARCHIVE_QUEUE_SIZE = int(os.getenv('ARCHIVE_QUEUE_SIZE', 1000))
+
+# Archivar las predicciones que calcula la API (ARCHIVE_API_PREDICTIONS=1)
+ARCHIVE_API_PREDICTIONS = os.getenv('ARCHIVE_API_PREDICTIONS', '0') == '1'
+
+# Ingesta (ingest.py): muestras del día en curso y mínimo de muestras para volcar un día
+INGEST_SAMPLES_PATH = os.getenv('INGEST_SAMPLES_PATH', 'data/ingest_samples.jsonl')
+INGEST_MIN_SAMPLES = int(os.getenv('INGEST_MIN_SAMPLES', 1))
+
+# Caché de respuestas de OpenWeatherMap (segundos); también define el max-age HTTP
+WEATHER_CACHE_TTL = int(os.getenv('WEATHER_CACHE_TTL', 600))
+
+# Resiliencia frente a OpenWeatherMap
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', 8.0))            # presupuesto total por petición (s)
+UPSTREAM_TIMEOUT = float(os.getenv('UPSTREAM_TIMEOUT', 4.0))            # máximo por intento (s)
+UPSTREAM_RETRIES = int(os.getenv('UPSTREAM_RETRIES', 2))                # reintentos tras el primer intento
+UPSTREAM_BACKOFF = float(os.getenv('UPSTREAM_BACKOFF', 0.2))            # base del backoff exponencial (s)
+UPSTREAM_BACKOFF_MAX = float(os.getenv('UPSTREAM_BACKOFF_MAX', 2.0))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))  # fallos seguidos para abrir
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 30.0))     # segundos abierto antes de probar
+UPSTREAM_STALE_MAX_AGE = int(os.getenv('UPSTREAM_STALE_MAX_AGE', 6 * 3600))  # antigüedad máxima del último dato válido
+
+# Máximo de filas (escenarios × días) por petición a /predict/scenarios
+SCENARIO_MAX_ROWS = int(os.getenv('SCENARIO_MAX_ROWS', 200000))
+
+# Número máximo de respuestas serializadas que se conservan por ETag
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 64))
+
+# Métricas Prometheus: directorio compartido por los workers de gunicorn
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'airquality_metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 1.0))
+METRICS_PREFIX = 'airquality_'
+
+# Token para endpoints de administración (cabecera X-Admin-Token); sin token quedan deshabilitados
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Perfilado bajo demanda: fracción de peticiones a perfilar (0 = solo con cabecera X-Profile)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILES_PATH = os.getenv('PROFILES_PATH', 'profiles/')
+PROFILES_KEEP = int(os.getenv('PROFILES_KEEP', 50))
+
+# Memoria: iniciar tracemalloc al arrancar (TRACEMALLOC=1) y marcos por traza
+TRACEMALLOC_AT_STARTUP = os.getenv('TRACEMALLOC', '0') == '1'
+TRACEMALLOC_FRAMES = int(os.getenv('TRACEMALLOC_FRAMES', 1))
+
+# Cargar cada modelo al usarlo por primera vez en lugar de todos al arrancar
+LAZY_MODEL_LOADING = os.getenv('LAZY_MODEL_LOADING', '0') == '1'
+
+# Servir con características, escaladores y tablas de atribución en float32 (FLOAT32_SERVING=1);
+# deriva frente a float64: python benchmarks/float32_report.py
+FLOAT32_SERVING = os.getenv('FLOAT32_SERVING', '0') == '1'
+
+# Entrenamiento: procesos para ajustar los modelos en paralelo (0 = uno por CPU)
+TRAIN_WORKERS = int(os.getenv('TRAIN_WORKERS', 0))
+
+# Varias estaciones (stations.py): modelos de otras estaciones en memoria (LRU) y
+# distancia máxima (km) para enrutar lat/lon a la estación más cercana (0 = sin límite)
+STATION_MODEL_CACHE = int(os.getenv('STATION_MODEL_CACHE', 32))
+STATION_MAX_DISTANCE_KM = float(os.getenv('STATION_MAX_DISTANCE_KM', 0))
+
+# Registro de versiones: cada cuántos segundos se comprueban CURRENT/SHADOW (0 = nunca)
+MODEL_RELOAD_INTERVAL = float(os.getenv('MODEL_RELOAD_INTERVAL', 10))
+
+# Arranque: si el calentamiento falla se reintenta con backoff exponencial (s)
+WARMUP_RETRY_BASE = float(os.getenv('WARMUP_RETRY_BASE', 1.0))
+WARMUP_RETRY_MAX = float(os.getenv('WARMUP_RETRY_MAX', 60.0))
+
+# Evaluación en sombra: comparaciones en cola, historial en memoria y log JSONL ('' = sin log)
+SHADOW_QUEUE_SIZE = int(os.getenv('SHADOW_QUEUE_SIZE', 32))
+SHADOW_HISTORY = int(os.getenv('SHADOW_HISTORY', 500))
+SHADOW_LOG_PATH = os.getenv('SHADOW_LOG_PATH', 'logs/shadow_comparisons.jsonl')
+
 # Parámetros del modelo
 RANDOM_STATE = 42
 TEST_SIZE = 0.2
@@ -0,0 +1,329 @@
+"""
+Copia en memoria de los datos históricos para consultas por rango
+
+El CSV se carga una vez por proceso en arreglos columnares (uno por
+variable) ordenados por fecha. Un rango de fechas se resuelve con
+búsqueda binaria sobre el arreglo de fechas y las consultas trabajan con
+vistas de los arreglos, sin copiar ni construir un DataFrame por
+petición. Las filas se generan por bloques para las respuestas en
+streaming.
+
+Cuando el CSV crece (ingest.py solo agrega filas al final) se leen
+únicamente los bytes nuevos y se extienden los arreglos, sin recargar
+el archivo completo.
+
+Con varias estaciones (columnas lat/lon) las filas de todas comparten los
+arreglos; los promedios móviles se calculan por estación.
+"""
+
+import csv
+import io
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import config
+import stations
+
+
+# Agregaciones disponibles
+PERIODS = ('week', 'month')
+STATS = ('mean', 'min', 'max')
+
+
+class HistoricalStore:
+    """Datos históricos indexados por fecha"""
+    
+    def __init__(self, path=None):
+        self.path = path or config.DATA_PATH
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            content = f.read()
+        df = pd.read_csv(io.BytesIO(content))
+        df['date'] = pd.to_datetime(df['date'])
+        df = df.sort_values('date', kind='stable')
+        
+        self.header = list(df.columns)
+        self.mtime = stat.st_mtime_ns
+        self.size = len(content)
+        self.dates = df['date'].to_numpy(dtype='datetime64[D]')
+        self.columns = {
+            name: df[name].to_numpy(dtype=float)
+            for name in df.columns
+            if name != 'date' and pd.api.types.is_numeric_dtype(df[name])
+        }
+        # Promedios móviles por estación ((lat, lon) o None = todas las filas)
+        self._moving_averages = {}
+        self._coordinates = None
+    
+    @property
+    def generation(self):
+        """Identifica el contenido cargado (mtime, tamaño y filas) para derivar ETags"""
+        return (self.mtime, self.size, len(self.dates))
+    
+    def is_current(self):
+        """Indica si el archivo no cambió desde la última lectura"""
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns == self.mtime and stat.st_size == self.size
+    
+    def refresh(self):
+        """
+        Incorpora las filas agregadas al final del archivo
+        
+        Returns:
+            bool: True si se pudo actualizar de forma incremental; False si el
+                archivo se reescribió (menor tamaño o fechas desordenadas) y
+                hay que recargarlo completo
+        """
+        with open(self.path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < self.size:
+                return False
+            f.seek(self.size)
+            content = f.read()
+        
+        # Solo líneas completas (un escritor podría estar a mitad de una)
+        complete = content[:content.rfind(b'\n') + 1]
+        if complete.strip():
+            df = pd.read_csv(io.BytesIO(complete), names=self.header, header=None)
+            dates = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[D]')
+            # Varias estaciones comparten fecha: basta con que no retrocedan
+            if len(self.dates) and (dates[0] < self.dates[-1] or (np.diff(dates) < np.timedelta64(0, 'D')).any()):
+                return False
+            self.columns = {
+                name: np.concatenate([column, df[name].to_numpy(dtype=float)])
+                for name, column in self.columns.items()
+            }
+            self.dates = np.concatenate([self.dates, dates])
+            self._moving_averages = {}
+            self._coordinates = None
+        
+        self.size += len(complete)
+        self.mtime = stat.st_mtime_ns
+        return True
+    
+    def station_rows(self, station):
+        """
+        Posiciones de las filas de una estación
+        
+        Args:
+            station (tuple): (lat, lon) de la estación
+        
+        Returns:
+            ndarray: Índices en orden de fecha
+        """
+        if self._coordinates is None:
+            self._coordinates = stations.coordinates(self.columns, len(self.dates))
+        lat, lon = self._coordinates
+        return np.flatnonzero(
+            (lat == round(station[0], stations.COORD_DECIMALS)) & (lon == round(station[1], stations.COORD_DECIMALS))
+        )
+    
+    def moving_averages(self, features=None, station=None):
+        """
+        Promedios de los últimos 7 y 30 días (estado para los _ma7/_ma30)
+        
+        Args:
+            features (list): Variables (default: WEATHER_FEATURES)
+            station (tuple): (lat, lon) de la estación (default: todas las filas,
+                como en los datos de una sola estación)
+            
+        Returns:
+            dict: {'<feature>_ma7': valor, '<feature>_ma30': valor, ...}
+        """
+        if features is None and station in self._moving_averages:
+            return self._moving_averages[station]
+        
+        rows = None if station is None else self.station_rows(station)
+        values = {}
+        with np.errstate(invalid='ignore'):
+            for feature in features or config.WEATHER_FEATURES:
+                if feature in self.columns:
+                    column = self.columns[feature] if rows is None else self.columns[feature][rows]
+                    for window in (7, 30):
+                        tail = column[-window:]
+                        valid = tail[~np.isnan(tail)]
+                        values[f'{feature}_ma{window}'] = valid.mean() if len(valid) else np.nan
+        if features is None:
+            self._moving_averages[station] = values
+        return values
+    
+    def value_range(self, column, low=1, high=99):
+        """
+        Percentiles de una columna (rango típico, ignorando vacíos)
+        
+        Args:
+            column (str): Nombre de la columna
+            low, high (float): Percentiles inferior y superior
+            
+        Returns:
+            tuple: (mínimo, máximo)
+        """
+        values = self.columns[column]
+        values = values[~np.isnan(values)]
+        return float(np.percentile(values, low)), float(np.percentile(values, high))
+    
+    def __len__(self):
+        return len(self.dates)
+    
+    def resolve_columns(self, columns=None):
+        """
+        Valida los nombres de columnas pedidos
+        
+        Args:
+            columns (list): Nombres (default: todas)
+        
+        Returns:
+            list: Columnas en el orden del archivo
+        
+        Raises:
+            ValueError: Si alguna columna no existe
+        """
+        if not columns:
+            return list(self.columns)
+        unknown = [name for name in columns if name not in self.columns]
+        if unknown:
+            raise ValueError(f"Columnas desconocidas: {', '.join(unknown)}. Disponibles: {', '.join(self.columns)}")
+        return [name for name in self.columns if name in columns]
+    
+    def range_indices(self, start=None, end=None):
+        """
+        Posiciones [lo, hi) de las fechas dentro del rango (búsqueda binaria)
+        
+        Args:
+            start (date): Fecha inicial (inclusive, default: la primera)
+            end (date): Fecha final (inclusive, default: la última)
+        
+        Returns:
+            tuple: (lo, hi)
+        """
+        lo = 0 if start is None else int(np.searchsorted(self.dates, np.datetime64(start, 'D'), side='left'))
+        hi = len(self.dates) if end is None else int(np.searchsorted(self.dates, np.datetime64(end, 'D'), side='right'))
+        return lo, max(lo, hi)
+    
+    def iter_rows(self, lo, hi, columns, chunk_size=500):
+        """
+        Filas del rango por bloques (sin materializar el rango completo)
+        
+        Args:
+            lo, hi (int): Posiciones de range_indices
+            columns (list): Columnas a incluir
+            chunk_size (int): Filas por bloque
+        
+        Yields:
+            list: Bloque de filas (dict con 'date' en ISO y NaN como None)
+        """
+        for chunk_start in range(lo, hi, chunk_size):
+            chunk_end = min(hi, chunk_start + chunk_size)
+            dates = np.datetime_as_string(self.dates[chunk_start:chunk_end], unit='D')
+            values = [self.columns[name][chunk_start:chunk_end] for name in columns]
+            rows = []
+            for i, day in enumerate(dates):
+                row = {'date': str(day)}
+                for name, column in zip(columns, values):
+                    value = column[i]
+                    row[name] = None if np.isnan(value) else float(value)
+                rows.append(row)
+            yield rows
+    
+    def aggregate(self, lo, hi, columns, period='month', stats=STATS):
+        """
+        Estadísticos por semana (inicio lunes) o por mes
+        
+        Los NaN se ignoran; count es el número de observaciones válidas.
+        
+        Args:
+            lo, hi (int): Posiciones de range_indices
+            columns (list): Columnas a agregar
+            period (str): 'week' o 'month'
+            stats (tuple): Subconjunto de ('mean', 'min', 'max')
+        
+        Returns:
+            list: Una fila por periodo con 'period_start', '<columna>_count'
+                y '<columna>_<estadístico>'
+        """
+        dates = self.dates[lo:hi]
+        if len(dates) == 0:
+            return []
+        
+        if period == 'week':
+            # datetime64 cuenta semanas desde un jueves (1970-01-01); se desplaza al lunes
+            codes = ((dates.astype('int64') + 3) // 7) * 7 - 3
+            starts_all = codes.astype('datetime64[D]')
+        else:
+            starts_all = dates.astype('datetime64[M]').astype('datetime64[D]')
+            codes = starts_all.astype('int64')
+        boundaries = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1])
+        starts = np.datetime_as_string(starts_all[boundaries], unit='D')
+        
+        result = [{'period_start': str(start)} for start in starts]
+        for name in columns:
+            values = self.columns[name][lo:hi]
+            valid = ~np.isnan(values)
+            count = np.add.reduceat(valid.astype(int), boundaries)
+            computed = {}
+            with np.errstate(invalid='ignore', divide='ignore'):
+                if 'mean' in stats:
+                    computed['mean'] = np.add.reduceat(np.where(valid, values, 0.0), boundaries) / count
+                if 'min' in stats:
+                    computed['min'] = np.fmin.reduceat(values, boundaries)
+                if 'max' in stats:
+                    computed['max'] = np.fmax.reduceat(values, boundaries)
+            for i, row in enumerate(result):
+                row[f'{name}_count'] = int(count[i])
+                for stat in stats:
+                    value = computed[stat][i]
+                    row[f'{name}_{stat}'] = None if count[i] == 0 or np.isnan(value) else float(value)
+        return result
+
+
+def rows_to_csv(rows, fieldnames, header=False):
+    """
+    Serializa un bloque de filas como CSV
+    
+    Args:
+        rows (list): Filas (dict)
+        fieldnames (list): Columnas en orden
+        header (bool): Incluir la línea de encabezado
+    
+    Returns:
+        str: Texto CSV (None se escribe vacío)
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, lineterminator='\n')
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+# Copias compartidas del proceso: {ruta: HistoricalStore}
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path=None):
+    """
+    Copia compartida del proceso
+    
+    Si el archivo creció se incorporan solo las filas nuevas; si se
+    reescribió se vuelve a cargar completo.
+    
+    Args:
+        path (str): CSV de datos históricos (default: config.DATA_PATH)
+        
+    Returns:
+        HistoricalStore: Datos históricos en memoria
+    """
+    path = path or config.DATA_PATH
+    store = _stores.get(path)
+    if store is not None and store.is_current():
+        return store
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None or (not store.is_current() and not store.refresh()):
+            store = HistoricalStore(path)
+            _stores[path] = store
+        return store
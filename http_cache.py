@@ -0,0 +1,91 @@
+"""
+Utilidades de caché HTTP: ETag, peticiones condicionales y caché de respuestas
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import config
+
+
+def make_etag(*parts):
+    """
+    Genera un ETag fuerte a partir de las partes que identifican una respuesta
+    
+    Args:
+        *parts: Valores que determinan el contenido (instantánea, versión, parámetros)
+        
+    Returns:
+        str: ETag entre comillas, p. ej. '"3f2a..."'
+    """
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Comprueba si la cabecera If-None-Match coincide con el ETag actual
+    
+    Args:
+        if_none_match (str): Valor de la cabecera If-None-Match (puede ser None)
+        etag (str): ETag de la respuesta actual
+        
+    Returns:
+        bool: True si el cliente ya tiene esta versión
+    """
+    if not if_none_match or not etag:
+        return False
+    
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    
+    return False
+
+
+class ResponseCache:
+    """Caché LRU de cuerpos de respuesta ya serializados, indexada por ETag"""
+    
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or config.RESPONSE_CACHE_SIZE
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, etag):
+        """
+        Obtiene el cuerpo guardado para un ETag
+        
+        Args:
+            etag (str): ETag de la respuesta
+            
+        Returns:
+            bytes: Cuerpo serializado o None si no está en caché
+        """
+        with self._lock:
+            body = self._entries.get(etag)
+            if body is not None:
+                self._entries.move_to_end(etag)
+            return body
+    
+    def put(self, etag, body):
+        """
+        Guarda el cuerpo serializado de una respuesta
+        
+        Args:
+            etag (str): ETag de la respuesta
+            body (bytes): Cuerpo serializado
+        """
+        with self._lock:
+            self._entries[etag] = body
+            self._entries.move_to_end(etag)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,284 @@
+"""
+Ingesta de observaciones al histórico
+
+Pensado para ejecutarse periódicamente (cron o WebJob programado). Cada
+ejecución toma una muestra del clima y la contaminación actuales de
+OpenWeatherMap (con las mismas conversiones de unidades que usa la API)
+y la guarda en un archivo de muestras. Los días ya cerrados se resumen
+como promedio diario y se agregan al final del CSV histórico, sin
+reescribirlo; las fechas que ya están en el archivo se omiten.
+
+La API y las predicciones ven los días nuevos sin reiniciar:
+historical_store lee solo las filas agregadas y actualiza los promedios
+móviles de 7 y 30 días.
+
+Uso:
+    python ingest.py                    # muestra + volcado de días cerrados
+    python ingest.py --sample-only
+    python ingest.py --flush-only --include-today
+
+Ejemplo de cron (una muestra por hora):
+    0 * * * * cd /ruta/al/proyecto && python ingest.py >> logs/ingest.log 2>&1
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from collections import defaultdict
+from datetime import date
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+import config
+from weather_api import WeatherAPI
+
+
+# Columnas de contaminación que se toman de /air_pollution
+POLLUTION_COLUMNS = ['NO2', 'CO', 'O3', 'SO2']
+
+
+def take_sample(api=None):
+    """
+    Lee el clima y la contaminación actuales
+    
+    Se usa un cliente nuevo para no registrar datos de la caché de un
+    fallo anterior: si OpenWeatherMap no responde no hay muestra.
+    
+    Args:
+        api (WeatherAPI): Cliente (default: uno nuevo)
+    
+    Returns:
+        dict: Muestra con 'timestamp' en ISO o None si no hay datos del clima
+    """
+    api = api or WeatherAPI()
+    weather = api.get_current_weather()
+    if weather is None:
+        return None
+    pollution = api.get_air_pollution() or {}
+    
+    sample = {'timestamp': weather['timestamp'].isoformat(timespec='seconds')}
+    for feature in config.WEATHER_FEATURES:
+        sample[feature] = weather[feature]
+    for column in POLLUTION_COLUMNS:
+        if column in pollution:
+            sample[column] = pollution[column]
+    return sample
+
+
+def read_samples(path):
+    """
+    Muestras pendientes de volcar
+    
+    Args:
+        path (str): Archivo JSONL de muestras
+    
+    Returns:
+        list: Muestras (las líneas incompletas se ignoran)
+    """
+    if not os.path.exists(path):
+        return []
+    samples = []
+    with open(path) as f:
+        for line in f:
+            try:
+                samples.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Advertencia: línea inválida en {path}")
+    return samples
+
+
+def append_sample(sample, path):
+    """Agrega una muestra al archivo de muestras"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(sample) + '\n')
+
+
+def daily_rows(samples, min_samples=1):
+    """
+    Promedio diario de las muestras
+    
+    Args:
+        samples (list): Muestras de take_sample
+        min_samples (int): Muestras mínimas para aceptar un día
+    
+    Returns:
+        dict: {fecha: {columna: promedio}} solo con los días aceptados
+    """
+    by_day = defaultdict(list)
+    for sample in samples:
+        by_day[sample['timestamp'][:10]].append(sample)
+    
+    rows = {}
+    for day, day_samples in sorted(by_day.items()):
+        if len(day_samples) < min_samples:
+            print(f"Advertencia: {day} tiene {len(day_samples)} muestras (mínimo {min_samples}); se omite")
+            continue
+        row = {}
+        for column in config.WEATHER_FEATURES + POLLUTION_COLUMNS:
+            values = [s[column] for s in day_samples if s.get(column) is not None]
+            row[column] = sum(values) / len(values) if values else math.nan
+        rows[day] = row
+    return rows
+
+
+def read_header(path):
+    """Columnas del CSV histórico (primera línea)"""
+    with open(path) as f:
+        return f.readline().strip().split(',')
+
+
+def last_date(f):
+    """
+    Fecha de la última fila del CSV leyendo solo el final del archivo
+    
+    Args:
+        f (file): Archivo abierto en modo binario
+    
+    Returns:
+        str: Fecha ISO o None si el archivo no tiene filas
+    """
+    end = f.seek(0, os.SEEK_END)
+    block = 4096
+    while True:
+        start = max(0, end - block)
+        f.seek(start)
+        lines = f.read(end - start).rstrip(b'\n').split(b'\n')
+        if len(lines) > 1 or start == 0:
+            break
+        block *= 2
+    last = lines[-1].decode()
+    if start == 0 and len(lines) == 1:
+        return None
+    return last.split(',', 1)[0]
+
+
+def format_value(value):
+    """Valor para el CSV (NaN vacío, como en el dataset)"""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    return repr(float(value))
+
+
+def append_rows(rows, path=None):
+    """
+    Agrega días al final del CSV histórico
+    
+    Se omiten los días que no son posteriores a la última fecha del
+    archivo, de modo que repetir la ejecución no duplica filas. El
+    archivo queda bloqueado durante la escritura (solo en POSIX).
+    
+    Args:
+        rows (dict): {fecha: {columna: valor}} de daily_rows
+        path (str): CSV histórico (default: config.DATA_PATH)
+    
+    Returns:
+        list: Fechas agregadas
+    """
+    path = path or config.DATA_PATH
+    header = read_header(path)
+    fixed = {'lon': config.LONGITUDE, 'lat': config.LATITUDE}
+    
+    with open(path, 'rb+') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            last = last_date(f)
+            new_days = [day for day in sorted(rows) if last is None or day > last]
+            if not new_days:
+                return []
+            
+            lines = []
+            for day in new_days:
+                row = {**fixed, **rows[day]}
+                values = [day] + [format_value(row.get(column)) for column in header[1:]]
+                lines.append(','.join(values))
+            
+            end = f.seek(0, os.SEEK_END)
+            prefix = b''
+            if end > 0:
+                f.seek(end - 1)
+                if f.read(1) != b'\n':
+                    prefix = b'\n'
+            f.write(prefix + ('\n'.join(lines) + '\n').encode())
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    return new_days
+
+
+def flush(samples_path=None, data_path=None, include_today=False, min_samples=None):
+    """
+    Vuelca los días cerrados al CSV histórico
+    
+    Las muestras de los días cerrados (volcados, ya presentes en el CSV
+    o sin muestras suficientes) se eliminan del archivo de muestras; las
+    del día en curso se conservan.
+    
+    Args:
+        samples_path (str): Archivo de muestras (default: INGEST_SAMPLES_PATH)
+        data_path (str): CSV histórico (default: config.DATA_PATH)
+        include_today (bool): Volcar también el día en curso
+        min_samples (int): Muestras mínimas por día (default: INGEST_MIN_SAMPLES)
+    
+    Returns:
+        list: Fechas agregadas
+    """
+    samples_path = samples_path or config.INGEST_SAMPLES_PATH
+    min_samples = config.INGEST_MIN_SAMPLES if min_samples is None else min_samples
+    samples = read_samples(samples_path)
+    today = date.today().isoformat()
+    
+    closed = [s for s in samples if include_today or s['timestamp'][:10] < today]
+    rows = daily_rows(closed, min_samples)
+    appended = append_rows(rows, data_path) if rows else []
+    
+    # Los días cerrados sin muestras suficientes ya no se pueden completar
+    done = set(rows) | {s['timestamp'][:10] for s in closed if s['timestamp'][:10] < today}
+    remaining = [s for s in samples if s['timestamp'][:10] not in done]
+    if len(remaining) != len(samples):
+        tmp_path = f"{samples_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for sample in remaining:
+                f.write(json.dumps(sample) + '\n')
+        os.replace(tmp_path, samples_path)
+    return appended
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Ingesta de observaciones al histórico")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--sample-only', action='store_true', help="Solo tomar una muestra")
+    group.add_argument('--flush-only', action='store_true', help="Solo volcar los días cerrados")
+    parser.add_argument('--include-today', action='store_true', help="Volcar también el día en curso")
+    args = parser.parse_args()
+    
+    if not args.flush_only:
+        sample = take_sample()
+        if sample is None:
+            print("❌ No se pudo obtener una muestra de OpenWeatherMap")
+            if args.sample_only:
+                return 1
+        else:
+            append_sample(sample, config.INGEST_SAMPLES_PATH)
+            print(f"✅ Muestra registrada: {sample['timestamp']}")
+    
+    if not args.sample_only:
+        appended = flush(include_today=args.include_today)
+        if appended:
+            print(f"✅ Días agregados al histórico: {', '.join(appended)}")
+        else:
+            print("ℹ️  No hay días nuevos para agregar")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
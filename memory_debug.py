@@ -0,0 +1,222 @@
+"""
+Instrumentación de memoria de los workers
+
+Reporta el RSS del proceso, los principales puntos de asignación según
+tracemalloc y el tamaño de los objetos residentes (modelos, datos
+históricos, cachés). Guarda la última instantánea de tracemalloc para
+poder comparar dos llamadas consecutivas y localizar fugas.
+"""
+
+import gc
+import os
+import sys
+import threading
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import config
+
+
+# Última instantánea de tracemalloc (para el modo diferencia)
+_last_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def start_tracing():
+    """
+    Inicia tracemalloc si no está activo
+    
+    Returns:
+        bool: True si se acaba de iniciar
+    """
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(config.TRACEMALLOC_FRAMES)
+    return True
+
+
+def stop_tracing():
+    """Detiene tracemalloc y descarta la instantánea guardada"""
+    global _last_snapshot
+    with _snapshot_lock:
+        _last_snapshot = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def process_memory():
+    """
+    Memoria del proceso actual
+    
+    Returns:
+        dict: rss_bytes y peak_rss_bytes (None si no se pueden leer)
+    """
+    result = {'rss_bytes': None, 'peak_rss_bytes': None}
+    
+    # Linux: /proc/self/status tiene VmRSS y VmHWM en kB
+    try:
+        with open('/proc/self/status', 'r', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    result['rss_bytes'] = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    result['peak_rss_bytes'] = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    
+    if result['peak_rss_bytes'] is None:
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # ru_maxrss está en kB en Linux y en bytes en macOS
+            result['peak_rss_bytes'] = peak if sys.platform == 'darwin' else peak * 1024
+        except (ImportError, OSError):
+            pass
+    
+    return result
+
+
+def deep_sizeof(obj, _seen=None):
+    """
+    Estima el tamaño en memoria de un objeto y todo lo que referencia
+    
+    Cuenta los buffers de arrays de NumPy y DataFrames de pandas y recorre
+    contenedores, atributos y el estado de objetos de extensión (como los
+    árboles de sklearn, que exponen sus arrays mediante __getstate__).
+    
+    Args:
+        obj: Objeto a medir
+    
+    Returns:
+        int: Tamaño aproximado en bytes
+    """
+    if _seen is None:
+        # id -> objeto: se conserva la referencia para que los objetos
+        # temporales (p. ej. el estado de __getstate__) no reutilicen ids
+        _seen = {}
+    if id(obj) in _seen:
+        return 0
+    _seen[id(obj)] = obj
+    
+    if isinstance(obj, np.ndarray):
+        size = sys.getsizeof(obj)
+        if isinstance(obj.base, np.ndarray):
+            # Vista: el buffer pertenece al array base (se cuenta una sola vez)
+            size += deep_sizeof(obj.base, _seen)
+        elif obj.dtype != object:
+            # Buffer propio o expuesto por un objeto de extensión (árboles de sklearn)
+            size += obj.nbytes
+        if obj.dtype == object:
+            size += sum(deep_sizeof(item, _seen) for item in obj.ravel())
+        return size
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return sys.getsizeof(obj)
+    
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, _seen) + deep_sizeof(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, _seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), _seen)
+    elif hasattr(obj, '__getstate__'):
+        try:
+            state = obj.__getstate__()
+        except TypeError:
+            state = None
+        if state is not None and state is not obj:
+            size += deep_sizeof(state, _seen)
+    return size
+
+
+def resident_sizes(objects, groups=None):
+    """
+    Tamaño de los objetos residentes del worker
+    
+    Args:
+        objects (dict): Nombre -> objeto medido en conjunto
+        groups (dict): Nombre -> dict de objetos medidos por separado
+            (p. ej. un modelo por contaminante)
+    
+    Returns:
+        dict: Nombre -> bytes, o {'total': ..., 'items': {...}} para los grupos
+    """
+    sizes = {name: deep_sizeof(obj) for name, obj in objects.items()}
+    for name, items in (groups or {}).items():
+        item_sizes = {str(key): deep_sizeof(value) for key, value in items.items()}
+        sizes[name] = {'total': sum(item_sizes.values()), 'items': item_sizes}
+    return sizes
+
+
+def _format_stat(stat, is_diff=False):
+    """Convierte una estadística de tracemalloc en un diccionario"""
+    frame = stat.traceback[0]
+    entry = {
+        'location': f'{frame.filename}:{frame.lineno}',
+        'size_bytes': stat.size,
+        'count': stat.count,
+    }
+    if is_diff:
+        entry['size_diff_bytes'] = stat.size_diff
+        entry['count_diff'] = stat.count_diff
+    return entry
+
+
+def memory_report(objects=None, groups=None, top=20, diff=False):
+    """
+    Informe de memoria del worker
+    
+    Args:
+        objects (dict): Objetos residentes a medir
+        groups (dict): Grupos de objetos residentes medidos por elemento
+        top (int): Número de puntos de asignación a listar
+        diff (bool): Comparar con la instantánea de la llamada anterior
+    
+    Returns:
+        dict: Informe con RSS, tracemalloc y tamaños residentes
+    """
+    global _last_snapshot
+    
+    report = {
+        'pid': os.getpid(),
+        'process': process_memory(),
+        'gc_objects': len(gc.get_objects()),
+        'gc_counts': list(gc.get_count()),
+        'resident_objects': resident_sizes(objects or {}, groups),
+        'tracemalloc': {'tracing': tracemalloc.is_tracing()},
+    }
+    
+    if not tracemalloc.is_tracing():
+        return report
+    
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ))
+    
+    report['tracemalloc'].update({
+        'current_bytes': current,
+        'peak_bytes': peak,
+        'top_allocators': [_format_stat(stat) for stat in snapshot.statistics('lineno')[:top]],
+    })
+    
+    with _snapshot_lock:
+        previous = _last_snapshot
+        _last_snapshot = snapshot
+    
+    if diff:
+        if previous is None:
+            report['tracemalloc']['diff'] = None
+            report['tracemalloc']['diff_note'] = 'Primera instantánea guardada; vuelva a llamar para comparar'
+        else:
+            stats = snapshot.compare_to(previous, 'lineno')
+            report['tracemalloc']['diff'] = [_format_stat(stat, is_diff=True) for stat in stats[:top]]
+    
+    return report
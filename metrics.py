@@ -0,0 +1,459 @@
+"""
+Registro ligero de métricas en formato Prometheus
+
+Cada proceso (worker de gunicorn) acumula sus métricas en memoria y
+las vuelca periódicamente a un archivo propio en METRICS_DIR. El
+endpoint /metrics combina los archivos de todos los workers vivos, de
+modo que el resultado no depende de qué worker atienda la petición.
+
+Cuando un worker termina, sus contadores e histogramas se suman a
+retired.json (como el modo multiproceso de prometheus_client) antes de
+borrar su archivo: los totales nunca bajan, así que Prometheus no ve un
+reinicio falso. Sus gauges se descartan.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+import config
+
+
+# Límites de los buckets de latencia (segundos)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Totales de los workers terminados y bloqueo para actualizarlos
+RETIRED_FILENAME = 'retired.json'
+RETIRED_LOCK_FILENAME = 'retired.lock'
+# Workers ya sumados que se recuerdan (evita sumar dos veces el mismo archivo)
+RETIRED_KEEP = 1000
+
+# Descripciones para las líneas # HELP
+METRIC_HELP = {
+    'stage_seconds': 'Latencia por etapa del pipeline de predicción',
+    'upstream_requests_total': 'Peticiones a OpenWeatherMap por endpoint',
+    'upstream_errors_total': 'Errores de OpenWeatherMap por endpoint',
+    'upstream_retries_total': 'Reintentos de llamadas a OpenWeatherMap por endpoint',
+    'upstream_short_circuits_total': 'Llamadas rechazadas por circuito abierto',
+    'upstream_deadline_exceeded_total': 'Llamadas no realizadas por plazo agotado',
+    'upstream_fallbacks_total': 'Respuestas servidas con los últimos datos válidos',
+    'upstream_circuit_state': 'Estado del circuito por endpoint (0 cerrado, 1 semiabierto, 2 abierto)',
+    'weather_cache_requests_total': 'Consultas a la caché meteorológica (hit/miss)',
+    'weather_cache_hit_ratio': 'Proporción de aciertos de la caché meteorológica',
+    'response_cache_requests_total': 'Respuestas servidas por ETag (not_modified/hit/miss)',
+    'response_cache_hit_ratio': 'Proporción de respuestas servidas sin recalcular',
+    'prediction_sanity_flags_total': 'Predicciones fuera del rango climatológico por contaminante',
+    'prediction_fallbacks_total': 'Predicciones servidas sin modelo por origen',
+    'model_info': 'Versión de los modelos cargados en cada worker',
+    'models_loaded': 'Número de modelos cargados en cada worker',
+    'station_models_cached': 'Estaciones adicionales con modelos en memoria en cada worker',
+    'scenario_rows_total': 'Filas evaluadas en /predict/scenarios',
+    'archive_writes_total': 'Ejecuciones escritas en el archivo de predicciones',
+    'archive_dropped_total': 'Ejecuciones descartadas por cola de archivo llena',
+    'archive_write_errors_total': 'Ejecuciones que no se pudieron archivar',
+    'archive_queue_depth': 'Ejecuciones pendientes de archivar',
+    'archive_queue_lag_seconds': 'Retraso entre encolar una ejecución y escribirla',
+    'worker_ready': 'Worker con modelos cargados y calentados (1) o iniciándose (0)',
+    'startup_seconds': 'Duración de la carga y el calentamiento de cada worker',
+    'model_swaps_total': 'Cambios de versión de modelos en caliente',
+    'shadow_comparisons_total': 'Predicciones comparadas con la versión en sombra',
+    'shadow_dropped_total': 'Comparaciones en sombra descartadas por cola llena',
+    'shadow_errors_total': 'Errores al evaluar la versión en sombra',
+    'shadow_predict_seconds': 'Tiempo de predicción de producción y de la versión en sombra',
+    'shadow_mean_rel_diff': 'Diferencia relativa media con la versión en sombra por contaminante',
+}
+
+# Contadores a partir de los cuales se derivan proporciones de aciertos
+HIT_RATIOS = {
+    'weather_cache_hit_ratio': ('weather_cache_requests_total', ('hit',)),
+    'response_cache_hit_ratio': ('response_cache_requests_total', ('hit', 'not_modified')),
+}
+
+
+def _label_key(labels):
+    """Convierte un diccionario de etiquetas en una clave ordenada y hashable"""
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def _format_labels(label_key, extra=None):
+    """Formatea etiquetas en la sintaxis de Prometheus"""
+    items = list(label_key)
+    if extra:
+        items.extend(extra)
+    if not items:
+        return ''
+    escaped = []
+    for key, value in items:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def _pid_alive(pid):
+    """Comprueba si un proceso sigue vivo"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsRegistry:
+    """Registro de contadores, gauges e histogramas del proceso actual"""
+    
+    def __init__(self, directory=None, flush_interval=None):
+        self.directory = directory or config.METRICS_DIR
+        self.flush_interval = config.METRICS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = 0.0
+        # Identifica esta ejecución del proceso aunque el pid se reutilice
+        self._started_at = time.time()
+    
+    # ---------- Registro ----------
+    
+    def inc(self, name, value=1, **labels):
+        """
+        Incrementa un contador
+        
+        Args:
+            name (str): Nombre de la métrica (sin prefijo)
+            value (float): Incremento
+            **labels: Etiquetas de la serie
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._maybe_flush()
+    
+    def set_gauge(self, name, value, **labels):
+        """
+        Fija el valor de un gauge
+        
+        Args:
+            name (str): Nombre de la métrica (sin prefijo)
+            value (float): Valor actual
+            **labels: Etiquetas de la serie
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = value
+        self._maybe_flush()
+    
+    def clear_gauge(self, name):
+        """Elimina todas las series de un gauge (p. ej. al cambiar de versión)"""
+        with self._lock:
+            for key in [k for k in self._gauges if k[0] == name]:
+                del self._gauges[key]
+    
+    def observe(self, name, value, **labels):
+        """
+        Registra una observación en un histograma de latencia
+        
+        Args:
+            name (str): Nombre de la métrica (sin prefijo)
+            value (float): Valor observado en segundos
+            **labels: Etiquetas de la serie
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+                self._histograms[key] = histogram
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+        self._maybe_flush()
+    
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Mide la duración de un bloque y la registra en un histograma
+        
+        Args:
+            name (str): Nombre del histograma
+            **labels: Etiquetas de la serie
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+    
+    # ---------- Persistencia entre workers ----------
+    
+    def _snapshot(self):
+        """Estado del proceso en un formato serializable"""
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'started_at': self._started_at,
+                'counters': [[n, list(map(list, l)), v] for (n, l), v in self._counters.items()],
+                'gauges': [[n, list(map(list, l)), v] for (n, l), v in self._gauges.items()],
+                'histograms': [
+                    [n, list(map(list, l)), h['buckets'], h['sum'], h['count']]
+                    for (n, l), h in self._histograms.items()
+                ],
+            }
+    
+    def _maybe_flush(self):
+        """Vuelca el estado a disco como mucho una vez por intervalo"""
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+    
+    def flush(self):
+        """
+        Escribe el estado de este proceso en su archivo (escritura atómica)
+        
+        Los hilos de un mismo proceso se serializan y cada escritura usa un
+        temporal propio, de modo que nunca se reemplaza el archivo con uno a medias.
+        """
+        with self._flush_lock:
+            self._last_flush = time.time()
+            tmp_path = None
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f'metrics_{os.getpid()}.json')
+                fd, tmp_path = tempfile.mkstemp(prefix=f'.metrics_{os.getpid()}.', suffix='.tmp', dir=self.directory)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._snapshot(), f)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Advertencia: no se pudieron guardar las métricas: {e}")
+                if tmp_path is not None:
+                    try:
+                        os.remove(tmp_path)
+                    except OSError:
+                        pass
+    
+    def _read_json(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    @contextmanager
+    def _retired_lock(self):
+        """Bloqueo entre procesos para actualizar retired.json"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, RETIRED_LOCK_FILENAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _retire(self, paths):
+        """
+        Suma los contadores e histogramas de workers terminados a retired.json
+        
+        Cada worker se identifica por pid y hora de inicio; si ya se sumó
+        (otro worker lo retiró a la vez) solo se borra su archivo.
+        
+        Args:
+            paths (list): Archivos de workers que ya no están vivos
+        """
+        with self._retired_lock():
+            retired_path = os.path.join(self.directory, RETIRED_FILENAME)
+            retired = self._read_json(retired_path) or {'workers': [], 'counters': [], 'histograms': []}
+            seen = set(retired['workers'])
+            counters = {(n, tuple(map(tuple, l))): v for n, l, v in retired['counters']}
+            histograms = {(n, tuple(map(tuple, l))): [b, t, c] for n, l, b, t, c in retired['histograms']}
+            
+            changed = False
+            for path in paths:
+                snapshot = self._read_json(path)
+                if snapshot is None:
+                    continue
+                worker = f"{snapshot.get('pid')}:{snapshot.get('started_at')}"
+                if worker not in seen:
+                    for name, labels, value in snapshot['counters']:
+                        key = (name, tuple(map(tuple, labels)))
+                        counters[key] = counters.get(key, 0) + value
+                    for name, labels, buckets, total, count in snapshot['histograms']:
+                        key = (name, tuple(map(tuple, labels)))
+                        merged = histograms.setdefault(key, [[0] * len(LATENCY_BUCKETS), 0.0, 0])
+                        merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+                        merged[1] += total
+                        merged[2] += count
+                    retired['workers'].append(worker)
+                    seen.add(worker)
+                    changed = True
+            
+            if changed:
+                retired['workers'] = retired['workers'][-RETIRED_KEEP:]
+                retired['counters'] = [[n, list(map(list, l)), v] for (n, l), v in counters.items()]
+                retired['histograms'] = [[n, list(map(list, l)), *h] for (n, l), h in histograms.items()]
+                fd, tmp_path = tempfile.mkstemp(prefix='.retired.', suffix='.tmp', dir=self.directory)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(retired, f)
+                os.replace(tmp_path, retired_path)
+            
+            # Solo después de guardar los totales
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    
+    def _collect(self):
+        """
+        Lee y combina los estados de todos los workers vivos y los totales
+        de los terminados (retired.json)
+        
+        Returns:
+            tuple: (counters, gauges, histograms) combinados
+        """
+        self.flush()
+        
+        snapshots = []
+        dead = []
+        try:
+            filenames = os.listdir(self.directory)
+        except OSError:
+            filenames = []
+        
+        for filename in filenames:
+            if not (filename.startswith('metrics_') and filename.endswith('.json')):
+                continue
+            path = os.path.join(self.directory, filename)
+            snapshot = self._read_json(path)
+            if snapshot is None:
+                continue
+            if not _pid_alive(snapshot.get('pid', -1)):
+                # Worker reciclado: sus totales pasan a retired.json (no bajan)
+                dead.append(path)
+                continue
+            snapshots.append(snapshot)
+        
+        if dead:
+            try:
+                self._retire(dead)
+            except OSError as e:
+                print(f"Advertencia: no se pudieron retirar las métricas de workers terminados: {e}")
+        
+        retired = self._read_json(os.path.join(self.directory, RETIRED_FILENAME))
+        if retired is not None:
+            snapshots.append({'pid': None, 'counters': retired['counters'], 'gauges': [],
+                              'histograms': retired['histograms']})
+        
+        counters, gauges, histograms = {}, {}, {}
+        for snapshot in snapshots:
+            pid_label = ('pid', str(snapshot['pid']))
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, value in snapshot['gauges']:
+                key = (name, tuple(map(tuple, labels)) + (pid_label,))
+                gauges[key] = value
+            for name, labels, buckets, total, count in snapshot['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(
+                    key, {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+                )
+                merged['buckets'] = [a + b for a, b in zip(merged['buckets'], buckets)]
+                merged['sum'] += total
+                merged['count'] += count
+        
+        return counters, gauges, histograms
+    
+    # ---------- Exportación ----------
+    
+    def render(self):
+        """
+        Genera el texto de exposición de Prometheus para todos los workers
+        
+        Returns:
+            str: Métricas en formato text/plain version=0.0.4
+        """
+        counters, gauges, histograms = self._collect()
+        prefix = config.METRICS_PREFIX
+        lines = []
+        
+        def header(name, kind):
+            lines.append(f'# HELP {prefix}{name} {METRIC_HELP.get(name, name)}')
+            lines.append(f'# TYPE {prefix}{name} {kind}')
+        
+        for name in sorted({n for n, _ in counters}):
+            header(name, 'counter')
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f'{prefix}{name}{_format_labels(labels)} {value}')
+        
+        for ratio_name, (counter_name, hit_results) in HIT_RATIOS.items():
+            hits = sum(v for (n, l), v in counters.items()
+                       if n == counter_name and dict(l).get('result') in hit_results)
+            total = sum(v for (n, _), v in counters.items() if n == counter_name)
+            if total:
+                header(ratio_name, 'gauge')
+                lines.append(f'{prefix}{ratio_name} {hits / total:.6f}')
+        
+        for name in sorted({n for n, _ in gauges}):
+            header(name, 'gauge')
+            for (n, labels), value in sorted(gauges.items()):
+                if n == name:
+                    lines.append(f'{prefix}{name}{_format_labels(labels)} {value}')
+        
+        for name in sorted({n for n, _ in histograms}):
+            header(name, 'histogram')
+            for (n, labels), histogram in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+                    cumulative += count
+                    lines.append(
+                        f'{prefix}{name}_bucket{_format_labels(labels, [("le", repr(bound))])} {cumulative}'
+                    )
+                lines.append(
+                    f'{prefix}{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {histogram["count"]}'
+                )
+                lines.append(f'{prefix}{name}_sum{_format_labels(labels)} {histogram["sum"]}')
+                lines.append(f'{prefix}{name}_count{_format_labels(labels)} {histogram["count"]}')
+        
+        return '\n'.join(lines) + '\n'
+
+
+# Registro global del proceso
+REGISTRY = MetricsRegistry()
+
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set_gauge
+clear_gauge = REGISTRY.clear_gauge
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+render = REGISTRY.render
+flush = REGISTRY.flush
+
+
+def stage_timer(stage):
+    """
+    Atajo para medir una etapa del pipeline de predicción
+    
+    Args:
+        stage (str): upstream_fetch, model_load, historical_load,
+            feature_build, scaler_transform, model_predict, explain, aqi o
+            serialization
+    """
+    return REGISTRY.timer('stage_seconds', stage=stage)
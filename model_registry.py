@@ -0,0 +1,432 @@
+"""
+Registro de versiones de modelos
+
+Cada versión es un directorio inmutable en MODEL_PATH/versions/<versión>/
+con los modelos, escaladores, columnas de características, climatología y
+un manifest.json (archivos con sha256, contaminantes, métricas). Con
+varias estaciones, los modelos de cada estación que no es la principal
+van en stations/<estación>/ y el índice en stations.joblib. Una
+versión se escribe primero en un directorio temporal y se publica con un
+rename, de modo que ningún worker puede leer una versión a medias.
+
+Los punteros CURRENT (producción) y SHADOW (candidata en modo sombra) son
+archivos de texto con el nombre de la versión, reemplazados con
+os.replace (atómico). Sin CURRENT se usan los archivos planos de
+MODEL_PATH (formato anterior al registro).
+
+versions/ y los punteros no se versionan en git: el despliegue (workflows
+de Azure) publica los archivos planos. Por eso promote() también los
+reemplaza con los de la versión promovida (export_flat), y esos son los
+archivos que hay que commitear para llevarla a producción.
+
+Uso:
+    python model_registry.py list
+    python model_registry.py import              # registrar los modelos planos de models/
+    python model_registry.py promote <versión>       # también actualiza los archivos planos
+    python model_registry.py export [<versión>]      # solo actualizar los archivos planos
+    python model_registry.py shadow <versión>    # o: shadow --clear
+    python model_registry.py verify <versión>
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+import config
+
+
+VERSIONS_DIRNAME = 'versions'
+MANIFEST_FILENAME = 'manifest.json'
+CURRENT_POINTER = 'CURRENT'
+SHADOW_POINTER = 'SHADOW'
+
+# Archivos que forman una versión
+MODEL_FILE_PREFIXES = ('model_', 'scaler_')
+EXTRA_FILES = ('feature_columns.joblib', 'climatology.joblib', 'stations.joblib')
+# Subdirectorio con los modelos de las demás estaciones (stations.py)
+STATIONS_DIRNAME = 'stations'
+
+
+def versions_dir():
+    """Directorio que contiene todas las versiones"""
+    return os.path.join(config.MODEL_PATH, VERSIONS_DIRNAME)
+
+
+def version_path(version):
+    """Directorio de una versión"""
+    return os.path.join(versions_dir(), version)
+
+
+def _is_model_file(filename):
+    return filename.endswith('.joblib') and (
+        filename.startswith(MODEL_FILE_PREFIXES) or filename in EXTRA_FILES
+    )
+
+
+def model_files(directory):
+    """
+    Archivos de modelos de un directorio y de sus subdirectorios de estación
+    
+    Returns:
+        list: Rutas relativas en orden estable (primero los de la raíz)
+    """
+    files = []
+    for root, dirs, names in os.walk(directory):
+        # En la raíz solo stations/ (en MODEL_PATH también está versions/)
+        dirs[:] = sorted(d for d in dirs if d == STATIONS_DIRNAME or root != directory)
+        for name in sorted(names):
+            if _is_model_file(name):
+                files.append(os.path.relpath(os.path.join(root, name), directory))
+    return files
+
+
+def copy_model_files(source, target):
+    """Copia los archivos de modelos de source a target (conservando subdirectorios)"""
+    for filename in model_files(source):
+        destination = os.path.join(target, filename)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copy2(os.path.join(source, filename), destination)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ---------- Punteros ----------
+
+def _read_pointer(name):
+    try:
+        with open(os.path.join(config.MODEL_PATH, name), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _write_pointer(name, version):
+    """Reemplaza un puntero de forma atómica (o lo elimina si version es None)"""
+    path = os.path.join(config.MODEL_PATH, name)
+    if version is None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+    
+    if not os.path.isfile(os.path.join(version_path(version), MANIFEST_FILENAME)):
+        raise ValueError(f"La versión '{version}' no existe")
+    
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', dir=config.MODEL_PATH)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def current_version():
+    """Versión en producción o None (modelos planos)"""
+    return _read_pointer(CURRENT_POINTER)
+
+
+def shadow_version():
+    """Versión candidata en modo sombra o None"""
+    return _read_pointer(SHADOW_POINTER)
+
+
+def promote(version, export=True):
+    """
+    Pone una versión en producción
+    
+    Los workers la cargan en segundo plano en su siguiente comprobación
+    (MODEL_RELOAD_INTERVAL) y la intercambian sin reiniciar.
+    
+    Args:
+        version (str): Versión a promover
+        export (bool): Reemplazar también los archivos planos de MODEL_PATH
+            (los que se despliegan)
+    
+    Returns:
+        list: Archivos planos actualizados (vacía si export es False)
+    """
+    _write_pointer(CURRENT_POINTER, version)
+    return export_flat(version) if export else []
+
+
+def export_flat(version=None):
+    """
+    Copia los archivos de una versión a MODEL_PATH (formato plano)
+    
+    Cada archivo se escribe con un nombre temporal y se reemplaza con
+    os.replace. Los archivos planos que la versión no tiene (p. ej.
+    stations.joblib y stations/ de una versión anterior con varias
+    estaciones) se eliminan, de modo que MODEL_PATH queda igual a la versión.
+    
+    Args:
+        version (str): Versión a exportar (default: la de CURRENT)
+    
+    Returns:
+        list: Rutas relativas de los archivos exportados
+    
+    Raises:
+        ValueError: Si no hay versión o está incompleta
+    """
+    version = version or current_version()
+    if version is None:
+        raise ValueError("No hay versión en producción que exportar")
+    problems = verify(version)
+    if problems:
+        raise ValueError(f"La versión '{version}' no se puede exportar: {'; '.join(problems)}")
+    
+    source = version_path(version)
+    exported = model_files(source)
+    for filename in exported:
+        destination = os.path.join(config.MODEL_PATH, filename)
+        directory = os.path.dirname(destination)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.export-', dir=directory)
+        os.close(fd)
+        shutil.copy2(os.path.join(source, filename), tmp_path)
+        os.replace(tmp_path, destination)
+    
+    for filename in set(model_files(config.MODEL_PATH)) - set(exported):
+        os.remove(os.path.join(config.MODEL_PATH, filename))
+    stations_dir = os.path.join(config.MODEL_PATH, STATIONS_DIRNAME)
+    if os.path.isdir(stations_dir) and not any(f.startswith(STATIONS_DIRNAME + os.sep) for f in exported):
+        shutil.rmtree(stations_dir)
+    return exported
+
+
+def set_shadow(version):
+    """Fija (o elimina, con None) la versión candidata en modo sombra"""
+    _write_pointer(SHADOW_POINTER, version)
+
+
+def resolve(version=None):
+    """
+    Directorio de modelos a cargar
+    
+    Args:
+        version (str): Versión concreta (default: la de CURRENT)
+    
+    Returns:
+        tuple: (directorio, versión) — versión es None para los modelos planos
+    """
+    version = version or current_version()
+    if version is None:
+        return config.MODEL_PATH, None
+    return version_path(version), version
+
+
+# ---------- Versiones ----------
+
+def read_manifest(version):
+    """Manifest de una versión (None si no existe)"""
+    try:
+        with open(os.path.join(version_path(version), MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_versions():
+    """
+    Versiones registradas, de la más reciente a la más antigua
+    
+    Returns:
+        list: Manifests con las marcas 'current' y 'shadow'
+    """
+    try:
+        names = os.listdir(versions_dir())
+    except OSError:
+        return []
+    
+    current, shadow = current_version(), shadow_version()
+    manifests = []
+    for name in names:
+        if name.startswith('.'):
+            continue
+        manifest = read_manifest(name)
+        if manifest is None:
+            continue
+        manifest['current'] = name == current
+        manifest['shadow'] = name == shadow
+        manifests.append(manifest)
+    return sorted(manifests, key=lambda m: m.get('created_at', ''), reverse=True)
+
+
+def staging_dir():
+    """
+    Directorio temporal donde escribir una versión nueva
+    
+    Está dentro de versions/ (mismo sistema de archivos) para que la
+    publicación sea un rename atómico.
+    """
+    os.makedirs(versions_dir(), exist_ok=True)
+    return tempfile.mkdtemp(prefix='.staging-', dir=versions_dir())
+
+
+def publish(directory, metadata=None, version=None):
+    """
+    Registra como versión nueva los modelos escritos en un directorio de staging
+    
+    Args:
+        directory (str): Directorio devuelto por staging_dir()
+        metadata (dict): Datos adicionales del manifest (métricas, origen...)
+        version (str): Nombre de la versión (default: fecha + hash del contenido)
+    
+    Returns:
+        str: Nombre de la versión publicada
+    """
+    files = {}
+    content_digest = hashlib.sha256()
+    for filename in model_files(directory):
+        path = os.path.join(directory, filename)
+        sha = _sha256(path)
+        files[filename] = {'sha256': sha, 'size': os.path.getsize(path)}
+        content_digest.update(f'{filename}:{sha};'.encode('utf-8'))
+    
+    if not files:
+        raise ValueError(f"No hay archivos de modelos en {directory}")
+    
+    created_at = datetime.now()
+    version = version or f"{created_at.strftime('%Y%m%d-%H%M%S')}-{content_digest.hexdigest()[:8]}"
+    # Contaminantes de la estación principal (los archivos de la raíz)
+    pollutants = sorted(
+        filename[len('model_'):-len('.joblib')] for filename in files if filename.startswith('model_')
+    )
+    
+    manifest = dict(metadata or {})
+    manifest.update({
+        'version': version,
+        'created_at': created_at.isoformat(),
+        'pollutants': pollutants,
+        'files': files,
+    })
+    with open(os.path.join(directory, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    
+    target = version_path(version)
+    if os.path.exists(target):
+        raise ValueError(f"La versión '{version}' ya existe")
+    os.rename(directory, target)
+    return version
+
+
+def import_directory(source=None, metadata=None):
+    """
+    Registra una copia de los modelos de un directorio (por defecto los planos de MODEL_PATH)
+    
+    Returns:
+        str: Nombre de la versión creada
+    """
+    source = source or config.MODEL_PATH
+    staging = staging_dir()
+    try:
+        copy_model_files(source, staging)
+        return publish(staging, dict(metadata or {}, source=os.path.abspath(source)))
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def verify(version):
+    """
+    Comprueba que los archivos de una versión coinciden con su manifest
+    
+    Returns:
+        list: Problemas encontrados (vacía si la versión está íntegra)
+    """
+    manifest = read_manifest(version)
+    if manifest is None:
+        return [f"La versión '{version}' no existe o no tiene manifest"]
+    
+    problems = []
+    for filename, info in manifest['files'].items():
+        path = os.path.join(version_path(version), filename)
+        if not os.path.exists(path):
+            problems.append(f"Falta {filename}")
+        elif _sha256(path) != info['sha256']:
+            problems.append(f"{filename} no coincide con el manifest")
+    return problems
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Registro de versiones de modelos")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="Listar versiones")
+    import_parser = subparsers.add_parser('import', help="Registrar los modelos de un directorio")
+    import_parser.add_argument('--from', dest='source', default=None, help="Directorio (default: MODEL_PATH)")
+    import_parser.add_argument('--promote', action='store_true', help="Ponerla en producción")
+    promote_parser = subparsers.add_parser('promote', help="Poner una versión en producción")
+    promote_parser.add_argument('version')
+    promote_parser.add_argument('--no-export', action='store_true', help="No actualizar los archivos planos")
+    export_parser = subparsers.add_parser('export', help="Copiar una versión a los archivos planos de MODEL_PATH")
+    export_parser.add_argument('version', nargs='?', help="Versión (default: la de producción)")
+    shadow_parser = subparsers.add_parser('shadow', help="Evaluar una versión en modo sombra")
+    shadow_parser.add_argument('version', nargs='?')
+    shadow_parser.add_argument('--clear', action='store_true', help="Desactivar el modo sombra")
+    verify_parser = subparsers.add_parser('verify', help="Verificar los archivos de una versión")
+    verify_parser.add_argument('version')
+    args = parser.parse_args()
+    
+    if args.command == 'list':
+        versions = list_versions()
+        if not versions:
+            print("No hay versiones registradas (se usan los modelos planos de MODEL_PATH)")
+        for manifest in versions:
+            marks = ' '.join(m for m, on in (('[producción]', manifest['current']), ('[sombra]', manifest['shadow'])) if on)
+            print(f"{manifest['version']:<28} {manifest['created_at'][:19]}  {','.join(manifest['pollutants'])}  {marks}")
+        return 0
+    
+    if args.command == 'import':
+        version = import_directory(args.source)
+        print(f"✅ Versión registrada: {version}")
+        if args.promote:
+            promote(version)
+            print(f"✅ En producción: {version}")
+        return 0
+    
+    if args.command == 'promote':
+        exported = promote(args.version, export=not args.no_export)
+        print(f"✅ En producción: {args.version} (los workers la cargarán en segundo plano)")
+        if exported:
+            print(f"✅ {len(exported)} archivos planos actualizados en {config.MODEL_PATH} (commitearlos para desplegar)")
+        return 0
+    
+    if args.command == 'export':
+        exported = export_flat(args.version)
+        print(f"✅ {len(exported)} archivos planos actualizados en {config.MODEL_PATH} (commitearlos para desplegar)")
+        return 0
+    
+    if args.command == 'shadow':
+        if args.clear or not args.version:
+            set_shadow(None)
+            print("✅ Modo sombra desactivado")
+        else:
+            set_shadow(args.version)
+            print(f"✅ En modo sombra: {args.version}")
+        return 0
+    
+    if args.command == 'verify':
+        problems = verify(args.version)
+        for problem in problems:
+            print(f"  ❌ {problem}")
+        if not problems:
+            print(f"✅ {args.version} íntegra")
+        return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+Intercambio de versiones de modelos en caliente y evaluación en sombra
+
+ModelWatcher comprueba periódicamente los punteros del registro
+(CURRENT y SHADOW). Cuando cambia la versión de producción carga la nueva
+en un hilo aparte y la intercambia con una sola asignación: las
+peticiones en curso terminan con la versión anterior y las siguientes
+usan la nueva, sin reiniciar el worker.
+
+ShadowScorer evalúa la versión candidata con las mismas entradas que
+producción, en un hilo propio y con una cola acotada (si está llena la
+comparación se descarta), y registra las diferencias y los tiempos.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+import config
+import metrics
+import model_registry
+from train_model import AirQualityModel
+
+
+class ShadowScorer:
+    """Evalúa una versión candidata con el tráfico real, fuera de la petición"""
+    
+    def __init__(self, model, queue_size=None, history=None, log_path=None):
+        self.model = model
+        self.version = model.model_version
+        self.log_path = config.SHADOW_LOG_PATH if log_path is None else log_path
+        self._queue = queue.Queue(maxsize=queue_size or config.SHADOW_QUEUE_SIZE)
+        self._history = deque(maxlen=history or config.SHADOW_HISTORY)
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name='shadow-scorer', daemon=True)
+        self._thread.start()
+    
+    def submit(self, weather_data_list, predictions, pollutants, primary_seconds):
+        """
+        Encola una comparación (no bloquea la petición)
+        
+        Args:
+            weather_data_list (list): Entradas usadas por producción
+            predictions (DataFrame): Predicciones de producción
+            pollutants (list): Contaminantes solicitados
+            primary_seconds (float): Tiempo de predicción de producción
+        
+        Returns:
+            bool: False si la cola estaba llena y se descartó
+        """
+        try:
+            self._queue.put_nowait((weather_data_list, predictions, pollutants, primary_seconds))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            metrics.inc('shadow_dropped_total', candidate=self.version)
+            return False
+    
+    def stop(self):
+        """Detiene el hilo tras vaciar la cola"""
+        self._queue.put(None)
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._compare(*item)
+            except Exception as e:
+                print(f"Advertencia: fallo en la evaluación en sombra ({self.version}): {e}")
+                metrics.inc('shadow_errors_total', candidate=self.version)
+    
+    def _compare(self, weather_data_list, primary, pollutants, primary_seconds):
+        """Predice con la candidata y registra las diferencias con producción"""
+        start = time.perf_counter()
+        candidate = self.model.predict(weather_data_list, pollutants)
+        candidate_seconds = time.perf_counter() - start
+        
+        diffs = {}
+        for pollutant in self.model.target_pollutants:
+            if pollutant not in primary.columns or pollutant not in candidate.columns:
+                continue
+            a = primary[pollutant].to_numpy(dtype=float)
+            b = candidate[pollutant].to_numpy(dtype=float)
+            abs_diff = np.abs(b - a)
+            rel_diff = abs_diff / np.maximum(np.abs(a), 1e-12)
+            diffs[pollutant] = {
+                'mean_abs_diff': float(abs_diff.mean()),
+                'max_abs_diff': float(abs_diff.max()),
+                'mean_rel_diff': float(rel_diff.mean()),
+            }
+            metrics.set_gauge('shadow_mean_rel_diff', diffs[pollutant]['mean_rel_diff'],
+                              candidate=self.version, pollutant=pollutant)
+        
+        record = {
+            'timestamp': datetime.now().isoformat(),
+            'candidate': self.version,
+            'rows': len(weather_data_list),
+            'primary_ms': round(primary_seconds * 1000, 3),
+            'candidate_ms': round(candidate_seconds * 1000, 3),
+            'diffs': diffs,
+        }
+        with self._lock:
+            self._history.append(record)
+        
+        metrics.inc('shadow_comparisons_total', candidate=self.version)
+        metrics.observe('shadow_predict_seconds', primary_seconds, role='primary')
+        metrics.observe('shadow_predict_seconds', candidate_seconds, role='candidate')
+        
+        if self.log_path:
+            try:
+                os.makedirs(os.path.dirname(self.log_path) or '.', exist_ok=True)
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + '\n')
+            except OSError as e:
+                print(f"Advertencia: no se pudo escribir el log de sombra: {e}")
+    
+    def summary(self):
+        """
+        Resumen de las comparaciones recientes
+        
+        Returns:
+            dict: Versión, número de comparaciones, descartes, tiempos medios
+                y diferencias medias/máximas por contaminante
+        """
+        with self._lock:
+            history = list(self._history)
+            dropped = self.dropped
+        
+        result = {
+            'candidate': self.version,
+            'comparisons': len(history),
+            'dropped': dropped,
+            'pending': self._queue.qsize(),
+        }
+        if not history:
+            return result
+        
+        result['primary_ms_mean'] = float(np.mean([r['primary_ms'] for r in history]))
+        result['candidate_ms_mean'] = float(np.mean([r['candidate_ms'] for r in history]))
+        pollutants = {}
+        for record in history:
+            for pollutant, diff in record['diffs'].items():
+                pollutants.setdefault(pollutant, []).append(diff)
+        result['pollutants'] = {
+            pollutant: {
+                'mean_abs_diff': float(np.mean([d['mean_abs_diff'] for d in diffs])),
+                'max_abs_diff': float(np.max([d['max_abs_diff'] for d in diffs])),
+                'mean_rel_diff': float(np.mean([d['mean_rel_diff'] for d in diffs])),
+            }
+            for pollutant, diffs in pollutants.items()
+        }
+        result['recent'] = history[-5:]
+        return result
+
+
+class ModelWatcher:
+    """Sigue los punteros del registro y actualiza los modelos del predictor"""
+    
+    def __init__(self, predictor, interval=None):
+        self.predictor = predictor
+        self.interval = config.MODEL_RELOAD_INTERVAL if interval is None else interval
+        self._stop = threading.Event()
+        self._check_lock = threading.Lock()
+        self._thread = None
+    
+    def start(self):
+        """Inicia la comprobación periódica (no hace nada si el intervalo es 0)"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Advertencia: no se pudo actualizar la versión de los modelos: {e}")
+    
+    def check(self):
+        """
+        Aplica los cambios de CURRENT y SHADOW
+        
+        Returns:
+            dict: Versiones en producción y en sombra tras la comprobación
+        """
+        with self._check_lock:
+            self._check_current()
+            self._check_shadow()
+        shadow = self.predictor.shadow
+        return {
+            'current': self.predictor.model.model_version,
+            'shadow': shadow.version if shadow else None,
+        }
+    
+    def _check_current(self):
+        current = model_registry.current_version()
+        old = self.predictor.model
+        if current is None or current == old.registry_version:
+            return
+        
+        # Precargar los mismos contaminantes que ya estaban en memoria
+        warm = list(old.models)
+        new = AirQualityModel()
+        if not new.load_models(pollutants=warm or None, lazy=False if warm else None, version=current):
+            print(f"Advertencia: la versión {current} no tiene modelos; se mantiene {old.model_version}")
+            return
+        
+        self.predictor.model = new
+        new.publish_metrics()
+        metrics.inc('model_swaps_total')
+        print(f"🔄 Modelos actualizados: {old.model_version} -> {new.model_version}")
+    
+    def _check_shadow(self):
+        version = model_registry.shadow_version()
+        scorer = self.predictor.shadow
+        if version == (scorer.version if scorer else None):
+            return
+        
+        self.predictor.shadow = None
+        if scorer is not None:
+            scorer.stop()
+        if version is None:
+            print("🌓 Modo sombra desactivado")
+            return
+        
+        candidate = AirQualityModel(shadow=True)
+        if candidate.load_models(lazy=False, version=version):
+            self.predictor.shadow = ShadowScorer(candidate)
+            print(f"🌓 Evaluando en sombra la versión {version}")
@@ -3,16 +3,76 @@ Script principal para predecir la calidad del aire
 Usa datos de OpenWeatherMap API y modelos entrenados
 """
 
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import os
-import json
+import time
 
 import config
+import metrics
+from prediction_archive import ArchiveWriter, PredictionArchive
 from weather_api import WeatherAPI
 from train_model import AirQualityModel
 
 
+# Límites superiores del AQI de cada categoría (la última no tiene límite)
+AQI_LIMITS = (50, 100, 150, 200, 300)
+AQI_CATEGORIES = ('Buena', 'Moderada', 'Dañina para grupos sensibles', 'Dañina', 'Muy dañina', 'Peligrosa')
+
+
+def compute_air_quality_index(predictions):
+    """
+    Calcula un índice de calidad del aire basado en los contaminantes
+    
+    Versión sin medición de get_air_quality_index (la usa también
+    batch_predict.py en sus procesos).
+    
+    Args:
+        predictions (DataFrame): Predicciones de contaminantes
+        
+    Returns:
+        DataFrame: Predicciones con índice de calidad del aire
+    """
+    df = predictions.copy()
+    
+    # Normalizar contaminantes (valores típicos como referencia)
+    # Estos son valores aproximados basados en los datos históricos
+    pollutant_scales = {
+        'NO2': 5e-5,    # ~50 µg/m³
+        'CO': 0.03,     # ~30 mg/m³
+        'O3': 0.12,     # ~120 µg/m³
+        'SO2': 1e-4,    # ~100 µg/m³
+        'aerosol_index': 3.0
+    }
+    
+    aqi_components = []
+    component_names = []
+    
+    for pollutant, scale in pollutant_scales.items():
+        if pollutant in df.columns:
+            # Normalizar a escala 0-100
+            normalized = (df[pollutant] / scale) * 100
+            aqi_components.append(normalized)
+            component_names.append(pollutant)
+    
+    if aqi_components:
+        # Calcular AQI como promedio ponderado
+        df['AQI'] = pd.concat(aqi_components, axis=1).mean(axis=1)
+        # Contaminantes con los que se calculó (con una selección parcial el AQI no es comparable)
+        df['AQI_components'] = [component_names] * len(df)
+        
+        # Clasificar calidad del aire (sobre la columna completa; fuera de los rangos, 'Peligrosa')
+        aqi = df['AQI'].to_numpy(dtype=float)
+        df['Calidad'] = np.select(
+            [aqi <= limit for limit in AQI_LIMITS],
+            AQI_CATEGORIES[:-1],
+            default=AQI_CATEGORIES[-1]
+        ).astype(object)
+    
+    return df
+
+
 class AirQualityPredictor:
     """Clase principal para hacer predicciones de calidad del aire"""
     
@@ -20,31 +80,51 @@ class AirQualityPredictor:
         self.weather_api = WeatherAPI()
         self.model = AirQualityModel()
         
+        # Evaluación en sombra de la versión candidata (ShadowScorer o None)
+        self.shadow = None
+        
         # Crear directorio de predicciones
         os.makedirs(config.PREDICTIONS_PATH, exist_ok=True)
+        self.archive = PredictionArchive()
+        self.archive_writer = ArchiveWriter(self.archive)
         
-    def predict_current_and_forecast(self, days=7):
+    def predict_current_and_forecast(self, days=7, deadline=None, pollutants=None, model=None, weather=None,
+                                     weather_rows=None):
         """
         Predice la calidad del aire para hoy y los próximos días
         
         Args:
             days (int): Número de días a predecir (incluyendo hoy)
+            deadline (Deadline): Plazo de la petición para las llamadas a OpenWeatherMap
+            pollutants (list): Contaminantes a predecir (default: todos)
+            model (AirQualityModel): Modelos a usar (default: self.model); la API
+                fija la versión al inicio de la petición para que un cambio de
+                versión en caliente no la afecte a medias
+            weather (WeatherAPI): Cliente meteorológico de la estación de
+                `model` (default: self.weather_api, coordenadas de config)
+            weather_rows (list): Filas ya obtenidas (actual + pronóstico); la
+                API pasa las de la instantánea de la que deriva el ETag y así
+                no se vuelve a consultar la caché
             
         Returns:
             DataFrame: Predicciones de calidad del aire
         """
         print("=== PREDICCIÓN DE CALIDAD DEL AIRE ===\n")
         
-        # Cargar modelos
+        # Cargar modelos (solo la primera vez; después se reutilizan)
         print("1. Cargando modelos entrenados...")
-        if not self.model.load_models():
-            print("   ERROR: No se pudieron cargar los modelos.")
-            print("   Ejecuta primero: python train_model.py")
-            return None
+        model = model or self.model
+        if not model.available_pollutants:
+            if not model.load_models():
+                print("   ERROR: No se pudieron cargar los modelos.")
+                print("   Ejecuta primero: python train_model.py")
+                return None
+            model.publish_metrics()
         
         # Obtener datos meteorológicos actuales
         print("\n2. Obteniendo datos meteorológicos actuales...")
-        current_weather = self.weather_api.get_current_weather()
+        weather = weather or self.weather_api
+        current_weather = weather_rows[0] if weather_rows else weather.get_current_weather(deadline)
         
         if not current_weather:
             print("   ERROR: No se pudieron obtener datos meteorológicos actuales")
@@ -56,7 +136,7 @@ class AirQualityPredictor:
         
         # Obtener pronóstico
         print(f"\n3. Obteniendo pronóstico para {days} días...")
-        forecast = self.weather_api.get_forecast(days)
+        forecast = weather_rows[1:days + 1] if weather_rows else weather.get_forecast(days, deadline)
         
         if not forecast:
             print("   ERROR: No se pudo obtener el pronóstico")
@@ -69,12 +149,19 @@ class AirQualityPredictor:
         
         # Hacer predicciones
         print("\n4. Generando predicciones de calidad del aire...")
-        predictions = self.model.predict(weather_data_list)
+        start = time.perf_counter()
+        predictions = model.predict(weather_data_list, pollutants)
+        elapsed = time.perf_counter() - start
         
         if predictions is None or predictions.empty:
             print("   ERROR: No se pudieron generar predicciones")
             return None
         
+        # Comparar con la versión candidata fuera de la petición (solo la estación principal)
+        shadow = self.shadow
+        if shadow is not None and weather is self.weather_api:
+            shadow.submit(weather_data_list, predictions, pollutants, elapsed)
+        
         print(f"   Predicciones generadas para {len(predictions)} días")
         
         return predictions
@@ -89,61 +176,21 @@ class AirQualityPredictor:
         Returns:
             DataFrame: Predicciones con índice de calidad del aire
         """
-        df = predictions.copy()
-        
-        # Normalizar contaminantes (valores típicos como referencia)
-        # Estos son valores aproximados basados en los datos históricos
-        pollutant_scales = {
-            'NO2': 5e-5,    # ~50 µg/m³
-            'CO': 0.03,     # ~30 mg/m³
-            'O3': 0.12,     # ~120 µg/m³
-            'SO2': 1e-4,    # ~100 µg/m³
-            'aerosol_index': 3.0
-        }
-        
-        aqi_components = []
-        
-        for pollutant, scale in pollutant_scales.items():
-            if pollutant in df.columns:
-                # Normalizar a escala 0-100
-                normalized = (df[pollutant] / scale) * 100
-                aqi_components.append(normalized)
-        
-        if aqi_components:
-            # Calcular AQI como promedio ponderado
-            df['AQI'] = pd.concat(aqi_components, axis=1).mean(axis=1)
-            
-            # Clasificar calidad del aire
-            def classify_aqi(aqi):
-                if aqi <= 50:
-                    return 'Buena'
-                elif aqi <= 100:
-                    return 'Moderada'
-                elif aqi <= 150:
-                    return 'Dañina para grupos sensibles'
-                elif aqi <= 200:
-                    return 'Dañina'
-                elif aqi <= 300:
-                    return 'Muy dañina'
-                else:
-                    return 'Peligrosa'
-            
-            df['Calidad'] = df['AQI'].apply(classify_aqi)
-        
-        return df
+        with metrics.stage_timer('aqi'):
+            return compute_air_quality_index(predictions)
     
     def display_predictions(self, predictions):
         """
         Muestra las predicciones de forma legible
         
         Args:
-            predictions (DataFrame): Predicciones de calidad del aire
+            predictions (DataFrame): Predicciones de calidad del aire (con o sin AQI)
         """
         print("\n" + "="*80)
         print("PREDICCIONES DE CALIDAD DEL AIRE - HUAMANGA, AYACUCHO, PERÚ")
         print("="*80 + "\n")
         
-        predictions_with_aqi = self.get_air_quality_index(predictions)
+        predictions_with_aqi = predictions if 'AQI' in predictions.columns else self.get_air_quality_index(predictions)
         
         for idx, row in predictions_with_aqi.iterrows():
             date = row['date']
@@ -201,37 +248,31 @@ class AirQualityPredictor:
         
         print("="*80)
     
-    def save_predictions(self, predictions):
+    def save_predictions(self, predictions, source='cli', model=None):
         """
-        Guarda las predicciones en archivos CSV y JSON
+        Agrega las predicciones al archivo histórico (predictions/archive/)
+        
+        La escritura se hace en segundo plano (ArchiveWriter): esta llamada
+        solo encola las predicciones, que no deben modificarse después.
         
         Args:
-            predictions (DataFrame): Predicciones de calidad del aire
+            predictions (DataFrame): Predicciones de calidad del aire (con o sin AQI)
+            source (str): Origen de la predicción
+            model (AirQualityModel): Modelos que predijeron (default: self.model);
+                se archivan su versión y su estación
+            
+        Returns:
+            bool: False si la cola de escritura estaba llena
         """
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # Agregar AQI
-        predictions_with_aqi = self.get_air_quality_index(predictions)
-        
-        # Guardar CSV
-        csv_filename = os.path.join(config.PREDICTIONS_PATH, f'predicciones_{timestamp}.csv')
-        predictions_with_aqi.to_csv(csv_filename, index=False)
-        print(f"\n📁 Predicciones guardadas en: {csv_filename}")
-        
-        # Guardar JSON
-        json_filename = os.path.join(config.PREDICTIONS_PATH, f'predicciones_{timestamp}.json')
-        
-        # Convertir fechas a string para JSON
-        predictions_json = predictions_with_aqi.copy()
-        if 'date' in predictions_json.columns:
-            predictions_json['date'] = predictions_json['date'].astype(str)
-        
-        predictions_dict = predictions_json.to_dict(orient='records')
-        
-        with open(json_filename, 'w', encoding='utf-8') as f:
-            json.dump(predictions_dict, f, indent=2, ensure_ascii=False)
-        
-        print(f"📁 Predicciones guardadas en: {json_filename}")
+        predictions_with_aqi = predictions if 'AQI' in predictions.columns else self.get_air_quality_index(predictions)
+        model = model or self.model
+        
+        queued = self.archive_writer.submit(
+            predictions_with_aqi, model.model_version, source, station=model.station
+        )
+        if source == 'cli':
+            print(f"\n📁 Predicciones enviadas al archivo: {self.archive.root}")
+        return queued
     
     def run(self, days=7, save=True):
         """
@@ -245,12 +286,15 @@ class AirQualityPredictor:
         predictions = self.predict_current_and_forecast(days)
         
         if predictions is not None:
+            # AQI una sola vez para mostrar y guardar
+            predictions_with_aqi = self.get_air_quality_index(predictions)
+            
             # Mostrar predicciones
-            self.display_predictions(predictions)
+            self.display_predictions(predictions_with_aqi)
             
-            # Guardar si se solicita
+            # Guardar si se solicita (en segundo plano; se completa al salir)
             if save:
-                self.save_predictions(predictions)
+                self.save_predictions(predictions_with_aqi)
             
             return predictions
         
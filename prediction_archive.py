@@ -0,0 +1,629 @@
+"""
+Archivo histórico de predicciones
+
+Cada ejecución se agrega (nunca se reescribe) como un archivo Parquet
+comprimido en una partición por fecha de emisión:
+
+    predictions/archive/issue_date=2025-10-05/part-<emisión>-<pid>-<id>.parquet
+
+Cada ejecución ocupa un row group. El índice (index.jsonl, una línea por
+row group) guarda la hora de emisión, el rango de fechas objetivo, el
+archivo y la posición del row group, de modo que una consulta solo lee
+los row groups que le corresponden, uno a uno.
+
+Mantenimiento:
+    python prediction_archive.py compact             # un archivo por día cerrado
+    python prediction_archive.py retention --days 365
+    python prediction_archive.py migrate             # importar predicciones_*.csv antiguas
+    python prediction_archive.py query --target-from 2025-10-01
+"""
+
+import argparse
+import atexit
+import glob
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+import config
+import metrics
+
+
+INDEX_FILENAME = 'index.jsonl'
+LOCK_FILENAME = '.lock'
+PARTITION_PREFIX = 'issue_date='
+
+# Esquema fijo: las predicciones parciales (selector de contaminantes) dejan nulos
+SCHEMA = pa.schema(
+    [
+        ('issued_at', pa.timestamp('us')),
+        ('target_date', pa.date32()),
+        ('lead_days', pa.int16()),
+        ('model_version', pa.string()),
+        ('station', pa.string()),
+        ('source', pa.string()),
+    ]
+    + [(pollutant, pa.float64()) for pollutant in config.TARGET_POLLUTANTS]
+    + [
+        ('AQI', pa.float64()),
+        ('Calidad', pa.string()),
+        ('AQI_components', pa.string()),
+        ('climatology_flags', pa.string()),
+    ]
+)
+
+
+def _to_date(value):
+    return value if isinstance(value, date) and not isinstance(value, datetime) else pd.Timestamp(value).date()
+
+
+def _parse_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _join(value):
+    if isinstance(value, (list, tuple)):
+        return ','.join(str(v) for v in value)
+    return None if value is None or (isinstance(value, float) and pd.isna(value)) else str(value)
+
+
+def _conform(table, names=None):
+    """Agrega como nulas las columnas que no existían al escribir un archivo (p. ej. station)"""
+    names = names or SCHEMA.names
+    for name in names:
+        if name not in table.column_names:
+            field = SCHEMA.field(name)
+            table = table.append_column(field, pa.nulls(table.num_rows, field.type))
+    return table.select(names)
+
+
+def to_table(predictions, issued_at, model_version=None, source=None, station=None):
+    """
+    Convierte una ejecución al esquema del archivo
+    
+    Args:
+        predictions (DataFrame): Predicciones con AQI (get_air_quality_index)
+        issued_at (datetime): Hora de emisión
+        model_version (str): Versión de los modelos
+        source (str): Origen ('cli', 'api'...)
+        station (str): Estación de los modelos (None en versiones de una sola estación)
+    
+    Returns:
+        pyarrow.Table: Una fila por fecha objetivo
+    """
+    n = len(predictions)
+    target_dates = [_to_date(d) for d in predictions['date']]
+    columns = {
+        'issued_at': [issued_at] * n,
+        'target_date': target_dates,
+        'lead_days': [(d - issued_at.date()).days for d in target_dates],
+        'model_version': [model_version] * n,
+        'station': [station] * n,
+        'source': [source] * n,
+    }
+    for pollutant in config.TARGET_POLLUTANTS + ['AQI']:
+        columns[pollutant] = (
+            predictions[pollutant].astype(float).tolist() if pollutant in predictions.columns else [None] * n
+        )
+    for name in ('Calidad', 'AQI_components', 'climatology_flags'):
+        columns[name] = [_join(v) for v in predictions[name]] if name in predictions.columns else [None] * n
+    return pa.table(columns, schema=SCHEMA)
+
+
+class PredictionArchive:
+    """Archivo de predicciones particionado por fecha de emisión"""
+    
+    def __init__(self, root=None, compression=None):
+        self.root = root or config.PREDICTIONS_ARCHIVE_PATH
+        self.compression = compression or config.PREDICTIONS_ARCHIVE_COMPRESSION
+        os.makedirs(self.root, exist_ok=True)
+    
+    @property
+    def index_path(self):
+        return os.path.join(self.root, INDEX_FILENAME)
+    
+    @contextmanager
+    def _locked(self):
+        """Bloqueo entre procesos para el índice (los workers escriben en paralelo)"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.root, LOCK_FILENAME), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    # ---------- Escritura ----------
+    
+    def append(self, predictions, issued_at=None, model_version=None, source='cli', station=None):
+        """
+        Agrega una ejecución al archivo
+        
+        Args:
+            predictions (DataFrame): Predicciones con AQI
+            issued_at (datetime): Hora de emisión (default: ahora)
+            model_version (str): Versión de los modelos
+            source (str): Origen de la predicción
+            station (str): Estación de los modelos
+        
+        Returns:
+            str: Ruta del archivo escrito
+        """
+        issued_at = issued_at or datetime.now()
+        return self.append_tables([to_table(predictions, issued_at, model_version, source, station)])[0]
+    
+    def append_tables(self, tables):
+        """
+        Escribe varias ejecuciones: un archivo por fecha de emisión y un row group por ejecución
+        
+        El archivo se escribe con un nombre temporal y se renombra, y solo
+        después se agrega al índice: una consulta nunca ve un archivo a medias.
+        
+        Args:
+            tables (list): Tablas de to_table()
+        
+        Returns:
+            list: Rutas de los archivos escritos
+        """
+        by_day = {}
+        for table in tables:
+            if table.num_rows:
+                issued_at = table.column('issued_at')[0].as_py()
+                by_day.setdefault(issued_at.date(), []).append(table)
+        
+        paths = []
+        entries = []
+        for issue_date, day_tables in by_day.items():
+            partition = os.path.join(self.root, f'{PARTITION_PREFIX}{issue_date.isoformat()}')
+            os.makedirs(partition, exist_ok=True)
+            first = day_tables[0].column('issued_at')[0].as_py()
+            filename = f"part-{first.strftime('%H%M%S%f')}-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet"
+            path = os.path.join(partition, filename)
+            entries.extend(self._write_file(path, day_tables))
+            paths.append(path)
+        
+        if entries:
+            with self._locked():
+                with open(self.index_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+                    f.flush()
+                    os.fsync(f.fileno())
+        return paths
+    
+    def _write_file(self, path, tables):
+        """Escribe un archivo Parquet (temporal + rename) y devuelve sus entradas de índice"""
+        tmp_path = f'{path}.tmp'
+        entries = []
+        with pq.ParquetWriter(tmp_path, SCHEMA, compression=self.compression) as writer:
+            for row_group, table in enumerate(tables):
+                writer.write_table(table, row_group_size=max(1, table.num_rows))
+                target_dates = table.column('target_date').to_pylist()
+                entries.append({
+                    'issued_at': table.column('issued_at')[0].as_py().isoformat(),
+                    'target_from': min(target_dates).isoformat(),
+                    'target_to': max(target_dates).isoformat(),
+                    'file': os.path.relpath(path, self.root),
+                    'row_group': row_group,
+                    'rows': table.num_rows,
+                    'model_version': table.column('model_version')[0].as_py(),
+                    'station': table.column('station')[0].as_py(),
+                })
+        os.replace(tmp_path, path)
+        return entries
+    
+    def _rewrite_index(self, entries):
+        """Reemplaza el índice completo (llamar con el bloqueo tomado)"""
+        tmp_path = f'{self.index_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+    
+    # ---------- Lectura ----------
+    
+    def read_index(self):
+        """
+        Entradas del índice (una por ejecución), en orden de escritura
+        
+        Returns:
+            list: Diccionarios con issued_at, target_from, target_to, file,
+                row_group, rows, model_version y station (las entradas
+                anteriores a la columna station no la tienen)
+        """
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+    
+    def select(self, issued_from=None, issued_to=None, target_from=None, target_to=None, station=None):
+        """
+        Row groups que pueden contener filas del rango pedido (solo lee el índice)
+        
+        Args:
+            issued_from, issued_to (date): Rango de fechas de emisión (inclusive)
+            target_from, target_to (date): Rango de fechas objetivo (inclusive)
+            station (str): Solo las ejecuciones de esa estación (default: todas)
+        
+        Returns:
+            list: Entradas del índice ordenadas por hora de emisión
+        """
+        issued_from, issued_to = _parse_date(issued_from), _parse_date(issued_to)
+        target_from, target_to = _parse_date(target_from), _parse_date(target_to)
+        selected = []
+        for entry in self.read_index():
+            issue_date = date.fromisoformat(entry['issued_at'][:10])
+            if issued_from and issue_date < issued_from or issued_to and issue_date > issued_to:
+                continue
+            if target_from and date.fromisoformat(entry['target_to']) < target_from:
+                continue
+            if target_to and date.fromisoformat(entry['target_from']) > target_to:
+                continue
+            if station is not None and entry.get('station') != station:
+                continue
+            selected.append(entry)
+        return sorted(selected, key=lambda entry: entry['issued_at'])
+    
+    def query(self, issued_from=None, issued_to=None, target_from=None, target_to=None,
+              pollutants=None, limit=None, station=None):
+        """
+        Recorre las predicciones archivadas sin cargar el archivo completo
+        
+        Lee un row group cada vez (solo las columnas necesarias) y produce
+        las filas que cumplen el filtro.
+        
+        Args:
+            issued_from, issued_to (date): Rango de fechas de emisión (inclusive)
+            target_from, target_to (date): Rango de fechas objetivo (inclusive)
+            pollutants (list): Contaminantes a incluir (default: todos)
+            limit (int): Número máximo de filas
+            station (str): Solo las ejecuciones de esa estación (default: todas)
+        
+        Yields:
+            dict: Una fila (fechas en formato ISO)
+        """
+        target_from, target_to = _parse_date(target_from), _parse_date(target_to)
+        columns = SCHEMA.names
+        if pollutants:
+            columns = [name for name in SCHEMA.names if name not in config.TARGET_POLLUTANTS or name in pollutants]
+        
+        remaining = limit
+        files = {}
+        try:
+            for entry in self.select(issued_from, issued_to, target_from, target_to, station):
+                path = os.path.join(self.root, entry['file'])
+                if path not in files:
+                    try:
+                        files[path] = pq.ParquetFile(path)
+                    except FileNotFoundError:
+                        # Compactado o eliminado después de leer el índice
+                        continue
+                parquet_file = files[path]
+                available = [name for name in columns if name in parquet_file.schema_arrow.names]
+                table = _conform(parquet_file.read_row_group(entry['row_group'], columns=available), columns)
+                for row in table.to_pylist():
+                    target = row['target_date']
+                    if target_from and target < target_from or target_to and target > target_to:
+                        continue
+                    row['issued_at'] = row['issued_at'].isoformat()
+                    row['target_date'] = target.isoformat()
+                    yield row
+                    if remaining is not None:
+                        remaining -= 1
+                        if remaining <= 0:
+                            return
+        finally:
+            for parquet_file in files.values():
+                parquet_file.close()
+    
+    # ---------- Mantenimiento ----------
+    
+    def partitions(self):
+        """Fechas de emisión con datos, de la más antigua a la más reciente"""
+        days = []
+        for path in glob.glob(os.path.join(self.root, f'{PARTITION_PREFIX}*')):
+            try:
+                days.append(date.fromisoformat(os.path.basename(path)[len(PARTITION_PREFIX):]))
+            except ValueError:
+                continue
+        return sorted(days)
+    
+    def compact(self, before=None):
+        """
+        Une los archivos de cada día cerrado en uno solo (un row group por ejecución)
+        
+        Args:
+            before (date): Compactar solo días anteriores (default: hoy, que sigue abierto)
+        
+        Returns:
+            int: Número de días compactados
+        """
+        before = _parse_date(before) or date.today()
+        compacted = 0
+        with self._locked():
+            entries = self.read_index()
+            for issue_date in self.partitions():
+                if issue_date >= before:
+                    continue
+                partition = f'{PARTITION_PREFIX}{issue_date.isoformat()}'
+                day_entries = sorted(
+                    (e for e in entries if e['file'].startswith(partition + os.sep)),
+                    key=lambda e: e['issued_at']
+                )
+                files = sorted({e['file'] for e in day_entries})
+                if len(files) <= 1:
+                    continue
+                
+                tables = [
+                    _conform(pq.ParquetFile(os.path.join(self.root, e['file'])).read_row_group(e['row_group']))
+                    for e in day_entries
+                ]
+                path = os.path.join(self.root, partition, f'compacted-{uuid.uuid4().hex[:8]}.parquet')
+                new_entries = self._write_file(path, tables)
+                
+                # El índice se reemplaza antes de borrar los archivos antiguos
+                entries = [e for e in entries if e['file'] not in files] + new_entries
+                self._rewrite_index(entries)
+                for filename in files:
+                    os.remove(os.path.join(self.root, filename))
+                compacted += 1
+        return compacted
+    
+    def apply_retention(self, days=None):
+        """
+        Elimina las particiones con fecha de emisión más antigua que `days` días
+        
+        Returns:
+            int: Número de días eliminados
+        """
+        days = config.PREDICTIONS_RETENTION_DAYS if days is None else days
+        cutoff = date.today() - timedelta(days=days)
+        removed = [d for d in self.partitions() if d < cutoff]
+        if not removed:
+            return 0
+        
+        prefixes = tuple(f'{PARTITION_PREFIX}{d.isoformat()}{os.sep}' for d in removed)
+        with self._locked():
+            self._rewrite_index([e for e in self.read_index() if not e['file'].startswith(prefixes)])
+        for issue_date in removed:
+            shutil.rmtree(os.path.join(self.root, f'{PARTITION_PREFIX}{issue_date.isoformat()}'), ignore_errors=True)
+        return len(removed)
+    
+    def migrate_legacy(self, directory=None):
+        """
+        Importa los predicciones_<timestamp>.csv del formato anterior
+        
+        La hora de emisión se toma del nombre del archivo. Los archivos
+        originales no se modifican.
+        
+        Returns:
+            int: Número de ejecuciones importadas
+        """
+        directory = directory or config.PREDICTIONS_PATH
+        imported = {e['issued_at'] for e in self.read_index()}
+        tables = []
+        for path in sorted(glob.glob(os.path.join(directory, 'predicciones_*.csv'))):
+            stamp = os.path.basename(path)[len('predicciones_'):-len('.csv')]
+            try:
+                issued_at = datetime.strptime(stamp, '%Y%m%d_%H%M%S')
+            except ValueError:
+                continue
+            if issued_at.isoformat() in imported:
+                continue
+            tables.append(to_table(pd.read_csv(path), issued_at, source='legacy_csv'))
+        self.append_tables(tables)
+        return len(tables)
+
+
+class ArchiveWriter:
+    """
+    Escritura del archivo en segundo plano
+    
+    submit() solo encola la ejecución; un hilo agrupa hasta
+    ARCHIVE_BATCH_SIZE ejecuciones (o las que lleguen en
+    ARCHIVE_FLUSH_INTERVAL segundos), las convierte al esquema y las
+    escribe en un solo archivo (temporal + rename). Si la cola está llena
+    la ejecución se descarta y se cuenta, sin bloquear al que predice.
+    """
+    
+    def __init__(self, archive=None, batch_size=None, flush_interval=None, queue_size=None):
+        self.archive = archive or PredictionArchive()
+        self.batch_size = batch_size or config.ARCHIVE_BATCH_SIZE
+        self.flush_interval = config.ARCHIVE_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._queue = queue.Queue(maxsize=queue_size or config.ARCHIVE_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._thread = None
+        # Hora de encolado de cada ejecución aún no escrita (en orden de llegada)
+        self._pending = deque()
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_path = None
+    
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='archive-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+    
+    def submit(self, predictions, model_version=None, source='api', issued_at=None, station=None):
+        """
+        Encola una ejecución para archivarla
+        
+        Args:
+            predictions (DataFrame): Predicciones con AQI (no se modifican después)
+            model_version (str): Versión de los modelos
+            source (str): Origen de la predicción
+            issued_at (datetime): Hora de emisión (default: ahora)
+            station (str): Estación de los modelos
+        
+        Returns:
+            bool: False si la cola estaba llena y se descartó
+        """
+        self._start()
+        submitted_at = time.monotonic()
+        item = (submitted_at, predictions, issued_at or datetime.now(), model_version, source, station)
+        with self._lock:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                metrics.inc('archive_dropped_total')
+                return False
+            self._pending.append(submitted_at)
+        metrics.set_gauge('archive_queue_depth', self._queue.qsize())
+        return True
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            
+            # Agrupar lo que llegue hasta completar el lote o agotar el intervalo
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            
+            self._write(batch)
+            if stop:
+                return
+    
+    def _write(self, batch):
+        """Convierte y escribe un lote; registra el retraso desde submit()"""
+        try:
+            tables = [
+                to_table(predictions, issued_at, model_version, source, station)
+                for _, predictions, issued_at, model_version, source, station in batch
+            ]
+            paths = self.archive.append_tables(tables)
+        except Exception as e:
+            with self._lock:
+                self.errors += len(batch)
+                for _ in batch:
+                    self._pending.popleft()
+            metrics.inc('archive_write_errors_total', len(batch))
+            print(f"Advertencia: no se pudieron archivar {len(batch)} predicciones: {e}")
+            return
+        
+        now = time.monotonic()
+        for submitted_at, *_ in batch:
+            metrics.observe('archive_queue_lag_seconds', now - submitted_at)
+        with self._lock:
+            self.written += len(batch)
+            for _ in batch:
+                self._pending.popleft()
+            self.last_path = paths[-1] if paths else self.last_path
+        metrics.inc('archive_writes_total', len(batch))
+        metrics.set_gauge('archive_queue_depth', self._queue.qsize())
+    
+    def lag(self):
+        """Segundos que lleva esperando la ejecución pendiente más antigua (0 si no hay)"""
+        with self._lock:
+            return time.monotonic() - self._pending[0] if self._pending else 0.0
+    
+    def stats(self):
+        """
+        Estado de la cola para /health
+        
+        Returns:
+            dict: Pendientes, escritas, descartadas, errores y retraso actual
+        """
+        lag = self.lag()
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'written': self.written,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'lag_seconds': round(lag, 3),
+                'last_path': self.last_path,
+            }
+    
+    def close(self, timeout=10.0):
+        """
+        Escribe lo pendiente y detiene el hilo (se llama también al salir)
+        
+        Returns:
+            bool: True si todo quedó escrito dentro del plazo
+        """
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return False
+        thread.join(timeout)
+        return not thread.is_alive()
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Mantenimiento del archivo de predicciones")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compact_parser = subparsers.add_parser('compact', help="Un archivo por día cerrado")
+    compact_parser.add_argument('--before', default=None, help="Compactar días anteriores a esta fecha (default: hoy)")
+    retention_parser = subparsers.add_parser('retention', help="Eliminar días antiguos")
+    retention_parser.add_argument('--days', type=int, default=None, help="Días a conservar (default: PREDICTIONS_RETENTION_DAYS)")
+    subparsers.add_parser('migrate', help="Importar los CSV del formato anterior")
+    query_parser = subparsers.add_parser('query', help="Consultar predicciones (JSON por línea)")
+    for name in ('issued-from', 'issued-to', 'target-from', 'target-to'):
+        query_parser.add_argument(f'--{name}', default=None)
+    query_parser.add_argument('--limit', type=int, default=None)
+    query_parser.add_argument('--station', default=None, help="Solo esa estación (ver /stations)")
+    args = parser.parse_args()
+    
+    archive = PredictionArchive()
+    if args.command == 'compact':
+        print(f"✅ Días compactados: {archive.compact(args.before)}")
+    elif args.command == 'retention':
+        print(f"✅ Días eliminados: {archive.apply_retention(args.days)}")
+    elif args.command == 'migrate':
+        print(f"✅ Ejecuciones importadas: {archive.migrate_legacy()}")
+    elif args.command == 'query':
+        rows = archive.query(
+            args.issued_from, args.issued_to, args.target_from, args.target_to,
+            limit=args.limit, station=args.station
+        )
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+Perfilado de peticiones bajo demanda
+
+Una petición se perfila con cProfile cuando se cumple alguna condición:
+- PROFILE_SAMPLE_RATE > 0 y la petición cae dentro de la muestra
+- Trae la cabecera X-Profile: 1 junto con un X-Admin-Token válido
+
+cProfile solo sigue el hilo que lo activa: los handlers síncronos (que
+FastAPI ejecuta en su pool de hilos) se decoran con `profile_thread` para
+que su trabajo se perfile en ese hilo y se sume al perfil de la petición.
+
+Cada perfil se guarda en PROFILES_PATH como .prof (formato pstats, se
+puede abrir con snakeviz), un .txt con el árbol de llamadas de las
+funciones relevantes y un .json con los metadatos de la petición.
+Si el perfilado no puede activarse, el middleware no se instala.
+"""
+
+import contextvars
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from datetime import datetime
+
+import config
+from admin import is_admin_token
+
+
+# Funciones cuyo árbol de llamadas se detalla en el informe de texto
+FOCUS_FUNCTIONS = [
+    'predict_current_and_forecast',
+    'predict',
+    'prepare_weather_features',
+    'get_air_quality_index',
+]
+
+# Módulos de terceros que se resumen aparte
+FOCUS_MODULES = ['pandas', 'sklearn', 'numpy', 'joblib', 'requests']
+
+# Solo un perfil a la vez: cProfile no admite perfiladores anidados
+_active_lock = threading.Lock()
+
+# Perfiles de los hilos de la petición en curso (lo copian los hilos del pool)
+_thread_profiles = contextvars.ContextVar('thread_profiles', default=None)
+
+
+def profiling_available():
+    """
+    Indica si el perfilado puede activarse con la configuración actual
+    
+    Returns:
+        bool: True si hay muestreo o token de administración configurado
+    """
+    return config.PROFILE_SAMPLE_RATE > 0 or bool(config.ADMIN_TOKEN)
+
+
+def _header(scope, name):
+    """Obtiene una cabecera de un scope ASGI"""
+    for key, value in scope.get('headers', []):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _should_profile(scope):
+    """Decide si se perfila una petición"""
+    if config.PROFILE_SAMPLE_RATE > 0 and random.random() < config.PROFILE_SAMPLE_RATE:
+        return True
+    if _header(scope, b'x-profile') in ('1', 'true'):
+        return is_admin_token(_header(scope, b'x-admin-token'))
+    return False
+
+
+def _focus_report(stats):
+    """
+    Genera el informe de texto con el árbol de llamadas relevante
+    
+    Args:
+        stats (pstats.Stats): Estadísticas del perfil
+    
+    Returns:
+        str: Informe legible
+    """
+    stream = io.StringIO()
+    stats.stream = stream
+    
+    stream.write("=== FUNCIONES POR TIEMPO ACUMULADO ===\n")
+    stats.sort_stats('cumulative').print_stats(40)
+    
+    for function in FOCUS_FUNCTIONS:
+        stream.write(f"\n=== LLAMADAS DESDE {function} ===\n")
+        stats.print_callees(rf'\b{function}\b')
+    
+    stream.write("\n=== TIEMPO PROPIO POR MÓDULO ===\n")
+    totals = {}
+    for (filename, _, _), (_, _, tottime, _, _) in stats.stats.items():
+        module = 'otros'
+        for candidate in FOCUS_MODULES:
+            if f'{os.sep}{candidate}{os.sep}' in filename:
+                module = candidate
+                break
+        else:
+            if filename.startswith(os.getcwd()):
+                module = 'proyecto'
+        totals[module] = totals.get(module, 0.0) + tottime
+    for module, total in sorted(totals.items(), key=lambda item: -item[1]):
+        stream.write(f"  {module:<10} {total * 1000:10.2f} ms\n")
+    
+    return stream.getvalue()
+
+
+def profile_thread(func):
+    """
+    Decorador que perfila una función síncrona en el hilo donde se ejecuta
+    
+    Solo actúa si la petición en curso se está perfilando; el resultado
+    se suma al perfil que guarda el middleware.
+    
+    Args:
+        func (callable): Handler o función que corre en el pool de hilos
+    
+    Returns:
+        callable: Función con la misma firma
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiles = _thread_profiles.get()
+        if profiles is None:
+            return func(*args, **kwargs)
+        
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profiles.append(profiler)
+    
+    return wrapper
+
+
+def save_profile(profiler, metadata, thread_profiles=()):
+    """
+    Guarda un perfil en PROFILES_PATH y elimina los más antiguos
+    
+    Args:
+        profiler (cProfile.Profile): Perfil ya detenido
+        metadata (dict): Datos de la petición (ruta, duración, estado...)
+        thread_profiles (list): Perfiles de los hilos del pool que se suman
+    
+    Returns:
+        str: Nombre base del perfil guardado
+    """
+    os.makedirs(config.PROFILES_PATH, exist_ok=True)
+    
+    route = metadata['path'].strip('/').replace('/', '_') or 'root'
+    name = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{metadata['method']}_{route}_{os.getpid()}"
+    base = os.path.join(config.PROFILES_PATH, name)
+    
+    stats = pstats.Stats(profiler, *thread_profiles)
+    stats.dump_stats(f'{base}.prof')
+    with open(f'{base}.txt', 'w', encoding='utf-8') as f:
+        f.write(_focus_report(stats))
+    with open(f'{base}.json', 'w', encoding='utf-8') as f:
+        json.dump(dict(metadata, name=name), f, indent=2, ensure_ascii=False)
+    
+    _prune_profiles()
+    return name
+
+
+def _prune_profiles():
+    """Conserva solo los PROFILES_KEEP perfiles más recientes"""
+    names = sorted(
+        filename[:-5] for filename in os.listdir(config.PROFILES_PATH)
+        if filename.endswith('.json')
+    )
+    for name in names[:-config.PROFILES_KEEP]:
+        for extension in ('.prof', '.txt', '.json'):
+            try:
+                os.remove(os.path.join(config.PROFILES_PATH, name + extension))
+            except OSError:
+                pass
+
+
+def list_profiles(limit=20):
+    """
+    Lista los perfiles más recientes
+    
+    Args:
+        limit (int): Número máximo de perfiles
+    
+    Returns:
+        list: Metadatos de cada perfil, del más reciente al más antiguo
+    """
+    if not os.path.isdir(config.PROFILES_PATH):
+        return []
+    
+    names = sorted(
+        (filename[:-5] for filename in os.listdir(config.PROFILES_PATH) if filename.endswith('.json')),
+        reverse=True
+    )
+    profiles = []
+    for name in names[:limit]:
+        try:
+            with open(os.path.join(config.PROFILES_PATH, f'{name}.json'), 'r', encoding='utf-8') as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def profile_path(name, extension):
+    """
+    Ruta de un archivo de perfil, validando el nombre
+    
+    Args:
+        name (str): Nombre base devuelto por list_profiles
+        extension (str): 'prof' o 'txt'
+    
+    Returns:
+        str: Ruta del archivo o None si no existe
+    """
+    if extension not in ('prof', 'txt') or os.path.basename(name) != name:
+        return None
+    path = os.path.join(config.PROFILES_PATH, f'{name}.{extension}')
+    return path if os.path.exists(path) else None
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI que perfila peticiones seleccionadas con cProfile"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not _should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        
+        if not _active_lock.acquire(blocking=False):
+            # Ya hay un perfil en curso en este worker
+            await self.app(scope, receive, send)
+            return
+        
+        status = {'code': None}
+        
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+        
+        profiler = cProfile.Profile()
+        thread_profiles = []
+        token = _thread_profiles.set(thread_profiles)
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+                _thread_profiles.reset(token)
+            
+            metadata = {
+                'method': scope['method'],
+                'path': scope['path'],
+                'query': scope.get('query_string', b'').decode('latin-1'),
+                'status': status['code'],
+                'duration_ms': round((time.perf_counter() - start) * 1000, 2),
+                'created_at': datetime.now().isoformat(),
+                'pid': os.getpid(),
+            }
+            try:
+                save_profile(profiler, metadata, thread_profiles)
+            except OSError as e:
+                print(f"Advertencia: no se pudo guardar el perfil: {e}")
+        finally:
+            _active_lock.release()
@@ -0,0 +1,178 @@
+"""
+Arranque en segundo plano y estado de preparación del worker
+
+El worker acepta conexiones en cuanto arranca; la carga de modelos, el
+cálculo de los promedios móviles históricos y una inferencia de prueba
+se hacen en un hilo aparte. /livez responde mientras el proceso vive y
+/readyz solo cuando el calentamiento terminó, de modo que el balanceador
+envíe tráfico únicamente a workers listos.
+
+Si el calentamiento falla (modelos ausentes, error al leer el histórico...)
+se reintenta con espera exponencial: un fallo transitorio no deja el
+worker fuera de servicio hasta que alguien lo reinicie.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+import config
+import metrics
+from resilience import backoff_delay
+from train_model import historical_moving_averages
+
+
+class Readiness:
+    """Fase de arranque del worker"""
+    
+    STARTING = 'starting'
+    LOADING_MODELS = 'loading_models'
+    BUILDING_FEATURES = 'building_features'
+    WARMING_UP = 'warming_up'
+    READY = 'ready'
+    FAILED = 'failed'
+    
+    def __init__(self):
+        self.phase = self.STARTING
+        self.error = None
+        self.attempts = 0
+        self.started_at = time.monotonic()
+        self.startup_seconds = None
+        self._ready = threading.Event()
+        metrics.set_gauge('worker_ready', 0)
+    
+    @property
+    def ready(self):
+        return self._ready.is_set()
+    
+    def set_phase(self, phase):
+        self.phase = phase
+        print(f"⏳ Arranque: {phase}")
+    
+    def mark_ready(self):
+        self.startup_seconds = time.monotonic() - self.started_at
+        self.phase = self.READY
+        self.error = None
+        self._ready.set()
+        metrics.set_gauge('worker_ready', 1)
+        metrics.set_gauge('startup_seconds', self.startup_seconds)
+        metrics.flush()
+        print(f"✅ Worker listo en {self.startup_seconds:.1f} s")
+    
+    def mark_failed(self, error):
+        self.error = str(error)
+        self.phase = self.FAILED
+        print(f"❌ Arranque fallido: {error}")
+    
+    def wait(self, timeout=None):
+        """Espera a que el worker esté listo (para scripts y pruebas)"""
+        return self._ready.wait(timeout)
+    
+    def snapshot(self):
+        """
+        Estado para /readyz y /health
+        
+        Returns:
+            dict: Fase, si está listo, último error, intentos y duración del arranque
+        """
+        return {
+            'phase': self.phase,
+            'ready': self.ready,
+            'error': self.error,
+            'attempts': self.attempts,
+            'startup_seconds': round(self.startup_seconds, 3) if self.startup_seconds is not None else None,
+            'uptime_seconds': round(time.monotonic() - self.started_at, 3),
+        }
+
+
+def warm_up_row(moving_averages):
+    """
+    Fila meteorológica sintética para la inferencia de prueba
+    
+    Usa los promedios de 30 días del histórico como valores actuales.
+    
+    Args:
+        moving_averages (dict): Salida de historical_moving_averages
+    
+    Returns:
+        dict: Datos meteorológicos con el formato de WeatherAPI
+    """
+    row = {'date': datetime.now()}
+    for feature in config.WEATHER_FEATURES:
+        row[feature] = moving_averages.get(f'{feature}_ma30', 0.0)
+    return row
+
+
+def warm_up(predictor, readiness):
+    """
+    Carga modelos, datos históricos y ejecuta una predicción de prueba
+    
+    La predicción de prueba recorre el mismo camino que /predict
+    (características, escalado, modelos, climatología y AQI), de modo
+    que la primera petición real no paga la inicialización de pandas y
+    sklearn. Con LAZY_MODEL_LOADING solo se calientan los modelos ya
+    cargados.
+    
+    Args:
+        predictor (AirQualityPredictor): Predictor del worker
+        readiness (Readiness): Estado a actualizar
+    
+    Returns:
+        bool: True si el worker quedó listo
+    """
+    readiness.attempts += 1
+    try:
+        readiness.set_phase(Readiness.LOADING_MODELS)
+        model = predictor.model
+        if not model.load_models():
+            raise RuntimeError("No hay modelos entrenados (python train_model.py)")
+        model.publish_metrics()
+        
+        readiness.set_phase(Readiness.BUILDING_FEATURES)
+        moving_averages = historical_moving_averages(station=model.station_coordinates)
+        
+        readiness.set_phase(Readiness.WARMING_UP)
+        predictions = model.predict([warm_up_row(moving_averages)], list(model.models))
+        predictor.get_air_quality_index(predictions)
+        # Tablas de atribución de explain=true
+        model.explain([warm_up_row(moving_averages)], list(model.models))
+    except Exception as e:
+        readiness.mark_failed(e)
+        return False
+    
+    readiness.mark_ready()
+    return True
+
+
+def start_warm_up(predictor, readiness, after_first_attempt=None):
+    """
+    Ejecuta warm_up en un hilo de fondo hasta que el worker quede listo
+    
+    Cada fallo se reintenta con backoff exponencial (hasta WARMUP_RETRY_MAX
+    segundos); mientras tanto /readyz responde 503 con el último error.
+    
+    Args:
+        predictor (AirQualityPredictor): Predictor del worker
+        readiness (Readiness): Estado a actualizar
+        after_first_attempt (callable): Se llama tras el primer intento, haya
+            funcionado o no (p. ej. para vigilar el registro: un `promote`
+            posterior cambia los modelos que usa el siguiente reintento)
+    
+    Returns:
+        Thread: Hilo iniciado
+    """
+    def run():
+        ready = warm_up(predictor, readiness)
+        if after_first_attempt is not None:
+            after_first_attempt()
+        retry = 0
+        while not ready:
+            retry += 1
+            delay = backoff_delay(retry, base=config.WARMUP_RETRY_BASE, cap=config.WARMUP_RETRY_MAX)
+            print(f"Advertencia: se reintenta el arranque en {delay:.1f} s")
+            time.sleep(delay)
+            ready = warm_up(predictor, readiness)
+    
+    thread = threading.Thread(target=run, name='warm-up', daemon=True)
+    thread.start()
+    return thread
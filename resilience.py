@@ -0,0 +1,171 @@
+"""
+Primitivas de resiliencia para las llamadas a OpenWeatherMap
+
+- Deadline: presupuesto de tiempo de extremo a extremo de una petición,
+  que se pasa a cada llamada externa para acotar su timeout
+- CircuitBreaker: deja de llamar a un endpoint que falla de forma
+  repetida y lo vuelve a probar tras un tiempo de espera
+- backoff_delay: espera con jitter entre reintentos
+"""
+
+import random
+import threading
+import time
+
+import config
+import metrics
+
+
+class UpstreamUnavailable(Exception):
+    """No se llamó a OpenWeatherMap o no hubo tiempo para completar la llamada"""
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    """El presupuesto de tiempo de la petición se agotó"""
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """El circuito del endpoint está abierto"""
+
+
+class Deadline:
+    """Instante límite para completar una petición"""
+    
+    def __init__(self, seconds=None):
+        self.seconds = config.REQUEST_DEADLINE if seconds is None else seconds
+        self.expires_at = time.monotonic() + self.seconds
+    
+    def remaining(self):
+        """Segundos que quedan (0 si ya expiró)"""
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def expired(self):
+        """Indica si el presupuesto se agotó"""
+        return self.remaining() <= 0
+    
+    def timeout(self, cap):
+        """
+        Timeout para la siguiente llamada externa
+        
+        Args:
+            cap (float): Timeout máximo por intento
+        
+        Returns:
+            float: El menor entre cap y el tiempo restante
+        
+        Raises:
+            DeadlineExceeded: Si no queda tiempo
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f'Presupuesto de {self.seconds:.1f} s agotado')
+        return min(cap, remaining)
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """
+    Espera antes de un reintento (backoff exponencial con jitter completo)
+    
+    Args:
+        attempt (int): Número de reintento (1 = primer reintento)
+        base (float): Espera base en segundos
+        cap (float): Espera máxima en segundos
+    
+    Returns:
+        float: Segundos a esperar, uniforme entre 0 y min(cap, base * 2^(attempt-1))
+    """
+    base = config.UPSTREAM_BACKOFF if base is None else base
+    cap = config.UPSTREAM_BACKOFF_MAX if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Circuito por endpoint externo
+    
+    closed: las llamadas pasan; tras failure_threshold fallos seguidos se abre.
+    open: las llamadas se rechazan sin contactar al servidor hasta que pasa
+    reset_timeout. half_open: se deja pasar una única llamada de prueba;
+    si tiene éxito el circuito se cierra y si falla vuelve a abrirse.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    # Valor del gauge upstream_circuit_state
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or config.BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = config.BREAKER_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        metrics.set_gauge('upstream_circuit_state', 0, endpoint=name)
+    
+    def _set_state(self, state):
+        """Cambia de estado y actualiza el gauge (llamar con el lock tomado)"""
+        if state != self.state:
+            self.state = state
+            metrics.set_gauge('upstream_circuit_state', self.STATE_VALUES[state], endpoint=self.name)
+    
+    def allow(self):
+        """
+        Indica si se puede realizar una llamada
+        
+        Returns:
+            bool: True si el circuito está cerrado o si esta llamada es la prueba
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+    
+    def record_success(self):
+        """Registra una llamada exitosa y cierra el circuito"""
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            self._set_state(self.CLOSED)
+    
+    def record_failure(self):
+        """Registra un fallo y abre el circuito si corresponde"""
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+    
+    def release(self):
+        """Libera el turno de prueba de una llamada permitida que no se llegó a hacer"""
+        with self._lock:
+            self._trial_in_flight = False
+    
+    def snapshot(self):
+        """
+        Estado actual para /health
+        
+        Returns:
+            dict: Estado, fallos seguidos y segundos hasta la próxima prueba
+        """
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'retry_in_seconds': retry_in,
+            }
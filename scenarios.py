@@ -0,0 +1,180 @@
+"""
+Escenarios hipotéticos para POST /predict/scenarios
+
+Un escenario es un vector de variables meteorológicas (en las unidades del
+dataset: K, Pa, m/s, m). Se aceptan de dos formas, siempre como arreglos
+por variable (una posición por escenario) en lugar de una lista de
+objetos:
+
+- inputs: valores absolutos de las seis variables para cada escenario
+- deltas / overrides: cambios sobre el pronóstico actual (sumas o valores
+  fijos); cada escenario se aplica a todos los días pedidos
+
+Los arreglos se validan y expanden con numpy y todas las filas se evalúan
+en una sola llamada por modelo.
+"""
+
+from datetime import date
+
+import numpy as np
+
+import config
+
+
+class ScenarioError(ValueError):
+    """Escenario inválido (la API responde 400)"""
+
+
+class ScenarioTooLarge(ScenarioError):
+    """Más filas que SCENARIO_MAX_ROWS (la API responde 413)"""
+
+
+def _vector(name, value, n=None):
+    """
+    Convierte un valor o una lista en un arreglo de floats finitos
+    
+    Args:
+        name (str): Variable (para los mensajes de error)
+        value: Número o lista de números
+        n (int): Longitud exigida (los escalares se repiten n veces)
+    
+    Returns:
+        ndarray: Arreglo de floats
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float, list)):
+        raise ScenarioError(f"'{name}' debe ser un número o una lista de números")
+    try:
+        array = np.asarray(value, dtype=float)
+    except (TypeError, ValueError):
+        raise ScenarioError(f"'{name}' contiene valores no numéricos")
+    if array.ndim > 1:
+        raise ScenarioError(f"'{name}' debe ser una lista plana")
+    if not np.isfinite(array).all():
+        raise ScenarioError(f"'{name}' contiene valores vacíos o no finitos")
+    if array.ndim == 0:
+        return np.full(n or 1, float(array))
+    if n is not None and len(array) != n:
+        raise ScenarioError(f"'{name}' tiene {len(array)} valores; se esperaban {n}")
+    return array
+
+
+def _variables(body, key):
+    """Diccionario de variables del cuerpo, validando los nombres"""
+    values = body.get(key) or {}
+    if not isinstance(values, dict):
+        raise ScenarioError(f"'{key}' debe ser un objeto {{variable: valores}}")
+    unknown = [name for name in values if name not in config.WEATHER_FEATURES]
+    if unknown:
+        raise ScenarioError(
+            f"Variables desconocidas en '{key}': {', '.join(unknown)}. Opciones: {', '.join(config.WEATHER_FEATURES)}"
+        )
+    return values
+
+
+def _scenario_count(*groups):
+    """Número de escenarios: la longitud común de las listas (1 si solo hay escalares)"""
+    lengths = {len(value) for values in groups for value in values.values() if isinstance(value, list)}
+    if len(lengths) > 1:
+        raise ScenarioError(f"Las listas deben tener la misma longitud (recibidas: {sorted(lengths)})")
+    n = lengths.pop() if lengths else 1
+    if n == 0:
+        raise ScenarioError("Las listas de escenarios están vacías")
+    return n
+
+
+def _check_size(n_rows):
+    if n_rows > config.SCENARIO_MAX_ROWS:
+        raise ScenarioTooLarge(f"Demasiadas filas: {n_rows} (máximo {config.SCENARIO_MAX_ROWS})")
+
+
+def from_inputs(body):
+    """
+    Escenarios con valores absolutos
+    
+    Args:
+        body (dict): {'inputs': {variable: valores}, 'date' o 'dates'}
+    
+    Returns:
+        tuple: (weather, dates, scenario, day) con un arreglo por variable,
+            la fecha de cada fila, el índice de escenario y el de día
+    """
+    inputs = _variables(body, 'inputs')
+    missing = [name for name in config.WEATHER_FEATURES if name not in inputs]
+    if missing:
+        raise ScenarioError(f"Faltan variables en 'inputs': {', '.join(missing)}")
+    n = _scenario_count(inputs)
+    _check_size(n)
+    weather = {name: _vector(name, value, n) for name, value in inputs.items()}
+    
+    if 'dates' in body:
+        dates = body['dates']
+        if not isinstance(dates, list) or len(dates) != n:
+            raise ScenarioError(f"'dates' debe ser una lista de {n} fechas")
+    else:
+        dates = [body.get('date') or date.today().isoformat()] * n
+    try:
+        dates = np.asarray(dates, dtype='datetime64[D]')
+    except (TypeError, ValueError):
+        raise ScenarioError("Fechas inválidas (formato YYYY-MM-DD)")
+    
+    return weather, dates, np.arange(n), np.zeros(n, dtype=int)
+
+
+def from_forecast(body, base_rows):
+    """
+    Escenarios como cambios sobre el pronóstico
+    
+    Las filas quedan ordenadas por escenario y, dentro de cada uno, por día.
+    
+    Args:
+        body (dict): {'deltas': {...}, 'overrides': {...}}
+        base_rows (list): Datos meteorológicos de hoy y los días siguientes
+    
+    Returns:
+        tuple: (weather, dates, scenario, day), igual que from_inputs
+    """
+    deltas = _variables(body, 'deltas')
+    overrides = _variables(body, 'overrides')
+    if not deltas and not overrides:
+        raise ScenarioError("Indica 'inputs' (valores absolutos) o 'deltas'/'overrides' sobre el pronóstico")
+    both = set(deltas) & set(overrides)
+    if both:
+        raise ScenarioError(f"Variables en 'deltas' y 'overrides' a la vez: {', '.join(sorted(both))}")
+    
+    n = _scenario_count(deltas, overrides)
+    n_days = len(base_rows)
+    _check_size(n * n_days)
+    
+    weather = {}
+    for name in config.WEATHER_FEATURES:
+        base = np.tile(np.array([row[name] for row in base_rows], dtype=float), n)
+        if name in overrides:
+            weather[name] = np.repeat(_vector(name, overrides[name], n), n_days)
+        elif name in deltas:
+            weather[name] = base + np.repeat(_vector(name, deltas[name], n), n_days)
+        else:
+            weather[name] = base
+    
+    days = [row.get('date', row.get('timestamp')) for row in base_rows]
+    dates = np.tile(np.array([np.datetime64(d, 'D') for d in days]), n)
+    return weather, dates, np.repeat(np.arange(n), n_days), np.tile(np.arange(n_days), n)
+
+
+def grid_inputs(base_row, axes):
+    """
+    Malla de una o dos variables sobre una fila base (dependencia parcial)
+    
+    Args:
+        base_row (dict): Datos meteorológicos que se mantienen fijos
+        axes (dict): Variable -> arreglo de valores a recorrer (1 o 2 variables)
+    
+    Returns:
+        dict: Variable -> arreglo con una posición por punto de la malla; con
+            dos variables el orden es el de np.meshgrid(indexing='ij')
+    """
+    mesh = np.meshgrid(*axes.values(), indexing='ij')
+    n = mesh[0].size
+    weather = {name: np.full(n, float(base_row[name])) for name in config.WEATHER_FEATURES}
+    for name, values in zip(axes, mesh):
+        weather[name] = values.ravel()
+    return weather
@@ -0,0 +1,159 @@
+"""
+Estaciones de medición del histórico
+
+Una estación es un par de coordenadas (columnas lat/lon del CSV,
+redondeadas a COORD_DECIMALS); las filas sin coordenadas pertenecen a la
+de config.LATITUDE/LONGITUDE. Con más de una estación, train_models
+entrena un juego de modelos por estación:
+
+- la estación principal (la más cercana a las coordenadas de config) se
+  guarda en la raíz de la versión, con el mismo formato que una versión
+  de una sola estación
+- las demás en stations/<estación>/ (modelos, escaladores, columnas y
+  climatología propios)
+- stations.joblib es el índice: coordenadas, directorio, filas y
+  contaminantes de cada estación
+
+Al cargar una versión solo se lee el índice y los modelos de la estación
+principal; los de otra estación se cargan la primera vez que una
+petición se enruta a ella (AirQualityModel.for_station), de modo que el
+arranque no crece con el número de estaciones.
+"""
+
+import math
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import config
+
+
+STATIONS_FILENAME = 'stations.joblib'
+
+# Decimales de las coordenadas que identifican una estación (~11 m)
+COORD_DECIMALS = 4
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def station_id(lat, lon):
+    """Identificador de la estación en unas coordenadas ('-13.1631_-74.2236')"""
+    return f"{round(lat, COORD_DECIMALS):.{COORD_DECIMALS}f}_{round(lon, COORD_DECIMALS):.{COORD_DECIMALS}f}"
+
+
+def coordinates(columns, n):
+    """
+    Latitud y longitud de cada fila (las vacías toman las de config)
+    
+    Args:
+        columns: DataFrame o diccionario de columnas (lat/lon opcionales)
+        n (int): Número de filas
+    
+    Returns:
+        tuple: (lat, lon) como arreglos redondeados a COORD_DECIMALS
+    """
+    lat = np.asarray(columns['lat'], dtype=float) if 'lat' in columns else np.full(n, np.nan)
+    lon = np.asarray(columns['lon'], dtype=float) if 'lon' in columns else np.full(n, np.nan)
+    lat = np.where(np.isnan(lat), config.LATITUDE, lat).round(COORD_DECIMALS)
+    lon = np.where(np.isnan(lon), config.LONGITUDE, lon).round(COORD_DECIMALS)
+    return lat, lon
+
+
+def assign_stations(df):
+    """
+    Agrega la columna 'station' a partir de lat/lon
+    
+    Los identificadores se calculan una vez por par de coordenadas
+    distinto, no por fila.
+    
+    Args:
+        df (DataFrame): Datos con columnas lat/lon (opcionales)
+    
+    Returns:
+        DataFrame: El mismo DataFrame con 'station'
+    """
+    lat, lon = coordinates(df, len(df))
+    codes, pairs = pd.factorize(pd.MultiIndex.from_arrays([lat, lon]))
+    ids = np.array([station_id(a, b) for a, b in pairs], dtype=object)
+    df['station'] = ids[codes]
+    return df
+
+
+def distance_km(lat, lon, lats, lons):
+    """Distancia de gran círculo (haversine) de un punto a varios"""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class StationIndex:
+    """Estaciones de una versión de modelos y búsqueda de la más cercana"""
+    
+    def __init__(self, stations, primary):
+        """
+        Args:
+            stations (dict): {estación: {'lat', 'lon', 'path', 'rows', 'pollutants'}}
+                con 'path' relativo al directorio de la versión ('' = raíz)
+            primary (str): Estación guardada en la raíz
+        """
+        self.stations = stations
+        self.primary = primary
+        self.ids = list(stations)
+        self.lats = np.array([stations[s]['lat'] for s in self.ids], dtype=float)
+        self.lons = np.array([stations[s]['lon'] for s in self.ids], dtype=float)
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    def __contains__(self, station):
+        return station in self.stations
+    
+    def nearest(self, lat, lon):
+        """
+        Estación más cercana a unas coordenadas
+        
+        Returns:
+            tuple: (estación, distancia en km)
+        """
+        distances = distance_km(lat, lon, self.lats, self.lons)
+        i = int(np.argmin(distances))
+        return self.ids[i], float(distances[i])
+    
+    def directory(self, base_dir, station):
+        """Directorio con los modelos de una estación"""
+        return os.path.join(base_dir, self.stations[station]['path'])
+    
+    def coordinates(self, station):
+        """(lat, lon) de una estación"""
+        return self.stations[station]['lat'], self.stations[station]['lon']
+    
+    def save(self, directory):
+        joblib.dump({'primary': self.primary, 'stations': self.stations}, os.path.join(directory, STATIONS_FILENAME))
+    
+    @classmethod
+    def load(cls, directory):
+        """Índice de una versión (None si es de una sola estación)"""
+        path = os.path.join(directory, STATIONS_FILENAME)
+        if not os.path.exists(path):
+            return None
+        data = joblib.load(path)
+        return cls(data['stations'], data['primary'])
+
+
+def primary_station(station_coordinates):
+    """
+    Estación principal: la más cercana a config.LATITUDE/LONGITUDE
+    
+    Args:
+        station_coordinates (dict): {estación: (lat, lon)}
+    
+    Returns:
+        str: Estación
+    """
+    ids = list(station_coordinates)
+    lats = np.array([station_coordinates[s][0] for s in ids])
+    lons = np.array([station_coordinates[s][1] for s in ids])
+    return ids[int(np.argmin(distance_km(config.LATITUDE, config.LONGITUDE, lats, lons)))]
@@ -0,0 +1,51 @@
+"""
+Configuración común de las pruebas
+
+Las pruebas no usan la red: la API se prueba en el mismo proceso con el
+servidor de reemplazo de OpenWeatherMap (benchmarks/owm_server.py) y las
+métricas de cada sesión se escriben en un directorio temporal.
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+# Antes de importar config/metrics: no mezclar con las métricas de una API en ejecución
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='airquality_test_metrics_'))
+
+# Token de administración propio (activa el perfilado bajo demanda) y perfiles temporales
+ADMIN_TOKEN = 'token-de-pruebas'
+os.environ['ADMIN_TOKEN'] = ADMIN_TOKEN
+os.environ['PROFILES_PATH'] = tempfile.mkdtemp(prefix='airquality_test_profiles_')
+
+import pytest
+
+import config
+
+
+@pytest.fixture(scope='session')
+def stand_in():
+    """Servidor local con las respuestas grabadas de OpenWeatherMap"""
+    import owm_server
+    
+    server = owm_server.start_server()
+    config.OPENWEATHER_BASE_URL = server.base_url
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(scope='session')
+def api_client(stand_in):
+    """Cliente de la API (un solo worker en el proceso de pruebas) con los modelos listos"""
+    from fastapi.testclient import TestClient
+    
+    config.MODEL_RELOAD_INTERVAL = 0
+    import api
+    
+    with TestClient(api.app) as client:
+        assert api.readiness.wait(60), "Los modelos no se cargaron"
+        yield client
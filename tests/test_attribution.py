@@ -0,0 +1,51 @@
+"""
+Atribución por caminos (explain=true): base + contribuciones = predicción
+"""
+
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import config
+from train_model import AirQualityModel
+
+
+def weather_rows(n=40, seed=0):
+    """Filas meteorológicas variadas alrededor del clima de Huamanga"""
+    rng = np.random.default_rng(seed)
+    start = date(2025, 1, 1)
+    return [{
+        'date': start + timedelta(days=int(rng.integers(0, 365))),
+        'temperature': rng.uniform(275, 300),
+        'dewpoint': rng.uniform(260, 290),
+        'pressure': rng.uniform(67000, 69500),
+        'wind_u': rng.uniform(-6, 6),
+        'wind_v': rng.uniform(-6, 6),
+        'precipitation': rng.uniform(0, 0.02),
+    } for _ in range(n)]
+
+
+@pytest.mark.parametrize('float32, tolerance', [(False, 1e-9), (True, 1e-4)])
+def test_contributions_add_up_to_the_prediction(float32, tolerance):
+    model = AirQualityModel(float32=float32)
+    assert model.load_models(lazy=False)
+    rows = weather_rows()
+    
+    explanations = model.explain(rows)
+    assert set(explanations) == set(model.models) and set(model.models) <= set(config.TARGET_POLLUTANTS)
+    X = model.feature_frame(rows)
+    predicted = model.predict_matrix(X, list(model.models))
+    
+    for pollutant, (bias, contributions) in explanations.items():
+        assert list(contributions.columns) == model.feature_columns
+        assert len(contributions) == len(rows)
+        unclipped = bias + contributions.sum(axis=1).to_numpy()
+        scale = max(np.abs(unclipped).max(), abs(bias))
+        # Antes de recortar en 0 la suma es exactamente la salida del ensamble
+        raw = model.models[pollutant].predict(model.scalers[pollutant].transform(X.astype(model.feature_dtype)))
+        assert unclipped == pytest.approx(raw, abs=tolerance * scale), pollutant
+        # y recortada, la predicción que sirve /predict
+        assert np.maximum(0, unclipped) == pytest.approx(predicted[pollutant], abs=tolerance * scale), pollutant
+        # Las contribuciones se reparten entre características (no todo en una)
+        assert (contributions.abs().sum(axis=0) > 0).sum() > 1, pollutant
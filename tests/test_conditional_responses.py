@@ -0,0 +1,126 @@
+"""
+ETag, If-None-Match y caché de respuestas (/weather/*, /predict)
+"""
+
+import os
+import shutil
+
+import config
+from http_cache import ResponseCache, etag_matches, make_etag
+
+
+def test_make_etag_depends_on_every_part():
+    assert make_etag('current@1.0', 'predict', 7) == make_etag('current@1.0', 'predict', 7)
+    assert make_etag('current@1.0', 'predict', 7) != make_etag('current@2.0', 'predict', 7)
+    assert make_etag('current@1.0', 'predict', 7) != make_etag('current@1.0', 'predict', 6)
+
+
+def test_etag_matches_lists_weak_and_wildcard():
+    etag = make_etag('x')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"otro", W/{etag}', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches('"otro"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.put('a', b'1')
+    cache.put('b', b'2')
+    cache.get('a')
+    cache.put('c', b'3')
+    assert cache.get('a') == b'1'
+    assert cache.get('b') is None
+    assert len(cache) == 2
+
+
+def test_weather_not_modified_until_snapshot_changes(api_client):
+    import api
+
+    first = api_client.get('/weather/current')
+    assert first.status_code == 200
+    etag = first.headers['etag']
+    assert 'max-age=' in first.headers['cache-control']
+
+    again = api_client.get('/weather/current', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.content == b''
+
+    # Sin If-None-Match se sirve el mismo cuerpo desde la caché de respuestas
+    cached = api_client.get('/weather/current')
+    assert cached.headers['etag'] == etag
+    assert cached.content == first.content
+
+    # Una descarga nueva de OpenWeatherMap cambia la instantánea y el ETag
+    api.weather_api._cache.clear()
+    refreshed = api_client.get('/weather/current', headers={'If-None-Match': etag})
+    assert refreshed.status_code == 200
+    assert refreshed.headers['etag'] != etag
+
+
+def test_predict_etag_varies_with_parameters(api_client):
+    three = api_client.get('/predict', params={'days': 3})
+    two = api_client.get('/predict', params={'days': 2})
+    assert three.status_code == two.status_code == 200
+    assert three.headers['etag'] != two.headers['etag']
+
+    columnar = api_client.get('/predict', params={'days': 3, 'format': 'columnar'})
+    assert columnar.headers['etag'] != three.headers['etag']
+    assert api_client.get('/predict', params={'days': 3}, headers={'If-None-Match': three.headers['etag']}).status_code == 304
+
+
+def test_predict_etag_changes_when_history_grows(api_client, tmp_path, monkeypatch):
+    data_path = tmp_path / 'history.csv'
+    shutil.copy(config.DATA_PATH, data_path)
+    monkeypatch.setattr(config, 'DATA_PATH', str(data_path))
+
+    etag = api_client.get('/predict/today').headers['etag']
+    assert api_client.get('/predict/today', headers={'If-None-Match': etag}).status_code == 304
+
+    # ingest.py agrega días al final: cambian los promedios móviles de las características
+    with open(data_path, 'rb') as f:
+        last_line = f.read().rstrip(b'\n').rsplit(b'\n', 1)[-1]
+    with open(data_path, 'ab') as f:
+        f.write(last_line + b'\n')
+    os.utime(data_path)
+
+    response = api_client.get('/predict/today', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] != etag
+
+
+
+def test_weather_body_matches_its_etag_when_refreshed_concurrently(api_client, monkeypatch):
+    import api
+
+    client = api.weather_api
+    client._cache.clear()
+    fetchers = {'current': 'get_current_weather', 'forecast': 'get_forecast', 'pollution': 'get_air_pollution'}
+
+    def refreshed_after_fetch(key, fetch):
+        def fetch_then_refresh(*args):
+            # Otra petición descarga datos nuevos justo después de esta consulta
+            result = fetch(*args)
+            data = client._cache[key]['data']
+            field = 'NO2' if key == 'pollution' else 'temperature'
+            newer = [dict(day, **{field: day[field] + 10}) for day in data] if key == 'forecast' \
+                else dict(data, **{field: data[field] + 10})
+            client._store_cached(key, newer)
+            return result
+        return fetch_then_refresh
+
+    for key, name in fetchers.items():
+        # En el __dict__ de la instancia: al deshacerlo se borra (no queda el método enlazado)
+        monkeypatch.setitem(vars(client), name, refreshed_after_fetch(key, getattr(client, name)))
+    first = {path: api_client.get(f'/weather/{path}') for path in fetchers}
+    monkeypatch.undo()
+
+    # Sin la caché de respuestas el cuerpo se vuelve a construir
+    monkeypatch.setattr(api, 'response_cache', ResponseCache())
+    for path, response in first.items():
+        assert response.status_code == 200
+        # El cuerpo servido es el de la instantánea que identifica su ETag
+        rebuilt = api_client.get(f'/weather/{path}')
+        assert rebuilt.headers['etag'] == response.headers['etag']
+        assert rebuilt.content == response.content
@@ -0,0 +1,145 @@
+"""
+Datos históricos en memoria: rangos por fecha, agregación semanal/mensual
+y paginación de /history, comparados con pandas sobre el mismo CSV
+"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import config
+from historical_store import HistoricalStore
+
+COLUMNS = ['NO2', 'temperature', 'temp_surface']
+# Semanas desde el lunes y meses, etiquetados por su primer día
+RESAMPLE_RULES = {'week': 'W-MON', 'month': 'MS'}
+
+
+@pytest.fixture(scope='module')
+def history():
+    df = pd.read_csv(config.DATA_PATH, parse_dates=['date'])
+    return df.sort_values('date', kind='stable').reset_index(drop=True)
+
+
+@pytest.fixture(scope='module')
+def store():
+    return HistoricalStore(config.DATA_PATH)
+
+
+def resampled(history, period, start=None, end=None):
+    """Estadísticos de pandas por periodo (sin los periodos sin filas)"""
+    df = history
+    if start is not None:
+        df = df[df['date'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['date'] <= pd.Timestamp(end)]
+    resampler = df.set_index('date')[COLUMNS].resample(RESAMPLE_RULES[period], label='left', closed='left')
+    result = resampler.agg(['count', 'mean', 'min', 'max'])
+    return result[resampler.size() > 0]
+
+
+def assert_matches(rows, expected):
+    assert [row['period_start'] for row in rows] == [d.date().isoformat() for d in expected.index]
+    for row, (_, values) in zip(rows, expected.iterrows()):
+        for column in COLUMNS:
+            assert row[f'{column}_count'] == values[(column, 'count')]
+            for stat in ('mean', 'min', 'max'):
+                if values[(column, 'count')] == 0:
+                    assert row[f'{column}_{stat}'] is None
+                else:
+                    assert row[f'{column}_{stat}'] == pytest.approx(values[(column, stat)], rel=1e-9)
+
+
+def test_range_indices_match_a_date_mask(store, history):
+    for start, end in [(None, None), (date(2021, 3, 1), date(2021, 3, 31)), (date(2019, 1, 1), date(2020, 1, 1)),
+                       (date(2025, 9, 29), None), (date(2030, 1, 1), None), (date(2022, 6, 1), date(2022, 5, 1))]:
+        lo, hi = store.range_indices(start, end)
+        mask = np.ones(len(history), dtype=bool)
+        if start is not None:
+            mask &= (history['date'] >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (history['date'] <= pd.Timestamp(end)).to_numpy()
+        positions = np.flatnonzero(mask)
+        assert (lo, hi) == ((positions[0], positions[-1] + 1) if len(positions) else (lo, lo))
+
+
+@pytest.mark.parametrize('period', ['week', 'month'])
+def test_aggregate_matches_pandas_resample(store, history, period):
+    assert_matches(store.aggregate(*store.range_indices(), COLUMNS, period), resampled(history, period))
+    
+    # Un rango que empieza y termina a mitad de periodo
+    start, end = date(2021, 2, 17), date(2021, 7, 9)
+    assert_matches(
+        store.aggregate(*store.range_indices(start, end), COLUMNS, period),
+        resampled(history, period, start, end)
+    )
+
+
+def test_aggregate_only_requested_stats(store):
+    rows = store.aggregate(*store.range_indices(date(2021, 1, 1), date(2021, 12, 31)), ['NO2'], 'month', ('max',))
+    assert len(rows) == 12
+    assert set(rows[0]) == {'period_start', 'NO2_count', 'NO2_max'}
+    assert store.aggregate(5, 5, ['NO2']) == []
+
+
+def test_iter_rows_chunks_cover_the_range(store, history):
+    lo, hi = store.range_indices(date(2022, 1, 1), date(2022, 12, 31))
+    chunks = list(store.iter_rows(lo, hi, COLUMNS, chunk_size=100))
+    assert [len(chunk) for chunk in chunks] == [100, 100, 100, hi - lo - 300]
+    
+    rows = [row for chunk in chunks for row in chunk]
+    expected = history.iloc[lo:hi]
+    assert [row['date'] for row in rows] == [d.date().isoformat() for d in expected['date']]
+    for row, (_, values) in zip(rows, expected.iterrows()):
+        for column in COLUMNS:
+            if pd.isna(values[column]):
+                assert row[column] is None
+            else:
+                assert row[column] == pytest.approx(values[column], rel=1e-12)
+
+
+def test_history_endpoint_aggregates_like_pandas(api_client, history):
+    response = api_client.get('/history', params={
+        'start': '2021-02-17', 'end': '2021-07-09', 'aggregate': 'week', 'columns': ','.join(COLUMNS), 'limit': 100000,
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert body['aggregate'] == 'week' and body['next_offset'] is None
+    assert_matches(body['rows'], resampled(history, 'week', date(2021, 2, 17), date(2021, 7, 9)))
+    assert body['total'] == len(body['rows'])
+
+
+def test_history_endpoint_validates_stats_and_columns(api_client):
+    for params in ({'aggregate': 'month', 'stats': 'mean,median'}, {'aggregate': 'week', 'stats': ' , '},
+                   {'columns': 'NO2,no_existe'}):
+        response = api_client.get('/history', params=params)
+        assert response.status_code == 400, params
+    # Sin aggregate el parámetro stats no se usa
+    assert api_client.get('/history', params={'stats': 'median', 'limit': 1}).status_code == 200
+    assert api_client.get('/history', params={'aggregate': 'day'}).status_code == 422
+
+
+def test_history_endpoint_pages_and_streams(api_client, history):
+    params = {'start': '2023-01-01', 'end': '2023-12-31', 'columns': 'NO2'}
+    expected = history[(history['date'] >= '2023-01-01') & (history['date'] <= '2023-12-31')]
+    
+    rows, offset, pages = [], 0, 0
+    while offset is not None:
+        page = api_client.get('/history', params=dict(params, offset=offset, limit=100)).json()
+        assert page['total'] == len(expected) and page['columns'] == ['date', 'NO2']
+        rows += page['rows']
+        offset = page['next_offset']
+        pages += 1
+    assert pages == -(-len(expected) // 100)
+    assert [row['date'] for row in rows] == [d.date().isoformat() for d in expected['date']]
+    
+    past_the_end = api_client.get('/history', params=dict(params, offset=len(expected) + 10)).json()
+    assert past_the_end['rows'] == [] and past_the_end['next_offset'] is None
+    
+    csv = api_client.get('/history', params=dict(params, format='csv'))
+    lines = csv.text.splitlines()
+    assert lines[0] == 'date,NO2' and len(lines) == len(expected) + 1
+    ndjson = api_client.get('/history', params=dict(params, format='ndjson', limit=10))
+    assert len(ndjson.text.splitlines()) == 10
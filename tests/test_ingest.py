@@ -0,0 +1,126 @@
+"""
+Ingesta: días cerrados agregados al final del CSV histórico sin reescribirlo
+"""
+
+import json
+import shutil
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import config
+import ingest
+from historical_store import get_store
+
+
+@pytest.fixture
+def data_path(tmp_path):
+    """Copia del CSV histórico (termina el 2025-09-29)"""
+    path = tmp_path / 'history.csv'
+    shutil.copy(config.DATA_PATH, path)
+    return path
+
+
+def sample(timestamp, temperature=290.0, no2=3e-5):
+    values = {feature: 1.0 for feature in config.WEATHER_FEATURES}
+    values.update(temperature=temperature, NO2=no2, CO=0.02, O3=0.1, SO2=1e-6)
+    return dict(values, timestamp=timestamp)
+
+
+def day_row(temperature):
+    return ingest.daily_rows([sample('2025-01-01T12:00:00', temperature)])['2025-01-01']
+
+
+def test_append_rows_skips_dates_already_in_the_file(data_path):
+    before = pd.read_csv(data_path)
+    rows = {'2025-09-28': day_row(280.0), '2025-09-29': day_row(281.0),
+            '2025-09-30': day_row(282.0), '2025-10-01': day_row(283.0)}
+    
+    assert ingest.append_rows(rows, str(data_path)) == ['2025-09-30', '2025-10-01']
+    # Repetir la ejecución no duplica filas
+    assert ingest.append_rows(rows, str(data_path)) == []
+    
+    after = pd.read_csv(data_path)
+    assert len(after) == len(before) + 2
+    pd.testing.assert_frame_equal(after.iloc[:len(before)], before)
+    added = after.iloc[len(before):]
+    assert added['date'].tolist() == ['2025-09-30', '2025-10-01']
+    assert added['temperature'].tolist() == [282.0, 283.0]
+    assert (added['lat'] == config.LATITUDE).all() and (added['lon'] == config.LONGITUDE).all()
+    # Las columnas sin valor quedan vacías, como en el dataset
+    assert added['temp_surface'].isna().all()
+
+
+def test_append_rows_after_a_missing_trailing_newline(data_path):
+    content = data_path.read_bytes().rstrip(b'\n')
+    data_path.write_bytes(content)
+    with open(data_path, 'rb') as f:
+        assert ingest.last_date(f) == '2025-09-29'
+    
+    assert ingest.append_rows({'2025-09-30': day_row(282.0)}, str(data_path)) == ['2025-09-30']
+    
+    lines = data_path.read_bytes().split(b'\n')
+    assert lines[-1] == b''
+    assert lines[-3] == content.rsplit(b'\n', 1)[-1]
+    assert lines[-2].startswith(b'2025-09-30,')
+    with open(data_path, 'rb') as f:
+        assert ingest.last_date(f) == '2025-09-30'
+
+
+def test_last_date_of_an_empty_history(tmp_path):
+    path = tmp_path / 'empty.csv'
+    path.write_text(','.join(['date'] + config.WEATHER_FEATURES) + '\n')
+    with open(path, 'rb') as f:
+        assert ingest.last_date(f) is None
+    
+    assert ingest.append_rows({'2025-01-01': day_row(280.0)}, str(path)) == ['2025-01-01']
+    assert pd.read_csv(path)['date'].tolist() == ['2025-01-01']
+
+
+def test_flush_appends_closed_days_and_cleans_their_samples(data_path, tmp_path):
+    samples_path = tmp_path / 'samples.jsonl'
+    today = datetime.combine(date.today(), datetime.min.time())
+    samples = [
+        # Ya está en el histórico
+        sample('2025-09-29T10:00:00'), sample('2025-09-29T16:00:00'),
+        # Día cerrado completo: se agrega con el promedio de sus muestras
+        sample('2025-09-30T10:00:00', 280.0, 2e-5), sample('2025-09-30T16:00:00', 284.0, 4e-5),
+        # Día cerrado con muestras insuficientes: no se agrega
+        sample('2025-10-01T10:00:00'),
+        # Día en curso: se conserva para la próxima ejecución
+        sample((today + timedelta(hours=1)).isoformat(timespec='seconds')),
+    ]
+    for s in samples:
+        ingest.append_sample(s, str(samples_path))
+    with open(samples_path, 'a') as f:
+        f.write('{"timestamp": "2025-10-0')  # línea a medio escribir
+    
+    assert ingest.flush(str(samples_path), str(data_path), min_samples=2) == ['2025-09-30']
+    
+    added = pd.read_csv(data_path).iloc[-1]
+    assert added['date'] == '2025-09-30'
+    assert added['temperature'] == pytest.approx(282.0)
+    assert added['NO2'] == pytest.approx(3e-5)
+    
+    remaining = [json.loads(line) for line in samples_path.read_text().splitlines()]
+    assert remaining == [samples[-1]]
+    assert ingest.flush(str(samples_path), str(data_path), min_samples=2) == []
+
+
+def test_store_picks_up_only_the_appended_rows(data_path):
+    store = get_store(str(data_path))
+    rows, generation = len(store), store.generation
+    
+    ingest.append_rows({'2025-09-30': day_row(282.0), '2025-10-01': day_row(283.0)}, str(data_path))
+    
+    refreshed = get_store(str(data_path))
+    # Se incorporan las filas nuevas al mismo objeto (sin recargar el CSV completo)
+    assert refreshed is store
+    assert len(refreshed) == rows + 2
+    assert refreshed.generation != generation
+    assert [str(d) for d in refreshed.dates[-3:]] == ['2025-09-29', '2025-09-30', '2025-10-01']
+    assert refreshed.columns['temperature'][-2:].tolist() == [282.0, 283.0]
+    assert refreshed.moving_averages(['temperature'])['temperature_ma7'] == pytest.approx(
+        pd.read_csv(data_path)['temperature'].tail(7).mean()
+    )
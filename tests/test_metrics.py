@@ -0,0 +1,92 @@
+"""
+Agregación de métricas entre workers (archivos por pid en METRICS_DIR)
+"""
+
+import os
+import subprocess
+import sys
+import threading
+
+from metrics import RETIRED_FILENAME, MetricsRegistry
+
+
+def run_worker(directory, requests):
+    """Simula un worker que atiende peticiones, guarda sus métricas y termina"""
+    code = (
+        "import sys\n"
+        "from metrics import MetricsRegistry\n"
+        "registry = MetricsRegistry(directory=sys.argv[1], flush_interval=0)\n"
+        "registry.inc('requests_total', int(sys.argv[2]), endpoint='/predict')\n"
+        "registry.observe('request_duration_seconds', 0.02, endpoint='/predict')\n"
+        "registry.flush()\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', code, str(directory), str(requests)], cwd=root, check=True)
+
+
+def counter(registry, name):
+    counters, _, _ = registry._collect()
+    return sum(value for (n, _), value in counters.items() if n == name)
+
+
+def test_counters_sum_live_and_exited_workers(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval=0)
+    registry.inc('requests_total', 3, endpoint='/predict')
+    run_worker(tmp_path, 12)
+
+    assert counter(registry, 'requests_total') == 15
+
+
+def test_counters_stay_monotonic_after_worker_exit(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval=0)
+    run_worker(tmp_path, 12)
+
+    readings = [counter(registry, 'requests_total') for _ in range(3)]
+    run_worker(tmp_path, 5)
+    readings += [counter(registry, 'requests_total') for _ in range(3)]
+
+    # El archivo del worker terminado se retira una sola vez y sus totales se conservan
+    assert readings == [12, 12, 12, 17, 17, 17]
+    assert not [f for f in os.listdir(tmp_path) if f.startswith('metrics_') and f != f'metrics_{os.getpid()}.json']
+    assert os.path.exists(tmp_path / RETIRED_FILENAME)
+
+    _, _, histograms = registry._collect()
+    assert sum(h['count'] for (n, _), h in histograms.items() if n == 'request_duration_seconds') == 2
+
+
+def test_retired_totals_shared_by_collectors(tmp_path):
+    first = MetricsRegistry(directory=str(tmp_path), flush_interval=0)
+    second = MetricsRegistry(directory=str(tmp_path), flush_interval=0)
+    run_worker(tmp_path, 7)
+
+    assert counter(first, 'requests_total') == 7
+    assert counter(second, 'requests_total') == 7
+
+
+def test_concurrent_flushes_leave_a_complete_file(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval=0)
+
+    def work():
+        for _ in range(100):
+            registry.inc('requests_total')
+            registry.flush()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter(registry, 'requests_total') == 800
+    assert not [f for f in os.listdir(tmp_path) if f.endswith('.tmp')]
+
+
+def test_render_exposes_prometheus_text(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path), flush_interval=0)
+    registry.inc('requests_total', endpoint='/predict')
+    registry.observe('request_duration_seconds', 0.05, endpoint='/predict')
+
+    text = registry.render()
+    assert '# TYPE airquality_requests_total counter' in text
+    assert 'airquality_requests_total{endpoint="/predict"} 1' in text
+    assert 'airquality_request_duration_seconds_count{endpoint="/predict"} 1' in text
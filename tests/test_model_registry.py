@@ -0,0 +1,137 @@
+"""
+Registro de versiones: publicación, promoción (punteros atómicos), exportación
+de los archivos planos y cambio de versión en caliente
+"""
+
+import os
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+import config
+import model_registry
+from model_serving import ModelWatcher
+from train_model import AirQualityModel
+
+from conftest import ROOT
+
+
+@pytest.fixture
+def model_path(tmp_path, monkeypatch):
+    """MODEL_PATH temporal con una copia de los modelos planos del repositorio"""
+    path = tmp_path / 'models'
+    path.mkdir()
+    model_registry.copy_model_files(os.path.join(ROOT, 'models'), str(path))
+    monkeypatch.setattr(config, 'MODEL_PATH', str(path))
+    return path
+
+
+def publish_variant(source_version, drop=(), replace=None):
+    """Publica una versión derivada de otra (sin algunos archivos o con otros reemplazados)"""
+    staging = model_registry.staging_dir()
+    model_registry.copy_model_files(model_registry.version_path(source_version), staging)
+    for filename in drop:
+        os.remove(os.path.join(staging, filename))
+    for filename, source in (replace or {}).items():
+        shutil.copy2(os.path.join(staging, source), os.path.join(staging, filename))
+    return model_registry.publish(staging, {'source': 'test'})
+
+
+def leftovers(directory):
+    return [name for name in os.listdir(directory) if name.startswith('.')]
+
+
+def test_import_publishes_a_verified_version(model_path):
+    version = model_registry.import_directory()
+
+    manifest = model_registry.read_manifest(version)
+    assert manifest['version'] == version
+    assert 'climatology.joblib' in manifest['files']
+    assert 'NO2' in manifest['pollutants']
+    assert model_registry.verify(version) == []
+    # El staging se publicó con un rename: no queda nada a medias en versions/
+    assert leftovers(model_registry.versions_dir()) == []
+    assert [m['version'] for m in model_registry.list_versions()] == [version]
+
+
+def test_publish_rejects_an_existing_version(model_path):
+    version = model_registry.import_directory()
+    staging = model_registry.staging_dir()
+    model_registry.copy_model_files(str(model_path), staging)
+    with pytest.raises(ValueError):
+        model_registry.publish(staging, version=version)
+
+
+def test_verify_detects_modified_files(model_path):
+    version = model_registry.import_directory()
+    with open(os.path.join(model_registry.version_path(version), 'feature_columns.joblib'), 'ab') as f:
+        f.write(b'x')
+    assert model_registry.verify(version) == ['feature_columns.joblib no coincide con el manifest']
+    with pytest.raises(ValueError):
+        model_registry.export_flat(version)
+
+
+def test_promote_swaps_the_pointer_atomically(model_path):
+    first = model_registry.import_directory()
+    second = publish_variant(first, replace={'scaler_NO2.joblib': 'scaler_CO.joblib'})
+
+    model_registry.promote(first, export=False)
+    assert model_registry.current_version() == first
+    model_registry.promote(second, export=False)
+    assert model_registry.current_version() == second
+    assert (model_path / model_registry.CURRENT_POINTER).read_text() == second + '\n'
+    # El temporal del puntero se renombró (no queda .CURRENT.*)
+    assert leftovers(model_path) == []
+
+    with pytest.raises(ValueError):
+        model_registry.promote('no-existe')
+    assert model_registry.current_version() == second
+
+    directory, version = model_registry.resolve()
+    assert (directory, version) == (model_registry.version_path(second), second)
+
+
+def test_promote_refreshes_the_deployed_flat_files(model_path):
+    first = model_registry.import_directory()
+    second = publish_variant(
+        first, drop=['climatology.joblib'], replace={'scaler_NO2.joblib': 'scaler_CO.joblib'}
+    )
+
+    exported = model_registry.promote(second)
+    assert 'scaler_NO2.joblib' in exported
+    assert (model_path / 'scaler_NO2.joblib').read_bytes() == (model_path / 'scaler_CO.joblib').read_bytes()
+    # Los archivos planos quedan iguales a la versión: sin la climatología que no tiene
+    assert not (model_path / 'climatology.joblib').exists()
+    assert model_registry.model_files(str(model_path)) == model_registry.model_files(model_registry.version_path(second))
+    assert leftovers(model_path) == []
+
+    model_registry.promote(first)
+    assert (model_path / 'climatology.joblib').exists()
+
+
+def test_watcher_hot_swaps_to_the_promoted_version(model_path):
+    first = model_registry.import_directory()
+    second = publish_variant(first, replace={'scaler_NO2.joblib': 'scaler_CO.joblib'})
+    predictor = SimpleNamespace(model=AirQualityModel(), shadow=None)
+    watcher = ModelWatcher(predictor, interval=0)
+
+    model_registry.promote(first, export=False)
+    assert watcher.check()['current'] is not None
+    serving = predictor.model
+    assert serving.registry_version == first
+
+    # Sin cambios en CURRENT no se recarga nada
+    watcher.check()
+    assert predictor.model is serving
+
+    serving.ensure_loaded(['NO2'])
+    model_registry.promote(second, export=False)
+    watcher.check()
+    swapped = predictor.model
+    # Se sustituye el objeto completo: una petición en curso conserva el anterior intacto
+    assert swapped is not serving
+    assert swapped.registry_version == second
+    assert serving.registry_version == first and 'NO2' in serving.models
+    # Se precargan los contaminantes que ya estaban en memoria
+    assert 'NO2' in swapped.models
@@ -0,0 +1,142 @@
+"""
+Archivo de predicciones: escritura, consulta por índice, compactación y retención
+"""
+
+import json
+import os
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from prediction_archive import ArchiveWriter, PredictionArchive, to_table
+
+
+def run_predictions(issued_at, days=3, no2=1e-5):
+    """Una ejecución de predict: hoy y los días siguientes, con AQI"""
+    dates = [issued_at.date() + timedelta(days=i) for i in range(days)]
+    return pd.DataFrame({
+        'date': dates,
+        'NO2': [no2 * (i + 1) for i in range(days)],
+        'O3': [2e-5] * days,
+        'AQI': [50.0 + i for i in range(days)],
+        'Calidad': ['Moderada'] * days,
+        'AQI_components': [['NO2', 'O3']] * days,
+    })
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return PredictionArchive(str(tmp_path / 'archive'))
+
+
+def fill(archive, day, runs=3):
+    """Varias ejecuciones de un día, cada una en su propio archivo (como varios workers)"""
+    issued = [datetime.combine(day, datetime.min.time()) + timedelta(hours=6 * i) for i in range(runs)]
+    for i, issued_at in enumerate(issued):
+        archive.append(run_predictions(issued_at, no2=1e-5 * (i + 1)), issued_at, 'v1', 'api')
+    return issued
+
+
+def rows(archive, **filters):
+    return sorted(archive.query(**filters), key=lambda row: (row['issued_at'], row['target_date']))
+
+
+def test_query_reads_only_the_selected_row_groups(archive):
+    old_day = date.today() - timedelta(days=10)
+    fill(archive, old_day)
+    fill(archive, date.today() - timedelta(days=1))
+
+    assert len(archive.read_index()) == 6
+    selected = archive.select(issued_from=old_day, issued_to=old_day)
+    assert len(selected) == 3
+    assert all(entry['issued_at'].startswith(old_day.isoformat()) for entry in selected)
+
+    result = rows(archive, target_from=old_day + timedelta(days=2), target_to=old_day + timedelta(days=2))
+    assert len(result) == 3
+    assert {row['lead_days'] for row in result} == {2}
+    assert list(archive.query(limit=4)) == list(archive.query())[:4]
+
+    only_no2 = rows(archive, pollutants=['NO2'])[0]
+    assert 'NO2' in only_no2 and 'O3' not in only_no2
+
+
+def test_compact_keeps_every_run_and_index_entry(archive):
+    closed_day = date.today() - timedelta(days=2)
+    fill(archive, closed_day, runs=4)
+    fill(archive, date.today(), runs=2)
+    before = rows(archive)
+    index_before = archive.read_index()
+
+    assert archive.compact() == 1
+
+    index_after = archive.read_index()
+    # Una entrada por ejecución (row group), ninguna perdida ni duplicada
+    assert len(index_after) == len(index_before)
+    assert sorted(e['issued_at'] for e in index_after) == sorted(e['issued_at'] for e in index_before)
+    assert sum(e['rows'] for e in index_after) == sum(e['rows'] for e in index_before)
+    assert rows(archive) == before
+
+    partition = os.path.join(archive.root, f'issue_date={closed_day.isoformat()}')
+    assert len(os.listdir(partition)) == 1
+    # Hoy sigue abierto: no se compacta
+    assert len(os.listdir(os.path.join(archive.root, f'issue_date={date.today().isoformat()}'))) == 2
+
+    # Volver a compactar no cambia nada
+    assert archive.compact() == 0
+    assert rows(archive) == before
+
+
+def test_retention_drops_old_partitions_and_their_entries(archive):
+    old_day = date.today() - timedelta(days=40)
+    recent_day = date.today() - timedelta(days=3)
+    fill(archive, old_day)
+    fill(archive, recent_day)
+
+    assert archive.apply_retention(days=30) == 1
+    assert archive.partitions() == [recent_day]
+    assert all(e['issued_at'].startswith(recent_day.isoformat()) for e in archive.read_index())
+    assert {row['issued_at'][:10] for row in rows(archive)} == {recent_day.isoformat()}
+    assert archive.apply_retention(days=30) == 0
+
+
+def test_background_writer_flushes_on_close(archive):
+    writer = ArchiveWriter(archive, batch_size=10, flush_interval=0.05)
+    now = datetime.now()
+    for i in range(5):
+        assert writer.submit(run_predictions(now), model_version='v1', issued_at=now + timedelta(seconds=i))
+
+    assert writer.close()
+    stats = writer.stats()
+    assert (stats['written'], stats['dropped'], stats['errors'], stats['pending']) == (5, 0, 0, 0)
+    assert len(archive.read_index()) == 5
+    assert len(rows(archive)) == 15
+
+
+def test_station_column_and_files_written_before_it(archive):
+    day = date.today() - timedelta(days=2)
+    legacy_at = datetime.combine(day, datetime.min.time())
+    # Ejecución archivada antes de la columna station (archivo e índice sin ella)
+    partition = os.path.join(archive.root, f'issue_date={day.isoformat()}')
+    os.makedirs(partition)
+    legacy_path = os.path.join(partition, 'part-legacy.parquet')
+    pq.write_table(to_table(run_predictions(legacy_at), legacy_at, 'v0', 'api').drop(['station']), legacy_path)
+    with open(archive.index_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({
+            'issued_at': legacy_at.isoformat(), 'target_from': day.isoformat(),
+            'target_to': (day + timedelta(days=2)).isoformat(), 'file': os.path.relpath(legacy_path, archive.root),
+            'row_group': 0, 'rows': 3, 'model_version': 'v0',
+        }) + '\n')
+    for hour, station in ((6, 'north'), (12, 'south')):
+        issued_at = legacy_at + timedelta(hours=hour)
+        archive.append(run_predictions(issued_at), issued_at, 'v1', 'api', station=station)
+
+    assert [row['station'] for row in rows(archive)] == [None] * 3 + ['north'] * 3 + ['south'] * 3
+    assert {row['station'] for row in rows(archive, station='north', pollutants=['NO2'])} == {'north'}
+
+    # La compactación completa la columna de los archivos antiguos sin perder filas
+    assert archive.compact() == 1
+    assert [e.get('station') for e in sorted(archive.read_index(), key=lambda e: e['issued_at'])] == [None, 'north', 'south']
+    assert len(rows(archive)) == 9
+    assert len(rows(archive, station='south')) == 3
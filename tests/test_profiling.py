@@ -0,0 +1,47 @@
+"""
+Perfilado bajo demanda (X-Profile) de handlers que corren en el pool de hilos
+"""
+
+import config
+from http_cache import ResponseCache
+
+from conftest import ADMIN_TOKEN
+
+
+def profile_report(api_client, path, **params):
+    """Perfila una petición y devuelve su informe de texto"""
+    before = {p['name'] for p in api_client.get('/debug/profiles', headers={'X-Admin-Token': ADMIN_TOKEN}).json()['profiles']}
+    response = api_client.get(path, params=params, headers={'X-Profile': '1', 'X-Admin-Token': ADMIN_TOKEN})
+    assert response.status_code == 200
+    
+    profiles = api_client.get('/debug/profiles', headers={'X-Admin-Token': ADMIN_TOKEN}).json()['profiles']
+    new = [p for p in profiles if p['name'] not in before]
+    assert len(new) == 1 and new[0]['path'] == path
+    report = api_client.get(f"/debug/profiles/{new[0]['name']}", params={'kind': 'txt'},
+                            headers={'X-Admin-Token': ADMIN_TOKEN})
+    assert report.status_code == 200
+    return report.text
+
+
+def test_profiled_predict_includes_the_threadpool_work(api_client, monkeypatch):
+    import api
+    
+    assert config.ADMIN_TOKEN == ADMIN_TOKEN
+    # Sin caché de respuestas: la predicción se calcula dentro de la petición perfilada
+    monkeypatch.setattr(api, 'response_cache', ResponseCache())
+    report = profile_report(api_client, '/predict', days=2, pollutants='NO2')
+    
+    assert '(predict_current_and_forecast)' in report
+    assert 'predict_matrix' in report
+    section = report.split('=== LLAMADAS DESDE predict_current_and_forecast ===')[1].split('===')[0]
+    # El árbol de llamadas del predictor ya no está vacío
+    assert 'train_model.py' in section
+
+
+def test_unprofiled_requests_are_not_recorded(api_client):
+    headers = {'X-Admin-Token': ADMIN_TOKEN}
+    before = len(api_client.get('/debug/profiles', headers=headers).json()['profiles'])
+    assert api_client.get('/weather/current').status_code == 200
+    # X-Profile sin un token válido no activa el perfilado
+    assert api_client.get('/weather/current', headers={'X-Profile': '1', 'X-Admin-Token': 'otro'}).status_code == 200
+    assert len(api_client.get('/debug/profiles', headers=headers).json()['profiles']) == before
@@ -0,0 +1,51 @@
+"""
+Arranque en segundo plano: un calentamiento fallido se reintenta
+"""
+
+import config
+import readiness as readiness_module
+from predict import AirQualityPredictor
+from readiness import Readiness, start_warm_up
+
+
+def test_failed_warm_up_is_retried_until_ready(monkeypatch):
+    monkeypatch.setattr(config, 'WARMUP_RETRY_BASE', 0.01)
+    monkeypatch.setattr(config, 'WARMUP_RETRY_MAX', 0.02)
+    predictor = AirQualityPredictor()
+    model = predictor.model
+    load_models = model.load_models
+    calls = []
+    
+    def flaky_load_models(*args, **kwargs):
+        # Los dos primeros intentos no encuentran los modelos (p. ej. a mitad de un despliegue)
+        calls.append(1)
+        return len(calls) > 2 and load_models(*args, **kwargs)
+    
+    monkeypatch.setitem(vars(model), 'load_models', flaky_load_models)
+    started = []
+    state = Readiness()
+    
+    def after_first_attempt():
+        started.append((state.phase, state.error))
+    
+    start_warm_up(predictor, state, after_first_attempt=after_first_attempt).join(60)
+    
+    assert state.ready and state.phase == Readiness.READY
+    assert state.snapshot()['attempts'] == 3
+    assert state.error is None
+    # El vigilante del registro arranca tras el primer intento aunque haya fallado
+    assert started == [(Readiness.FAILED, 'No hay modelos entrenados (python train_model.py)')]
+
+
+def test_retry_delays_back_off(monkeypatch):
+    monkeypatch.setattr(config, 'WARMUP_RETRY_BASE', 1.0)
+    monkeypatch.setattr(config, 'WARMUP_RETRY_MAX', 4.0)
+    sleeps = []
+    monkeypatch.setattr(readiness_module.time, 'sleep', sleeps.append)
+    attempts = []
+    monkeypatch.setattr(readiness_module, 'warm_up', lambda predictor, state: attempts.append(1) or len(attempts) > 5)
+    
+    start_warm_up(None, Readiness()).join(10)
+    
+    assert len(attempts) == 6 and len(sleeps) == 5
+    assert all(0 <= delay <= min(4.0, 2 ** i) for i, delay in enumerate(sleeps))
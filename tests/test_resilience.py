@@ -0,0 +1,131 @@
+"""
+Plazos, reintentos con backoff, circuitos y últimos datos válidos (OpenWeatherMap)
+"""
+
+import random
+import time
+
+import pytest
+
+import config
+import owm_server
+import weather_api as weather_api_module
+from resilience import CircuitBreaker, Deadline, DeadlineExceeded, backoff_delay
+from weather_api import WeatherAPI
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Servidor local propio (se le inyectan fallos) y un cliente sin esperas reales"""
+    server = owm_server.start_server()
+    monkeypatch.setattr(config, 'OPENWEATHER_BASE_URL', server.base_url)
+    monkeypatch.setattr(config, 'UPSTREAM_RETRIES', 2)
+    monkeypatch.setattr(config, 'BREAKER_FAILURE_THRESHOLD', 5)
+    monkeypatch.setattr(config, 'BREAKER_RESET_TIMEOUT', 30.0)
+    sleeps = []
+    monkeypatch.setattr(weather_api_module.time, 'sleep', sleeps.append)
+    client = WeatherAPI()
+    yield server, client, sleeps
+    server.shutdown()
+
+
+def requests_sent(server, endpoint='weather'):
+    return server.stats['requests'].get(endpoint, 0)
+
+
+def test_backoff_delay_is_bounded_by_exponential_cap():
+    random.seed(1)
+    for attempt in range(1, 8):
+        limit = min(2.0, 0.2 * 2 ** (attempt - 1))
+        delays = [backoff_delay(attempt, base=0.2, cap=2.0) for _ in range(200)]
+        assert all(0 <= delay <= limit for delay in delays)
+        # Jitter completo: no todos los reintentos esperan lo mismo
+        assert max(delays) - min(delays) > limit / 2
+
+
+def test_deadline_caps_attempt_timeout_and_expires():
+    deadline = Deadline(0.5)
+    assert deadline.timeout(4.0) <= 0.5
+    assert deadline.timeout(0.1) == 0.1
+
+    expired = Deadline(0)
+    assert expired.expired()
+    with pytest.raises(DeadlineExceeded):
+        expired.timeout(4.0)
+
+
+def test_breaker_opens_and_allows_a_single_trial():
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=0.05)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Mientras la prueba está en curso no pasa ninguna otra llamada
+    assert not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_transient_errors_are_retried_with_backoff(upstream):
+    server, client, sleeps = upstream
+    server.options.error_rate = 1.0
+
+    assert client.get_current_weather() is None
+    # Primer intento + UPSTREAM_RETRIES reintentos, con una espera antes de cada reintento
+    assert requests_sent(server) == 3
+    assert len(sleeps) == 2
+    assert all(0 <= delay <= config.UPSTREAM_BACKOFF_MAX for delay in sleeps)
+
+
+def test_client_errors_are_not_retried(upstream):
+    server, client, sleeps = upstream
+    server.options.error_rate = 1.0
+    server.options.error_status = 401
+
+    assert client.get_current_weather() is None
+    assert requests_sent(server) == 1
+    assert sleeps == []
+
+
+def test_open_circuit_stops_calling_and_serves_last_known_good(upstream):
+    server, client, _ = upstream
+    fresh = client.get_current_weather()
+    assert fresh is not None
+
+    server.options.error_rate = 1.0
+    client._cache['current']['fetched_at'] -= client.cache_ttl + 1
+    stale = client.get_current_weather()
+    assert stale == fresh
+    assert client.stale_age('current') is not None
+
+    # Con BREAKER_FAILURE_THRESHOLD fallos seguidos el circuito se abre
+    while client.breakers['current'].state != CircuitBreaker.OPEN:
+        client.get_current_weather()
+    sent = requests_sent(server)
+    assert client.get_current_weather() == fresh
+    assert requests_sent(server) == sent
+
+    # Cada endpoint tiene su propio circuito
+    assert client.breakers['forecast'].state == CircuitBreaker.CLOSED
+
+
+def test_exhausted_deadline_skips_the_call(upstream):
+    server, client, _ = upstream
+    assert client.get_current_weather(Deadline(0)) is None
+    assert requests_sent(server) == 0
+    # La llamada no se hizo: no cuenta como fallo del circuito
+    assert client.breakers['current'].failures == 0
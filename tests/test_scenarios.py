@@ -0,0 +1,134 @@
+"""
+Escenarios hipotéticos: validación, expansión a filas y POST /predict/scenarios
+"""
+
+from datetime import date
+
+import numpy as np
+import pytest
+
+import config
+import scenarios
+from scenarios import ScenarioError, ScenarioTooLarge
+
+BASE = {'temperature': 290.0, 'dewpoint': 280.0, 'pressure': 68000.0, 'wind_u': 1.0, 'wind_v': -1.0, 'precipitation': 0.001}
+
+
+def test_from_inputs_broadcasts_scalars_and_dates():
+    inputs = dict(BASE, temperature=[285.0, 290.0, 295.0])
+    weather, dates, scenario, day = scenarios.from_inputs({'inputs': inputs, 'date': '2025-07-01'})
+    
+    assert weather['temperature'].tolist() == [285.0, 290.0, 295.0]
+    assert weather['pressure'].tolist() == [68000.0] * 3
+    assert dates.tolist() == [date(2025, 7, 1)] * 3
+    assert scenario.tolist() == [0, 1, 2] and day.tolist() == [0, 0, 0]
+    
+    _, dates, _, _ = scenarios.from_inputs({'inputs': inputs, 'dates': ['2025-07-01', '2025-07-02', '2025-07-03']})
+    assert [str(d) for d in dates] == ['2025-07-01', '2025-07-02', '2025-07-03']
+    _, dates, _, _ = scenarios.from_inputs({'inputs': BASE})
+    assert dates.tolist() == [date.today()]
+
+
+@pytest.mark.parametrize('body, message', [
+    ({'inputs': {k: v for k, v in BASE.items() if k != 'wind_v'}}, "Faltan variables"),
+    ({'inputs': dict(BASE, humidity=1)}, "Variables desconocidas"),
+    ({'inputs': dict(BASE, temperature=[1.0, 2.0], pressure=[1.0, 2.0, 3.0])}, "misma longitud"),
+    ({'inputs': dict(BASE, temperature=[])}, "vacías"),
+    ({'inputs': dict(BASE, temperature=[[1.0]])}, "lista plana"),
+    ({'inputs': dict(BASE, temperature='caliente')}, "número o una lista"),
+    ({'inputs': dict(BASE, temperature=True)}, "número o una lista"),
+    ({'inputs': dict(BASE, temperature=[1.0, None])}, "no finitos"),
+    ({'inputs': dict(BASE, temperature=[1.0, 'x'])}, "no numéricos"),
+    ({'inputs': dict(BASE, temperature=[1.0, 2.0]), 'dates': ['2025-07-01']}, "'dates'"),
+    ({'inputs': BASE, 'date': '01/07/2025'}, "Fechas inválidas"),
+    ({'inputs': [1, 2]}, "debe ser un objeto"),
+])
+def test_from_inputs_rejects_invalid_bodies(body, message):
+    with pytest.raises(ScenarioError, match=message):
+        scenarios.from_inputs(body)
+
+
+def test_row_limit(monkeypatch):
+    monkeypatch.setattr(config, 'SCENARIO_MAX_ROWS', 6)
+    scenarios.from_inputs({'inputs': dict(BASE, wind_u=[0.0] * 6)})
+    with pytest.raises(ScenarioTooLarge):
+        scenarios.from_inputs({'inputs': dict(BASE, wind_u=[0.0] * 7)})
+    # En forecast cuentan escenarios × días
+    with pytest.raises(ScenarioTooLarge):
+        scenarios.from_forecast({'deltas': {'wind_u': [0.0, 1.0]}}, [dict(BASE, date=date(2025, 7, d)) for d in range(1, 5)])
+    assert issubclass(ScenarioTooLarge, ScenarioError)
+
+
+def test_from_forecast_orders_rows_by_scenario_then_day():
+    base_rows = [dict(BASE, date=date(2025, 7, 1), temperature=290.0),
+                 dict(BASE, date=date(2025, 7, 2), temperature=292.0)]
+    body = {'deltas': {'temperature': [0.0, -5.0]}, 'overrides': {'wind_u': [0.5, 2.0]}}
+    weather, dates, scenario, day = scenarios.from_forecast(body, base_rows)
+    
+    assert scenario.tolist() == [0, 0, 1, 1] and day.tolist() == [0, 1, 0, 1]
+    assert weather['temperature'].tolist() == [290.0, 292.0, 285.0, 287.0]
+    assert weather['wind_u'].tolist() == [0.5, 0.5, 2.0, 2.0]
+    assert weather['pressure'].tolist() == [68000.0] * 4
+    assert [str(d) for d in dates] == ['2025-07-01', '2025-07-02'] * 2
+    
+    with pytest.raises(ScenarioError, match="a la vez"):
+        scenarios.from_forecast({'deltas': {'wind_u': 1}, 'overrides': {'wind_u': 1}}, base_rows)
+    with pytest.raises(ScenarioError, match="Indica 'inputs'"):
+        scenarios.from_forecast({}, base_rows)
+
+
+def test_grid_inputs_follows_meshgrid_ij_order():
+    weather = scenarios.grid_inputs(BASE, {'wind_u': np.array([0.0, 1.0, 2.0]), 'temperature': np.array([280.0, 300.0])})
+    assert weather['wind_u'].tolist() == [0.0, 0.0, 1.0, 1.0, 2.0, 2.0]
+    assert weather['temperature'].tolist() == [280.0, 300.0] * 3
+    assert weather['pressure'].tolist() == [68000.0] * 6
+    
+    single = scenarios.grid_inputs(BASE, {'dewpoint': np.array([270.0, 275.0])})
+    assert single['dewpoint'].tolist() == [270.0, 275.0] and single['temperature'].tolist() == [290.0, 290.0]
+
+
+def test_scenarios_endpoint_inputs_and_forecast(api_client):
+    response = api_client.post('/predict/scenarios', json={
+        'inputs': dict(BASE, wind_u=[0.0, 1.0, 2.0, 3.0]), 'date': '2025-07-01', 'pollutants': ['NO2'],
+    })
+    assert response.status_code == 200
+    body = response.json()
+    assert (body['scenarios'], body['rows'], body['AQI_components']) == (4, 4, ['NO2'])
+    assert body['columns']['scenario'] == [0, 1, 2, 3]
+    assert body['columns']['date'] == ['2025-07-01'] * 4
+    assert len(body['columns']['NO2_ugm3']) == len(body['columns']['quality']) == 4
+    
+    # Sin cambios sobre el pronóstico: las mismas predicciones que /predict
+    # (que además del tiempo actual incluye `days` días de pronóstico)
+    unchanged = api_client.post('/predict/scenarios', json={'deltas': {'temperature': 0}, 'days': 3, 'pollutants': 'NO2'})
+    assert unchanged.status_code == 200
+    predicted = api_client.get('/predict', params={'days': 3, 'pollutants': 'NO2'}).json()
+    assert unchanged.json()['columns']['NO2_ugm3'] == pytest.approx([day['NO2_ugm3'] for day in predicted[:3]])
+
+
+@pytest.mark.parametrize('payload', [
+    {'inputs': dict(BASE, humidity=1)},
+    {'deltas': {'wind_u': [1, 2]}, 'overrides': {'wind_v': [1, 2, 3]}},
+    {'deltas': {'wind_u': 1}, 'days': 0},
+    {'deltas': {'wind_u': 1}, 'days': True},
+    {'inputs': BASE, 'pollutants': 5},
+    {'inputs': BASE, 'pollutants': ['XYZ']},
+    {'inputs': BASE, 'lat': 'norte', 'lon': 0},
+    {'inputs': BASE, 'station': 3},
+    {},
+    [BASE],
+])
+def test_scenarios_endpoint_rejects_invalid_bodies(api_client, payload):
+    response = api_client.post('/predict/scenarios', json=payload)
+    assert response.status_code == 400
+    assert response.json()['detail']
+
+
+def test_scenarios_endpoint_rejects_non_json_and_oversized_bodies(api_client, monkeypatch):
+    assert api_client.post('/predict/scenarios', content=b'{no es json', headers={'Content-Type': 'application/json'}).status_code == 400
+    
+    monkeypatch.setattr(config, 'SCENARIO_MAX_ROWS', 10)
+    too_many = api_client.post('/predict/scenarios', json={'deltas': {'wind_u': [0, 1]}, 'days': 7})
+    assert too_many.status_code == 413
+    assert 'máximo 10' in too_many.json()['detail']
+    assert api_client.post('/predict/scenarios', json={'deltas': {'wind_u': [0, 1]}, 'days': 5}).status_code == 200
@@ -0,0 +1,122 @@
+"""
+Varias estaciones: identificadores, estación más cercana y enrutamiento en la API
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+import config
+import model_registry
+import stations
+from stations import StationIndex
+from train_model import AirQualityModel
+
+from conftest import ROOT
+
+
+PRIMARY = stations.station_id(config.LATITUDE, config.LONGITUDE)
+NORTH = stations.station_id(config.LATITUDE + 0.5, config.LONGITUDE)
+
+
+@pytest.fixture
+def two_stations(api_client, tmp_path, monkeypatch):
+    """La API sirve una versión con dos estaciones (la principal y otra 0.5° al norte)"""
+    import api
+
+    base = tmp_path / 'models'
+    model_registry.copy_model_files(os.path.join(ROOT, 'models'), str(base))
+    model_registry.copy_model_files(os.path.join(ROOT, 'models'), str(base / model_registry.STATIONS_DIRNAME / NORTH))
+    entry = {'rows': 1, 'pollutants': list(config.TARGET_POLLUTANTS)}
+    StationIndex({
+        PRIMARY: dict(entry, lat=config.LATITUDE, lon=config.LONGITUDE, path=''),
+        NORTH: dict(entry, lat=config.LATITUDE + 0.5, lon=config.LONGITUDE,
+                    path=os.path.join(model_registry.STATIONS_DIRNAME, NORTH)),
+    }, PRIMARY).save(str(base))
+
+    # Histórico con filas de ambas estaciones (promedios móviles por estación)
+    history = pd.read_csv(config.DATA_PATH)
+    history['lat'], history['lon'] = config.LATITUDE, config.LONGITUDE
+    north = history.assign(lat=config.LATITUDE + 0.5)
+    data_path = tmp_path / 'history.csv'
+    pd.concat([history, north]).sort_values('date', kind='stable').to_csv(data_path, index=False)
+    monkeypatch.setattr(config, 'DATA_PATH', str(data_path))
+
+    monkeypatch.setattr(config, 'MODEL_PATH', str(base))
+    model = AirQualityModel()
+    assert model.load_models()
+    monkeypatch.setattr(api.predictor, 'model', model)
+    return model
+
+
+def test_station_ids_and_assignment():
+    assert stations.station_id(-13.16314, -74.22356) == '-13.1631_-74.2236'
+
+    df = pd.DataFrame({'lat': [-13.1631, float('nan'), -12.6631], 'lon': [-74.2236, float('nan'), -74.2236]})
+    assigned = stations.assign_stations(df)['station'].tolist()
+    # Las filas sin coordenadas son de la estación de config
+    assert assigned[1] == PRIMARY
+    assert assigned[0] == '-13.1631_-74.2236' and assigned[2] == '-12.6631_-74.2236'
+
+
+def test_nearest_station_by_great_circle_distance():
+    index = StationIndex({
+        'a': {'lat': 0.0, 'lon': 0.0, 'path': ''},
+        'b': {'lat': 1.0, 'lon': 0.0, 'path': 'stations/b'},
+        'c': {'lat': 0.0, 'lon': 179.9, 'path': 'stations/c'},
+    }, 'a')
+    assert index.nearest(0.9, 0.0)[0] == 'b'
+    station, distance = index.nearest(0.0, -179.9)
+    # Cruza el antimeridiano: 0.2° de longitud en el ecuador
+    assert station == 'c' and distance == pytest.approx(22.2, abs=0.1)
+    assert stations.distance_km(0.0, 0.0, [1.0], [0.0])[0] == pytest.approx(111.19, abs=0.01)
+
+
+def test_single_station_version_routes_coordinates_to_config(api_client):
+    response = api_client.get('/predict/today', params={'lat': config.LATITUDE + 0.01, 'lon': config.LONGITUDE})
+    assert response.status_code == 200
+    assert response.headers['x-station'] == PRIMARY
+    assert float(response.headers['x-station-distance-km']) == pytest.approx(1.11, abs=0.01)
+
+    assert api_client.get('/predict/today', params={'station': NORTH}).status_code == 400
+
+
+def test_coordinates_route_to_the_nearest_station(api_client, two_stations):
+    response = api_client.get('/predict/today', params={'lat': config.LATITUDE + 0.45, 'lon': config.LONGITUDE})
+    assert response.status_code == 200
+    assert response.headers['x-station'] == NORTH
+    assert float(response.headers['x-station-distance-km']) == pytest.approx(5.56, abs=0.01)
+    # Los modelos de la otra estación se cargan al pedirlos y quedan en el LRU
+    assert two_stations.loaded_stations() == {PRIMARY, NORTH}
+
+    primary = api_client.get('/predict/today', params={'lat': config.LATITUDE + 0.1, 'lon': config.LONGITUDE})
+    assert primary.headers['x-station'] == PRIMARY
+
+    by_id = api_client.get('/predict/today', params={'station': NORTH})
+    assert by_id.headers['x-station'] == NORTH
+    assert 'x-station-distance-km' not in by_id.headers
+    # Misma instantánea y versión, distinta estación: distinto contenido y ETag
+    assert by_id.headers['etag'] != api_client.get('/predict/today').headers['etag']
+
+
+def test_routing_errors(api_client, two_stations, monkeypatch):
+    assert api_client.get('/predict/today', params={'lat': config.LATITUDE}).status_code == 400
+    assert api_client.get('/predict/today', params={'station': '0.0000_0.0000'}).status_code == 400
+
+    monkeypatch.setattr(config, 'STATION_MAX_DISTANCE_KM', 50.0)
+    far = api_client.get('/predict/today', params={'lat': config.LATITUDE + 5, 'lon': config.LONGITUDE})
+    assert far.status_code == 404
+    assert NORTH in far.json()['detail']
+
+
+def test_station_clients_share_breakers_not_cache(api_client):
+    import api
+
+    client = api.weather_api.at(config.LATITUDE + 0.5, config.LONGITUDE)
+    assert client is api.weather_api.at(config.LATITUDE + 0.5, config.LONGITUDE)
+    assert api.weather_api.at(config.LATITUDE, config.LONGITUDE) is api.weather_api
+    # Un solo circuito por endpoint para todas las estaciones (mismo servidor)
+    assert client.breakers is api.weather_api.breakers
+    assert client._cache is not api.weather_api._cache
+    assert (client.lat, client.lon) == (config.LATITUDE + 0.5, config.LONGITUDE)
@@ -9,47 +9,206 @@ from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import joblib
+import contextlib
+import copy
+import hashlib
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import config
+import metrics
+import model_registry
+from climatology import CLIMATOLOGY_FILENAME, Climatology, build_climatology
+from attribution import PathAttribution
+from historical_store import get_store
+from stations import StationIndex, assign_stations, primary_station
+
+
+def historical_moving_averages(path=None, station=None):
+    """
+    Promedios móviles de 7 y 30 días al final de los datos históricos
+    
+    Se calculan sobre la copia en memoria del histórico (historical_store),
+    que se carga una vez por proceso y se extiende cuando se agregan días,
+    en lugar de leer el CSV completo en cada predicción.
+    
+    Args:
+        path (str): CSV de datos históricos (default: config.DATA_PATH)
+        station (tuple): (lat, lon) de la estación (default: todas las filas)
+        
+    Returns:
+        dict: {'<feature>_ma7': valor, '<feature>_ma30': valor, ...}
+    """
+    return get_store(path).moving_averages(station=station)
+
+
+def float32_scaler(scaler):
+    """
+    Copia de un StandardScaler con sus parámetros en float32
+    
+    transform() conserva el tipo de la entrada, de modo que con
+    características en float32 el escalado no pasa por float64.
+    """
+    scaler = copy.copy(scaler)
+    for attribute in ('mean_', 'scale_', 'var_'):
+        value = getattr(scaler, attribute, None)
+        if value is not None:
+            setattr(scaler, attribute, value.astype(np.float32))
+    return scaler
+
+
+def add_time_features(df, features=None, rows_per_day=1, by=None):
+    """
+    Agrega las características temporales y los promedios móviles
+    
+    Es el mismo cálculo del entrenamiento: día del año, mes y promedios
+    de 7 y 30 días sobre las filas anteriores (min_periods=1).
+    
+    Args:
+        df (DataFrame): Datos ordenados por fecha, con columna 'date' (datetime)
+        features (list): Variables meteorológicas (default: WEATHER_FEATURES)
+        rows_per_day (int): Filas por día (24 para datos horarios); escala
+            las ventanas de los promedios móviles
+        by (str): Columna de grupo (p. ej. 'station'): los promedios se
+            calculan dentro de cada grupo, en el orden de sus filas
+        
+    Returns:
+        DataFrame: El mismo df con las columnas agregadas
+    """
+    df['day_of_year'] = df['date'].dt.dayofyear
+    df['month'] = df['date'].dt.month
+    
+    for feature in features or config.WEATHER_FEATURES:
+        if feature in df.columns:
+            for name, window in ((f'{feature}_ma7', 7), (f'{feature}_ma30', 30)):
+                if by is None:
+                    df[name] = df[feature].rolling(window=window * rows_per_day, min_periods=1).mean()
+                else:
+                    rolling = df.groupby(by, sort=False)[feature].rolling(window=window * rows_per_day, min_periods=1)
+                    df[name] = rolling.mean().droplevel(0)
+    return df
+
+
+def fit_pollutant(X, y, verbose=0):
+    """
+    Entrena y evalúa el modelo de un contaminante (una estación)
+    
+    Función de módulo para poder ejecutarse en un ProcessPoolExecutor.
+    
+    Args:
+        X (DataFrame): Características
+        y (Series): Valores observados
+        verbose (int): Progreso de GradientBoostingRegressor
+    
+    Returns:
+        tuple: (modelo, escalador, métricas con mae, rmse, r2, n_train y n_test)
+    """
+    # Dividir datos
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, 
+        test_size=config.TEST_SIZE, 
+        random_state=config.RANDOM_STATE,
+        shuffle=True
+    )
+    
+    # Escalar características
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    
+    # Entrenar Gradient Boosting (mejor para series temporales)
+    model = GradientBoostingRegressor(
+        n_estimators=100,
+        learning_rate=0.1,
+        max_depth=4,
+        min_samples_split=10,
+        min_samples_leaf=5,
+        random_state=config.RANDOM_STATE,
+        verbose=verbose
+    )
+    
+    model.fit(X_train_scaled, y_train)
+    
+    # Evaluar
+    y_pred = model.predict(X_test_scaled)
+    
+    return model, scaler, {
+        'mae': mean_absolute_error(y_test, y_pred),
+        'rmse': np.sqrt(mean_squared_error(y_test, y_pred)),
+        'r2': r2_score(y_test, y_pred),
+        'n_train': len(X_train),
+        'n_test': len(X_test)
+    }
 
 
 class AirQualityModel:
     """Clase para entrenar y usar modelos de predicción de calidad del aire"""
     
-    def __init__(self):
+    def __init__(self, shadow=False, float32=None):
         self.models = {}
         self.scalers = {}
         self.feature_columns = config.WEATHER_FEATURES
         self.target_pollutants = config.TARGET_POLLUTANTS
+        self.model_version = None
+        self.climatology = None
+        
+        # Tablas de atribución por contaminante (se calculan al explicar)
+        self._attributions = {}
+        
+        # Directorio de la versión cargada y su nombre en el registro (None = modelos planos)
+        self.model_dir = config.MODEL_PATH
+        self.registry_version = None
+        
+        # Estaciones de la versión (None = una sola estación), la de estos
+        # modelos y los modelos de otras estaciones ya cargados (LRU)
+        self.base_dir = config.MODEL_PATH
+        self.station_index = None
+        self.station = None
+        self._station_models = OrderedDict()
+        
+        # Los modelos en sombra no publican métricas de producción
+        self.shadow = shadow
+        
+        # Características, escaladores y tablas de atribución en float32 (default: FLOAT32_SERVING)
+        self.float32 = config.FLOAT32_SERVING if float32 is None else float32
+        self.feature_dtype = np.float32 if self.float32 else np.float64
+        
+        # Contaminantes con modelo en disco (cargados o no)
+        self.available_pollutants = []
+        self._load_lock = threading.Lock()
         
         # Crear directorio de modelos si no existe
         os.makedirs(config.MODEL_PATH, exist_ok=True)
         
-    def load_and_prepare_data(self):
+    def load_station_data(self):
         """
-        Carga y prepara los datos históricos
+        Carga y prepara los datos históricos de todas las estaciones
+        
+        Las estaciones se identifican por lat/lon (stations.py). Con varias,
+        las filas se ordenan por estación y fecha y los promedios móviles se
+        calculan dentro de cada estación; con una sola se conserva el orden
+        del archivo.
         
         Returns:
-            tuple: (X, y_dict) donde X son las características y y_dict son los targets
+            tuple: (feature_cols, datos) donde datos es {estación: {'lat', 'lon',
+                'rows' (DataFrame con todas sus filas), 'y_dict'}}
         """
         print("Cargando datos...")
         df = pd.read_csv(config.DATA_PATH)
         
         # Convertir fecha a datetime
         df['date'] = pd.to_datetime(df['date'])
+        df = assign_stations(df)
+        multi_station = df['station'].nunique() > 1
+        if multi_station:
+            df = df.sort_values(['station', 'date'], kind='stable')
         
-        # Agregar características temporales
-        df['day_of_year'] = df['date'].dt.dayofyear
-        df['month'] = df['date'].dt.month
+        # Agregar características temporales y promedios móviles (por estación)
+        df = add_time_features(df, self.feature_columns, by='station' if multi_station else None)
         df['year'] = df['date'].dt.year
         
-        # Calcular promedios móviles para características meteorológicas
-        for feature in self.feature_columns:
-            if feature in df.columns:
-                df[f'{feature}_ma7'] = df[feature].rolling(window=7, min_periods=1).mean()
-                df[f'{feature}_ma30'] = df[feature].rolling(window=30, min_periods=1).mean()
-        
         # Características finales
         feature_cols = self.feature_columns.copy()
         feature_cols.extend(['day_of_year', 'month'])
@@ -64,138 +223,368 @@ class AirQualityModel:
         # Eliminar filas con valores faltantes en características
         df_clean = df.dropna(subset=feature_cols)
         
-        X = df_clean[feature_cols]
-        
-        # Preparar targets (cada contaminante por separado)
-        y_dict = {}
-        for pollutant in self.target_pollutants:
-            if pollutant in df_clean.columns:
-                # Eliminar NaN en el target específico
-                mask = df_clean[pollutant].notna()
-                y_dict[pollutant] = {
-                    'X': X[mask],
-                    'y': df_clean.loc[mask, pollutant]
-                }
+        # Un solo recorrido de las filas limpias (no un filtro por estación)
+        clean_by_station = dict(tuple(df_clean.groupby('station', sort=False)))
+        data = {}
+        for station, rows in df.groupby('station', sort=False):
+            station_clean = clean_by_station.get(station, df_clean.iloc[:0])
+            X = station_clean[feature_cols]
+        
+            # Preparar targets (cada contaminante por separado)
+            y_dict = {}
+            for pollutant in self.target_pollutants:
+                if pollutant in station_clean.columns:
+                    # Eliminar NaN en el target específico
+                    mask = station_clean[pollutant].notna()
+                    if mask.any():
+                        y_dict[pollutant] = {
+                            'X': X[mask],
+                            'y': station_clean.loc[mask, pollutant]
+                        }
+            lat, lon = (float(v) for v in station.split('_'))
+            data[station] = {'lat': lat, 'lon': lon, 'rows': rows, 'y_dict': y_dict}
         
         print(f"Datos cargados: {len(df_clean)} muestras")
         print(f"Características: {len(feature_cols)}")
-        print(f"Contaminantes: {list(y_dict.keys())}")
+        print(f"Estaciones: {len(data)}")
+        print(f"Contaminantes: {sorted({p for d in data.values() for p in d['y_dict']}, key=self.target_pollutants.index)}")
         
-        return feature_cols, y_dict
+        return feature_cols, data
     
-    def train_models(self):
+    def load_and_prepare_data(self, station=None):
         """
-        Entrena modelos para cada contaminante
+        Carga y prepara los datos históricos de una estación
+        
+        Args:
+            station (str): Estación (default: la principal, la más cercana a
+                las coordenadas de config)
+        
+        Returns:
+            tuple: (X, y_dict) donde X son las características y y_dict son los targets
         """
-        print("\n=== ENTRENANDO MODELOS ===\n")
+        feature_cols, data = self.load_station_data()
+        station = station or primary_station({s: (d['lat'], d['lon']) for s, d in data.items()})
+        return feature_cols, data[station]['y_dict']
+    
+    def train_models(self, promote=True):
+        """
+        Entrena modelos para cada contaminante (y cada estación)
         
-        feature_cols, y_dict = self.load_and_prepare_data()
+        Los modelos se entrenan en paralelo (TRAIN_WORKERS procesos) y se
+        escriben en una versión nueva del registro (MODEL_PATH/versions/)
+        que se publica de forma atómica. Con varias estaciones, la
+        principal queda en la raíz de la versión y las demás en
+        stations/<estación>/ (ver stations.py).
         
-        results = {}
+        Args:
+            promote (bool): Poner la versión en producción al terminar
+        """
+        print("\n=== ENTRENANDO MODELOS ===\n")
         
-        for pollutant, data in y_dict.items():
-            print(f"\nEntrenando modelo para {pollutant}...")
-            
-            X = data['X']
-            y = data['y']
+        feature_cols, data = self.load_station_data()
+        primary = primary_station({s: (d['lat'], d['lon']) for s, d in data.items()})
+        staging = model_registry.staging_dir()
+        
+        # Un trabajo por estación y contaminante, repartidos entre los núcleos
+        jobs = [
+            (station, pollutant, y_data)
+            for station, station_data in data.items()
+            for pollutant, y_data in station_data['y_dict'].items()
+        ]
+        workers = max(1, min(len(jobs), config.TRAIN_WORKERS or os.cpu_count() or 1))
+        print(f"\nEntrenando {len(jobs)} modelos con {workers} proceso(s)...")
+        
+        results = {station: {} for station in data}
+        index = {}
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            if pool is None:
+                fitted = (fit_pollutant(y_data['X'], y_data['y'], verbose=1) for _, _, y_data in jobs)
+            else:
+                futures = [pool.submit(fit_pollutant, y_data['X'], y_data['y']) for _, _, y_data in jobs]
+                fitted = (future.result() for future in futures)
             
-            # Dividir datos
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, 
-                test_size=config.TEST_SIZE, 
-                random_state=config.RANDOM_STATE,
-                shuffle=True
-            )
+            for (station, pollutant, _), (model, scaler, result) in zip(jobs, fitted):
+                label = pollutant if len(data) == 1 else f"{pollutant} @ {station}"
+                print(f"\n{label}:")
+                print(f"  MAE: {result['mae']:.6f}")
+                print(f"  RMSE: {result['rmse']:.6f}")
+                print(f"  R²: {result['r2']:.4f}")
+                results[station][pollutant] = result
             
-            # Escalar características
-            scaler = StandardScaler()
-            X_train_scaled = scaler.fit_transform(X_train)
-            X_test_scaled = scaler.transform(X_test)
+                # Guardar en disco (la estación principal en la raíz de la versión)
+                directory = staging if station == primary else os.path.join(staging, model_registry.STATIONS_DIRNAME, station)
+                os.makedirs(directory, exist_ok=True)
+                joblib.dump(model, os.path.join(directory, f'model_{pollutant}.joblib'))
+                joblib.dump(scaler, os.path.join(directory, f'scaler_{pollutant}.joblib'))
             
-            # Entrenar Gradient Boosting (mejor para series temporales)
-            model = GradientBoostingRegressor(
-                n_estimators=100,
-                learning_rate=0.1,
-                max_depth=4,
-                min_samples_split=10,
-                min_samples_leaf=5,
-                random_state=config.RANDOM_STATE,
-                verbose=1
-            )
+                if station == primary:
+                    self.models[pollutant] = model
+                    self.scalers[pollutant] = scaler
+                    if pollutant not in self.available_pollutants:
+                        self.available_pollutants.append(pollutant)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
             
-            model.fit(X_train_scaled, y_train)
+        for station, station_data in data.items():
+            directory = staging if station == primary else os.path.join(staging, model_registry.STATIONS_DIRNAME, station)
+            os.makedirs(directory, exist_ok=True)
             
-            # Evaluar
-            y_pred = model.predict(X_test_scaled)
+            # Guardar columnas de características
+            joblib.dump(feature_cols, os.path.join(directory, 'feature_columns.joblib'))
             
-            mae = mean_absolute_error(y_test, y_pred)
-            rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-            r2 = r2_score(y_test, y_pred)
+            # Climatología por día del año (respaldo y control de predicciones)
+            climatology = build_climatology(station_data['rows'], list(station_data['y_dict']))
+            climatology.save(os.path.join(directory, CLIMATOLOGY_FILENAME))
+            if station == primary:
+                self.climatology = climatology
             
-            print(f"  MAE: {mae:.6f}")
-            print(f"  RMSE: {rmse:.6f}")
-            print(f"  R²: {r2:.4f}")
+            index[station] = {
+                'lat': station_data['lat'],
+                'lon': station_data['lon'],
+                'path': os.path.relpath(directory, staging) if station != primary else '',
+                'rows': len(station_data['rows']),
+                'pollutants': list(station_data['y_dict']),
+            }
             
-            # Guardar modelo y scaler
-            self.models[pollutant] = model
-            self.scalers[pollutant] = scaler
+        metadata = {
+            'source': 'train_models',
+            'data_path': config.DATA_PATH,
+            'feature_columns': feature_cols,
+            'results': results[primary],
+        }
+        if len(data) > 1:
+            # Índice de estaciones (una versión de una sola estación no lo tiene)
+            StationIndex(index, primary).save(staging)
+            metadata['primary_station'] = primary
+            metadata['station_results'] = {station: results[station] for station in data if station != primary}
+        
+        # Publicar la versión (rename atómico del directorio completo)
+        version = model_registry.publish(staging, metadata)
+        self.model_dir = self.base_dir = model_registry.version_path(version)
+        self.registry_version = version
+        self.model_version = version
+        self.station_index = StationIndex.load(self.base_dir)
+        self.station = primary if self.station_index is not None else None
+        print(f"\nModelos guardados en la versión: {version}")
+        if len(data) > 1:
+            print(f"Estaciones: {len(data)} (principal: {primary})")
+        
+        if promote:
+            exported = model_registry.promote(version)
+            print(f"Versión en producción: {version}")
+            print(f"Archivos planos actualizados ({len(exported)}) en {config.MODEL_PATH}: commitearlos para desplegar")
+        
+        print("\n=== ENTRENAMIENTO COMPLETADO ===")
+        return results[primary]
+    
+    def load_models(self, pollutants=None, lazy=None, version=None, station=None):
+        """
+        Carga modelos entrenados desde disco
+        
+        Args:
+            pollutants (list): Contaminantes a cargar (default: todos)
+            lazy (bool): Solo registrar qué modelos existen y cargarlos al
+                usarlos por primera vez (default: config.LAZY_MODEL_LOADING)
+            version (str): Versión del registro (default: la de producción;
+                sin registro se usan los archivos planos de MODEL_PATH)
+            station (str): Estación (default: la principal); solo en
+                versiones con varias estaciones
             
-            results[pollutant] = {
-                'mae': mae,
-                'rmse': rmse,
-                'r2': r2,
-                'n_train': len(X_train),
-                'n_test': len(X_test)
-            }
+        Returns:
+            bool: True si hay al menos un modelo disponible
+        
+        Raises:
+            ValueError: Si la estación no existe en la versión
+        """
+        base_dir, registry_version = model_registry.resolve(version)
+        return self._load_directory(base_dir, registry_version, StationIndex.load(base_dir), station, pollutants, lazy)
+    
+    def _load_directory(self, base_dir, registry_version, station_index, station, pollutants, lazy):
+        """Carga los modelos de una estación de una versión ya resuelta"""
+        if station is not None and (station_index is None or station not in station_index):
+            raise ValueError(f"Estación desconocida: {station}")
+        self.base_dir, self.registry_version = base_dir, registry_version
+        self.station_index = station_index
+        self.station = None if station_index is None else (station or station_index.primary)
+        self.model_dir = base_dir if station_index is None else station_index.directory(base_dir, self.station)
+        self._station_models = OrderedDict()
+        
+        label = self.registry_version or 'sin registro'
+        if self.station is not None and self.station != station_index.primary:
+            label = f"{label}, estación {self.station}"
+        print(f"Cargando modelos ({label})...")
+        lazy = config.LAZY_MODEL_LOADING if lazy is None else lazy
+        
+        with self._stage_timer('model_load'):
+            # Cargar columnas de características
+            features_filename = os.path.join(self.model_dir, 'feature_columns.joblib')
+            if os.path.exists(features_filename):
+                self.feature_columns = joblib.load(features_filename)
             
-            # Guardar en disco
-            model_filename = os.path.join(config.MODEL_PATH, f'model_{pollutant}.joblib')
-            scaler_filename = os.path.join(config.MODEL_PATH, f'scaler_{pollutant}.joblib')
+            self.models = {}
+            self.scalers = {}
+            self._attributions = {}
+            self.available_pollutants = []
+            for pollutant in self.target_pollutants:
+                if os.path.exists(self._model_filename(pollutant)) and os.path.exists(self._scaler_filename(pollutant)):
+                    self.available_pollutants.append(pollutant)
+                else:
+                    print(f"  Advertencia: Modelo {pollutant} no encontrado")
             
-            joblib.dump(model, model_filename)
-            joblib.dump(scaler, scaler_filename)
+            if not lazy:
+                for pollutant in pollutants or self.available_pollutants:
+                    if pollutant in self.available_pollutants:
+                        self._load_pollutant(pollutant)
             
-            print(f"  Modelo guardado en: {model_filename}")
+            self.climatology = Climatology.load(os.path.join(self.model_dir, CLIMATOLOGY_FILENAME))
+            if self.climatology is None:
+                print("  Advertencia: Climatología no encontrada (python climatology.py)")
         
-        # Guardar columnas de características
-        features_filename = os.path.join(config.MODEL_PATH, 'feature_columns.joblib')
-        joblib.dump(feature_cols, features_filename)
+        self.model_version = self.registry_version or self._compute_model_version()
         
-        print("\n=== ENTRENAMIENTO COMPLETADO ===")
-        return results
+        return len(self.available_pollutants) > 0
     
-    def load_models(self):
-        """
-        Carga modelos entrenados desde disco
+    @property
+    def station_coordinates(self):
+        """(lat, lon) de la estación de estos modelos (None con una sola estación)"""
+        if self.station_index is None:
+            return None
+        return self.station_index.coordinates(self.station)
+    
+    def loaded_stations(self):
+        """Estaciones con modelos en memoria (la propia y las del LRU)"""
+        with self._load_lock:
+            return {self.station, *self._station_models}
+    
+    def for_station(self, station):
         """
-        print("Cargando modelos...")
+        Modelos de otra estación de la misma versión
         
-        # Cargar columnas de características
-        features_filename = os.path.join(config.MODEL_PATH, 'feature_columns.joblib')
-        if os.path.exists(features_filename):
-            self.feature_columns = joblib.load(features_filename)
+        Se cargan la primera vez que se piden (y cada contaminante al
+        predecir); se conservan los STATION_MODEL_CACHE usados más
+        recientemente, de modo que ni el arranque ni la memoria crecen con
+        el número de estaciones.
         
-        # Cargar cada modelo
-        for pollutant in self.target_pollutants:
-            model_filename = os.path.join(config.MODEL_PATH, f'model_{pollutant}.joblib')
-            scaler_filename = os.path.join(config.MODEL_PATH, f'scaler_{pollutant}.joblib')
+        Args:
+            station (str): Estación del índice
+        
+        Returns:
+            AirQualityModel: Modelos de la estación (self para la propia)
+        
+        Raises:
+            ValueError: Si la estación no existe en la versión
+        """
+        if station == self.station or (self.station_index is None and station is None):
+            return self
+        with self._load_lock:
+            model = self._station_models.get(station)
+            if model is not None:
+                self._station_models.move_to_end(station)
+                return model
+        
+        model = AirQualityModel(shadow=self.shadow, float32=self.float32)
+        model._load_directory(self.base_dir, self.registry_version, self.station_index, station, None, lazy=True)
+        with self._load_lock:
+            model = self._station_models.setdefault(station, model)
+            self._station_models.move_to_end(station)
+            while len(self._station_models) > config.STATION_MODEL_CACHE:
+                self._station_models.popitem(last=False)
+            if not self.shadow:
+                metrics.set_gauge('station_models_cached', len(self._station_models))
+        return model
+    
+    def publish_metrics(self):
+        """Publica la versión y el número de modelos del worker"""
+        metrics.clear_gauge('model_info')
+        metrics.set_gauge('model_info', 1, version=self.model_version or 'none')
+        metrics.set_gauge('models_loaded', len(self.models))
+    
+    def _stage_timer(self, stage):
+        return contextlib.nullcontext() if self.shadow else metrics.stage_timer(stage)
+    
+    def _model_filename(self, pollutant):
+        return os.path.join(self.model_dir, f'model_{pollutant}.joblib')
+    
+    def _scaler_filename(self, pollutant):
+        return os.path.join(self.model_dir, f'scaler_{pollutant}.joblib')
+    
+    def _load_pollutant(self, pollutant):
+        """Carga el modelo y el escalador de un contaminante"""
+        model = joblib.load(self._model_filename(pollutant))
+        scaler = joblib.load(self._scaler_filename(pollutant))
+        if self.float32:
+            scaler = float32_scaler(scaler)
+        self.scalers[pollutant] = scaler
+        self.models[pollutant] = model
+        self._attributions.pop(pollutant, None)
+        print(f"  Modelo {pollutant} cargado")
+    
+    def ensure_loaded(self, pollutants=None):
+        """
+        Carga bajo demanda los modelos que aún no están en memoria
+        
+        Args:
+            pollutants (list): Contaminantes requeridos (default: todos los disponibles)
             
-            if os.path.exists(model_filename) and os.path.exists(scaler_filename):
-                self.models[pollutant] = joblib.load(model_filename)
-                self.scalers[pollutant] = joblib.load(scaler_filename)
-                print(f"  Modelo {pollutant} cargado")
-            else:
-                print(f"  Advertencia: Modelo {pollutant} no encontrado")
+        Returns:
+            list: Contaminantes listos para predecir, en el orden de TARGET_POLLUTANTS
+            
+        Raises:
+            ValueError: Si se pide un contaminante sin modelo
+        """
+        available = self.available_pollutants or list(self.models)
+        if pollutants is None:
+            pollutants = available
+        
+        missing = [p for p in pollutants if p not in available]
+        if missing:
+            raise ValueError(f"No hay modelo para: {', '.join(missing)}. Disponibles: {', '.join(available)}")
+        
+        pending = [p for p in pollutants if p not in self.models]
+        if pending:
+            with self._load_lock:
+                with self._stage_timer('model_load'):
+                    for pollutant in pending:
+                        if pollutant not in self.models:
+                            self._load_pollutant(pollutant)
+            if not self.shadow:
+                metrics.set_gauge('models_loaded', len(self.models))
+        
+        return [p for p in self.target_pollutants if p in pollutants]
+    
+    def _compute_model_version(self):
+        """
+        Calcula un identificador de versión a partir de los archivos de modelos
         
-        return len(self.models) > 0
+        Returns:
+            str: Hash corto del nombre, tamaño y fecha de cada archivo, o None
+        """
+        files = ['feature_columns.joblib', CLIMATOLOGY_FILENAME]
+        for pollutant in self.available_pollutants:
+            files.extend([f'model_{pollutant}.joblib', f'scaler_{pollutant}.joblib'])
+        
+        digest = hashlib.sha1()
+        found = False
+        for filename in files:
+            path = os.path.join(self.model_dir, filename)
+            if os.path.exists(path):
+                stat = os.stat(path)
+                digest.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+                found = True
+        
+        return digest.hexdigest()[:12] if found else None
     
-    def prepare_weather_features(self, weather_data, historical_df=None):
+    def prepare_weather_features(self, weather_data, historical_df=None, moving_averages=None):
         """
         Prepara características a partir de datos meteorológicos
         
         Args:
             weather_data (dict): Datos meteorológicos de la API
             historical_df (DataFrame): Datos históricos para calcular promedios móviles
+            moving_averages (dict): Promedios móviles ya calculados
+                (historical_moving_averages); tiene prioridad sobre historical_df
             
         Returns:
             DataFrame: Características preparadas
@@ -219,7 +608,9 @@ class AirQualityModel:
         features['month'] = date.month
         
         # Calcular promedios móviles si hay datos históricos
-        if historical_df is not None:
+        if moving_averages is not None:
+            features.update(moving_averages)
+        elif historical_df is not None:
             for feature in config.WEATHER_FEATURES:
                 if feature in historical_df.columns:
                     ma7 = historical_df[feature].tail(7).mean()
@@ -235,53 +626,164 @@ class AirQualityModel:
         
         return pd.DataFrame([features])
     
-    def predict(self, weather_data_list):
+    def prepare_feature_matrix(self, weather, dates, moving_averages=None):
         """
-        Predice la calidad del aire para datos meteorológicos dados
+        Versión columnar de prepare_weather_features para muchas filas
         
         Args:
-            weather_data_list (list): Lista de diccionarios con datos meteorológicos
+            weather (dict): Variable meteorológica -> arreglo (una posición por fila)
+            dates (array): Fecha de cada fila
+            moving_averages (dict): Promedios móviles (default: los del histórico)
             
         Returns:
-            DataFrame: Predicciones para cada contaminante
+            DataFrame: Características en el orden de feature_columns
         """
-        if not self.models:
-            raise ValueError("No hay modelos cargados. Ejecuta load_models() primero.")
-        
-        # Cargar datos históricos para promedios móviles
-        df_historical = pd.read_csv(config.DATA_PATH)
-        df_historical['date'] = pd.to_datetime(df_historical['date'])
-        
-        predictions = []
+        dates = pd.DatetimeIndex(dates)
+        if moving_averages is None:
+            moving_averages = historical_moving_averages(station=self.station_coordinates)
+        
+        dtype = self.feature_dtype
+        columns = {feature: np.asarray(weather[feature], dtype=dtype) for feature in config.WEATHER_FEATURES if feature in weather}
+        columns['day_of_year'] = dates.dayofyear.to_numpy()
+        columns['month'] = dates.month.to_numpy()
+        for name, value in moving_averages.items():
+            columns[name] = np.full(len(dates), value, dtype=dtype)
+        
+        # Igual que predict: las columnas que falten se completan con 0
+        return pd.DataFrame({
+            col: columns[col] if col in columns else np.zeros(len(dates), dtype=dtype)
+            for col in self.feature_columns
+        })
+    
+    def feature_frame(self, weather_data_list):
+        """
+        Matriz de características de varias filas meteorológicas
         
-        for weather_data in weather_data_list:
-            # Preparar características
-            X = self.prepare_weather_features(weather_data, df_historical)
+        Args:
+            weather_data_list (list): Lista de diccionarios con datos meteorológicos
+            
+        Returns:
+            DataFrame: Características en el orden de feature_columns
+        """
+        # Promedios móviles de los datos históricos (en caché tras la primera llamada)
+        with self._stage_timer('historical_load'):
+            moving_averages = historical_moving_averages(station=self.station_coordinates)
+        
+        with self._stage_timer('feature_build'):
+            # Preparar características de todas las filas en una sola matriz
+            X = pd.concat(
+                [self.prepare_weather_features(weather_data, moving_averages=moving_averages)
+                 for weather_data in weather_data_list],
+                ignore_index=True
+            )
             
             # Asegurar que las columnas coincidan con las del entrenamiento
             for col in self.feature_columns:
                 if col not in X.columns:
                     X[col] = 0
             
-            X = X[self.feature_columns]
-            
-            # Predecir cada contaminante
-            pred_row = {}
+            return X[self.feature_columns]
+    
+    def predict(self, weather_data_list, pollutants=None):
+        """
+        Predice la calidad del aire para datos meteorológicos dados
+        
+        Args:
+            weather_data_list (list): Lista de diccionarios con datos meteorológicos
+            pollutants (list): Contaminantes a predecir (default: todos los disponibles);
+                los modelos que falten se cargan en la primera llamada
             
-            if 'date' in weather_data:
-                pred_row['date'] = weather_data['date']
-            elif 'timestamp' in weather_data:
-                pred_row['date'] = weather_data['timestamp']
+        Returns:
+            DataFrame: Predicciones para cada contaminante
+        """
+        if not self.models and not self.available_pollutants:
+            raise ValueError("No hay modelos cargados. Ejecuta load_models() primero.")
+        
+        pollutants = self.ensure_loaded(pollutants)
+        X = self.feature_frame(weather_data_list)
+        
+        predictions = pd.DataFrame(index=X.index)
+        dates = [weather_data.get('date', weather_data.get('timestamp')) for weather_data in weather_data_list]
+        if any(d is not None for d in dates):
+            predictions['date'] = dates
+        
+        for pollutant, values in self.predict_matrix(X, pollutants).items():
+            predictions[pollutant] = values
+        
+        if self.climatology is not None:
+            # Marcar valores fuera del rango histórico para ese día del año
+            flags = self.climatology.sanity_flags(predictions)
+            if not self.shadow:
+                for row_flags in flags:
+                    for pollutant, direction in row_flags:
+                        metrics.inc('prediction_sanity_flags_total', pollutant=pollutant, direction=direction)
+            if any(flags) and not self.shadow:
+                print(f"Advertencia: predicciones fuera del rango climatológico: {[f for f in flags if f]}")
+            predictions['climatology_flags'] = [
+                [f"{pollutant}:{direction}" for pollutant, direction in row_flags] for row_flags in flags
+            ]
+        
+        return predictions
+    
+    def predict_matrix(self, X, pollutants):
+        """
+        Predice sobre una matriz de características ya preparada
+        
+        Args:
+            X (DataFrame): Características con las columnas de feature_columns
+            pollutants (list): Contaminantes (ya cargados con ensure_loaded)
             
-            for pollutant, model in self.models.items():
-                scaler = self.scalers[pollutant]
+        Returns:
+            dict: {contaminante: arreglo de predicciones no negativas}
+        """
+        X = X[self.feature_columns]
+        if self.float32:
+            # Los árboles de sklearn ya comparan en float32: se evita la copia en float64 del escalado
+            X = X.astype(np.float32, copy=False)
+        values = {}
+        # Una llamada por modelo para todas las filas
+        for pollutant in pollutants:
+            scaler = self.scalers[pollutant]
+            with self._stage_timer('scaler_transform'):
                 X_scaled = scaler.transform(X)
-                prediction = model.predict(X_scaled)[0]
-                pred_row[pollutant] = max(0, prediction)  # No permitir valores negativos
-            
-            predictions.append(pred_row)
+            with self._stage_timer('model_predict'):
+                predicted = self.models[pollutant].predict(X_scaled)
+            values[pollutant] = np.maximum(0, predicted)  # No permitir valores negativos
+        return values
+    
+    def explain(self, weather_data_list, pollutants=None):
+        """
+        Contribución de cada característica a las predicciones
         
-        return pd.DataFrame(predictions)
+        Atribución por caminos sobre los árboles del ensamble (ver
+        attribution.py); la tabla por hoja se calcula la primera vez que se
+        explica cada contaminante.
+        
+        Args:
+            weather_data_list (list): Lista de diccionarios con datos meteorológicos
+            pollutants (list): Contaminantes (default: todos los disponibles)
+            
+        Returns:
+            dict: {contaminante: (sesgo, DataFrame de contribuciones por fila
+                con una columna por característica)}; sesgo más la suma de
+                una fila es la predicción antes de recortar en 0
+        """
+        pollutants = self.ensure_loaded(pollutants)
+        X = self.feature_frame(weather_data_list)
+        if self.float32:
+            X = X.astype(np.float32, copy=False)
+        
+        result = {}
+        for pollutant in pollutants:
+            model = self.models[pollutant]
+            attribution = self._attributions.get(pollutant)
+            if attribution is None:
+                attribution = PathAttribution(model, len(self.feature_columns), self.feature_dtype)
+                self._attributions[pollutant] = attribution
+            with self._stage_timer('explain'):
+                contributions = attribution.explain(model, self.scalers[pollutant].transform(X))
+            result[pollutant] = (attribution.bias, pd.DataFrame(contributions, columns=self.feature_columns))
+        return result
 
 
 if __name__ == "__main__":
@@ -290,9 +792,9 @@ if __name__ == "__main__":
     results = model.train_models()
     
     print("\n=== RESUMEN DE RESULTADOS ===")
-    for pollutant, metrics in results.items():
+    for pollutant, scores in results.items():
         print(f"\n{pollutant}:")
-        print(f"  R² Score: {metrics['r2']:.4f}")
-        print(f"  MAE: {metrics['mae']:.6f}")
-        print(f"  Muestras entrenamiento: {metrics['n_train']}")
-        print(f"  Muestras prueba: {metrics['n_test']}")
+        print(f"  R² Score: {scores['r2']:.4f}")
+        print(f"  MAE: {scores['mae']:.6f}")
+        print(f"  Muestras entrenamiento: {scores['n_train']}")
+        print(f"  Muestras prueba: {scores['n_test']}")
@@ -2,9 +2,14 @@
 Módulo para obtener datos meteorológicos de OpenWeatherMap API
 """
 
+import copy
 import requests
+import threading
+import time
 from datetime import datetime, timedelta
 import config
+import metrics
+from resilience import CircuitBreaker, CircuitOpenError, UpstreamUnavailable, backoff_delay
 
 
 class WeatherAPI:
@@ -14,15 +19,270 @@ class WeatherAPI:
         self.api_key = config.OPENWEATHER_API_KEY
         self.lat = config.LATITUDE
         self.lon = config.LONGITUDE
+        self.base_url = config.OPENWEATHER_BASE_URL.rstrip('/')
         
-    def get_current_weather(self):
+        # Sesión con pool de conexiones (evita un handshake TCP/TLS por petición)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=config.UPSTREAM_POOL_SIZE,
+            pool_maxsize=config.UPSTREAM_POOL_SIZE
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
+        # Caché de respuestas: clave -> {'data': ..., 'fetched_at': ...}
+        self.cache_ttl = config.WEATHER_CACHE_TTL
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        
+        # Un circuito por endpoint: un fallo de /air_pollution no bloquea /weather
+        self.breakers = {key: CircuitBreaker(key) for key in ('current', 'forecast', 'pollution')}
+        
+        # Clientes de otras coordenadas (estaciones), compartidos por todos los clones
+        self._locations = {}
+    
+    def at(self, lat, lon):
+        """
+        Cliente para otras coordenadas (una estación)
+        
+        Comparte la sesión, los circuitos y el lock con este cliente, pero
+        tiene su propia caché. Se crea una vez por par de coordenadas.
+        
+        Los circuitos son por endpoint de OpenWeatherMap, no por estación:
+        todas las estaciones consultan el mismo servidor, así que una caída
+        abre el circuito una sola vez en lugar de repetir los fallos (y los
+        reintentos) en cada estación antes de dejar de llamar.
+        
+        Args:
+            lat (float): Latitud
+            lon (float): Longitud
+        
+        Returns:
+            WeatherAPI: Cliente de esas coordenadas (self para las de config)
+        """
+        key = (round(lat, 4), round(lon, 4))
+        if key == (round(config.LATITUDE, 4), round(config.LONGITUDE, 4)):
+            return self
+        with self._cache_lock:
+            client = self._locations.get(key)
+            if client is None:
+                client = copy.copy(self)
+                client.lat, client.lon = lat, lon
+                client._cache = {}
+                # Mismo diccionario de circuitos (por endpoint, ver arriba)
+                client.breakers = self.breakers
+                self._locations[key] = client
+        return client
+    
+    def _get_cached(self, key):
+        """
+        Devuelve los datos en caché si siguen vigentes
+        
+        Args:
+            key (str): Clave de la consulta ('current', 'forecast', 'pollution')
+            
+        Returns:
+            Datos en caché o None si no hay o expiraron
+        """
+        with self._cache_lock:
+            entry = self._cache.get(key)
+        if entry is not None and time.time() - entry['fetched_at'] < self.cache_ttl:
+            metrics.inc('weather_cache_requests_total', endpoint=key, result='hit')
+            return entry['data']
+        metrics.inc('weather_cache_requests_total', endpoint=key, result='miss')
+        return None
+    
+    def _store_cached(self, key, data):
+        """Guarda una respuesta procesada en la caché"""
+        with self._cache_lock:
+            self._cache[key] = {'data': data, 'fetched_at': time.time()}
+    
+    def _get_stale(self, key, error):
+        """
+        Último dato válido de una consulta cuando OpenWeatherMap no responde
+        
+        Args:
+            key (str): Clave de la consulta
+            error (Exception): Motivo del fallo (para el log)
+            
+        Returns:
+            Datos expirados de la caché o None si no hay o son demasiado antiguos
+        """
+        with self._cache_lock:
+            entry = self._cache.get(key)
+        if entry is None or time.time() - entry['fetched_at'] >= config.UPSTREAM_STALE_MAX_AGE:
+            return None
+        
+        age = time.time() - entry['fetched_at']
+        print(f"Advertencia: usando datos de '{key}' de hace {age:.0f} s ({error})")
+        metrics.inc('upstream_fallbacks_total', endpoint=key)
+        return entry['data']
+    
+    @staticmethod
+    def _is_retryable(error):
+        """Timeouts, errores de conexión, 429 y 5xx se reintentan; el resto no"""
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            status = error.response.status_code
+            return status == 429 or status >= 500
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+    
+    def _fetch_json(self, key, url, params, deadline=None):
+        """
+        Realiza la petición a OpenWeatherMap con reintentos y circuito
+        
+        Cada intento usa como timeout el menor entre UPSTREAM_TIMEOUT y el
+        tiempo que le queda a la petición; solo se reintenta si el fallo es
+        transitorio, el circuito sigue cerrado y la espera cabe en el plazo.
+        
+        Args:
+            key (str): Clave de la consulta (circuito y métricas)
+            url (str): URL del endpoint
+            params (dict): Parámetros de la consulta
+            deadline (Deadline): Plazo de la petición entrante (None = sin plazo)
+            
+        Returns:
+            dict: Respuesta JSON
+            
+        Raises:
+            requests.exceptions.RequestException: Si fallan todos los intentos
+            UpstreamUnavailable: Si el circuito está abierto o se agotó el plazo
+        """
+        breaker = self.breakers[key]
+        if not breaker.allow():
+            metrics.inc('upstream_short_circuits_total', endpoint=key)
+            raise CircuitOpenError(f"Circuito abierto para '{key}'")
+        
+        attempt = 0
+        while True:
+            try:
+                timeout = deadline.timeout(config.UPSTREAM_TIMEOUT) if deadline else config.UPSTREAM_TIMEOUT
+            except UpstreamUnavailable:
+                metrics.inc('upstream_deadline_exceeded_total', endpoint=key)
+                # La llamada no llegó a hacerse: no cuenta para el circuito
+                breaker.release()
+                raise
+            
+            metrics.inc('upstream_requests_total', endpoint=key)
+            try:
+                with metrics.stage_timer('upstream_fetch'):
+                    response = self.session.get(url, params=params, timeout=timeout)
+                    response.raise_for_status()
+                    data = response.json()
+                breaker.record_success()
+                return data
+            except requests.exceptions.RequestException as e:
+                metrics.inc('upstream_errors_total', endpoint=key)
+                breaker.record_failure()
+                
+                attempt += 1
+                if attempt > config.UPSTREAM_RETRIES or not self._is_retryable(e) or not breaker.allow():
+                    raise
+                
+                delay = backoff_delay(attempt)
+                if deadline is not None and deadline.remaining() <= delay:
+                    # No queda presupuesto para esperar y volver a intentar
+                    raise
+                metrics.inc('upstream_retries_total', endpoint=key)
+                time.sleep(delay)
+    
+    def snapshot_id(self, *keys):
+        """
+        Identificador de la instantánea de datos en caché
+        
+        Cambia cada vez que alguna de las consultas indicadas se descarga
+        de nuevo, por lo que sirve para derivar ETags. Las entradas expiradas
+        que se sirven como respaldo conservan su identificador.
+        
+        Args:
+            *keys: Claves de caché que forman la instantánea
+            
+        Returns:
+            str: Identificador o None si alguna clave no está en caché
+        """
+        return self.snapshot(*keys)[0]
+    
+    def snapshot(self, *keys):
+        """
+        Identificador y datos de la instantánea, leídos a la vez
+        
+        Una respuesta construida con estos datos corresponde siempre a su
+        ETag aunque otra petición descargue datos nuevos entre medias.
+        
+        Args:
+            *keys: Claves de caché que forman la instantánea
+            
+        Returns:
+            tuple: (identificador, [datos por clave]) o (None, None) si alguna
+                clave no está en caché
+        """
+        parts = []
+        data = []
+        with self._cache_lock:
+            for key in keys:
+                entry = self._cache.get(key)
+                if entry is None:
+                    return None, None
+                parts.append(f"{key}@{entry['fetched_at']:.6f}")
+                data.append(entry['data'])
+        return ';'.join(parts), data
+    
+    def stale_age(self, *keys):
+        """
+        Antigüedad de los datos servidos como respaldo
+        
+        Args:
+            *keys: Claves de caché consideradas
+            
+        Returns:
+            int: Segundos desde la descarga de la entrada más antigua si alguna
+                está expirada, o None si todas están vigentes
+        """
+        now = time.time()
+        oldest = None
+        with self._cache_lock:
+            for key in keys:
+                entry = self._cache.get(key)
+                if entry is not None and now - entry['fetched_at'] >= self.cache_ttl:
+                    age = now - entry['fetched_at']
+                    oldest = age if oldest is None else max(oldest, age)
+        return None if oldest is None else int(oldest)
+    
+    def cache_max_age(self, *keys):
+        """
+        Segundos que faltan para que expire la entrada más antigua
+        
+        Args:
+            *keys: Claves de caché consideradas
+            
+        Returns:
+            int: Segundos restantes (0 si alguna clave no está vigente)
+        """
+        now = time.time()
+        remaining = self.cache_ttl
+        with self._cache_lock:
+            for key in keys:
+                entry = self._cache.get(key)
+                if entry is None:
+                    return 0
+                remaining = min(remaining, self.cache_ttl - (now - entry['fetched_at']))
+        return max(0, int(remaining))
+        
+    def get_current_weather(self, deadline=None):
         """
         Obtiene los datos meteorológicos actuales
         
+        Args:
+            deadline (Deadline): Plazo de la petición entrante
+            
         Returns:
-            dict: Datos meteorológicos actuales
+            dict: Datos meteorológicos actuales (los últimos válidos si
+                OpenWeatherMap no responde)
         """
-        url = "https://api.openweathermap.org/data/2.5/weather"
+        cached = self._get_cached('current')
+        if cached is not None:
+            return cached
+        
+        url = f"{self.base_url}/weather"
         params = {
             'lat': self.lat,
             'lon': self.lon,
@@ -31,106 +291,143 @@ class WeatherAPI:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Extraer características relevantes
-            weather_data = {
-                'temperature': data['main']['temp'] + 273.15,  # Convertir a Kelvin
-                'dewpoint': self._calculate_dewpoint(
-                    data['main']['temp'], 
-                    data['main']['humidity']
-                ),
-                'pressure': data['main']['pressure'] * 100,  # Convertir a Pa
-                'wind_u': data['wind']['speed'] * (-1 if data['wind'].get('deg', 0) > 180 else 1),
-                'wind_v': data['wind']['speed'] * (-1 if 90 < data['wind'].get('deg', 0) < 270 else 1),
-                'precipitation': data.get('rain', {}).get('1h', 0) / 1000,  # Convertir a m
-                'timestamp': datetime.now()
-            }
+            data = self._fetch_json('current', url, params, deadline)
+            weather_data = self.parse_current_weather(data)
             
+            self._store_cached('current', weather_data)
             return weather_data
             
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, UpstreamUnavailable) as e:
             print(f"Error al obtener datos del clima: {e}")
-            return None
+            return self._get_stale('current', e)
+    
+    def parse_current_weather(self, data):
+        """
+        Convierte la respuesta de /weather a las unidades del dataset
+        
+        Args:
+            data (dict): Respuesta JSON de OpenWeatherMap
+            
+        Returns:
+            dict: Datos meteorológicos actuales
+        """
+        # Extraer características relevantes
+        return {
+            'temperature': data['main']['temp'] + 273.15,  # Convertir a Kelvin
+            'dewpoint': self._calculate_dewpoint(
+                data['main']['temp'], 
+                data['main']['humidity']
+            ),
+            'pressure': data['main']['pressure'] * 100,  # Convertir a Pa
+            'wind_u': data['wind']['speed'] * (-1 if data['wind'].get('deg', 0) > 180 else 1),
+            'wind_v': data['wind']['speed'] * (-1 if 90 < data['wind'].get('deg', 0) < 270 else 1),
+            'precipitation': data.get('rain', {}).get('1h', 0) / 1000,  # Convertir a m
+            'timestamp': datetime.now()
+        }
     
-    def get_forecast(self, days=7):
+    def get_forecast(self, days=7, deadline=None):
         """
         Obtiene el pronóstico meteorológico para los próximos días
         
         Args:
             days (int): Número de días de pronóstico (máximo 7)
+            deadline (Deadline): Plazo de la petición entrante
             
         Returns:
             list: Lista de diccionarios con datos meteorológicos por día
         """
-        url = "https://api.openweathermap.org/data/2.5/forecast"
+        # Se descarga siempre el pronóstico completo para que una sola
+        # entrada de caché sirva a cualquier número de días
+        cached = self._get_cached('forecast')
+        if cached is not None:
+            return cached[:days]
+        
+        url = f"{self.base_url}/forecast"
         params = {
             'lat': self.lat,
             'lon': self.lon,
             'appid': self.api_key,
             'units': 'metric',
-            'cnt': min(days * 8, 40)  # API devuelve datos cada 3 horas
+            'cnt': 40  # API devuelve datos cada 3 horas (máximo 5 días)
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._fetch_json('forecast', url, params, deadline)
+            averaged_forecasts = self.parse_forecast(data)
             
-            # Agrupar por día y promediar
-            daily_forecasts = {}
+            self._store_cached('forecast', averaged_forecasts)
+            return averaged_forecasts[:days]
             
-            for item in data['list']:
-                date = datetime.fromtimestamp(item['dt']).date()
-                
-                if date not in daily_forecasts:
-                    daily_forecasts[date] = []
-                
-                weather_point = {
-                    'temperature': item['main']['temp'] + 273.15,
-                    'dewpoint': self._calculate_dewpoint(
-                        item['main']['temp'],
-                        item['main']['humidity']
-                    ),
-                    'pressure': item['main']['pressure'] * 100,
-                    'wind_u': item['wind']['speed'] * (-1 if item['wind'].get('deg', 0) > 180 else 1),
-                    'wind_v': item['wind']['speed'] * (-1 if 90 < item['wind'].get('deg', 0) < 270 else 1),
-                    'precipitation': item.get('rain', {}).get('3h', 0) / 1000 / 3,  # Por hora
-                }
-                
-                daily_forecasts[date].append(weather_point)
-            
-            # Promediar los datos por día
-            averaged_forecasts = []
-            for date in sorted(daily_forecasts.keys())[:days]:
-                day_data = daily_forecasts[date]
-                averaged = {
-                    'date': date,
-                    'temperature': sum(d['temperature'] for d in day_data) / len(day_data),
-                    'dewpoint': sum(d['dewpoint'] for d in day_data) / len(day_data),
-                    'pressure': sum(d['pressure'] for d in day_data) / len(day_data),
-                    'wind_u': sum(d['wind_u'] for d in day_data) / len(day_data),
-                    'wind_v': sum(d['wind_v'] for d in day_data) / len(day_data),
-                    'precipitation': sum(d['precipitation'] for d in day_data) / len(day_data),
-                }
-                averaged_forecasts.append(averaged)
-            
-            return averaged_forecasts
-            
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, UpstreamUnavailable) as e:
             print(f"Error al obtener pronóstico del clima: {e}")
-            return None
+            stale = self._get_stale('forecast', e)
+            return stale[:days] if stale is not None else None
     
-    def get_air_pollution(self):
+    def parse_forecast(self, data):
+        """
+        Convierte la respuesta de /forecast en promedios diarios
+        
+        Args:
+            data (dict): Respuesta JSON de OpenWeatherMap (puntos cada 3 horas)
+            
+        Returns:
+            list: Lista de diccionarios con datos meteorológicos por día
+        """
+        # Agrupar por día y promediar
+        daily_forecasts = {}
+        
+        for item in data['list']:
+            date = datetime.fromtimestamp(item['dt']).date()
+            
+            if date not in daily_forecasts:
+                daily_forecasts[date] = []
+            
+            weather_point = {
+                'temperature': item['main']['temp'] + 273.15,
+                'dewpoint': self._calculate_dewpoint(
+                    item['main']['temp'],
+                    item['main']['humidity']
+                ),
+                'pressure': item['main']['pressure'] * 100,
+                'wind_u': item['wind']['speed'] * (-1 if item['wind'].get('deg', 0) > 180 else 1),
+                'wind_v': item['wind']['speed'] * (-1 if 90 < item['wind'].get('deg', 0) < 270 else 1),
+                'precipitation': item.get('rain', {}).get('3h', 0) / 1000 / 3,  # Por hora
+            }
+            
+            daily_forecasts[date].append(weather_point)
+        
+        # Promediar los datos por día
+        averaged_forecasts = []
+        for date in sorted(daily_forecasts.keys()):
+            day_data = daily_forecasts[date]
+            averaged = {
+                'date': date,
+                'temperature': sum(d['temperature'] for d in day_data) / len(day_data),
+                'dewpoint': sum(d['dewpoint'] for d in day_data) / len(day_data),
+                'pressure': sum(d['pressure'] for d in day_data) / len(day_data),
+                'wind_u': sum(d['wind_u'] for d in day_data) / len(day_data),
+                'wind_v': sum(d['wind_v'] for d in day_data) / len(day_data),
+                'precipitation': sum(d['precipitation'] for d in day_data) / len(day_data),
+            }
+            averaged_forecasts.append(averaged)
+        
+        return averaged_forecasts
+    
+    def get_air_pollution(self, deadline=None):
         """
         Obtiene datos de contaminación del aire actuales
         
+        Args:
+            deadline (Deadline): Plazo de la petición entrante
+            
         Returns:
             dict: Datos de contaminación del aire
         """
-        url = "http://api.openweathermap.org/data/2.5/air_pollution"
+        cached = self._get_cached('pollution')
+        if cached is not None:
+            return cached
+        
+        url = f"{self.base_url}/air_pollution"
         params = {
             'lat': self.lat,
             'lon': self.lon,
@@ -138,25 +435,39 @@ class WeatherAPI:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data['list']:
-                components = data['list'][0]['components']
-                return {
-                    'NO2': components.get('no2', 0) / 1e6,  # Convertir a las unidades del dataset
-                    'CO': components.get('co', 0) / 1e3,
-                    'O3': components.get('o3', 0) / 1e6,
-                    'SO2': components.get('so2', 0) / 1e6,
-                    'pm2_5': components.get('pm2_5', 0),
-                    'pm10': components.get('pm10', 0),
-                }
-            return None
+            data = self._fetch_json('pollution', url, params, deadline)
+            pollution = self.parse_air_pollution(data)
             
-        except requests.exceptions.RequestException as e:
+            if pollution is not None:
+                self._store_cached('pollution', pollution)
+            return pollution
+            
+        except (requests.exceptions.RequestException, UpstreamUnavailable) as e:
             print(f"Error al obtener datos de contaminación: {e}")
+            return self._get_stale('pollution', e)
+    
+    def parse_air_pollution(self, data):
+        """
+        Convierte la respuesta de /air_pollution a las unidades del dataset
+        
+        Args:
+            data (dict): Respuesta JSON de OpenWeatherMap
+            
+        Returns:
+            dict: Datos de contaminación del aire o None si la respuesta está vacía
+        """
+        if not data['list']:
             return None
+        
+        components = data['list'][0]['components']
+        return {
+            'NO2': components.get('no2', 0) / 1e6,  # Convertir a las unidades del dataset
+            'CO': components.get('co', 0) / 1e3,
+            'O3': components.get('o3', 0) / 1e6,
+            'SO2': components.get('so2', 0) / 1e6,
+            'pm2_5': components.get('pm2_5', 0),
+            'pm10': components.get('pm10', 0),
+        }
     
     def _calculate_dewpoint(self, temp_celsius, humidity):
         """